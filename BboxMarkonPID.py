@@ -1,4 +1,5 @@
 import importlib.util
+import subprocess
 import sys
 
 # For illustrative purposes.
@@ -14,94 +15,105 @@ elif (spec := importlib.util.find_spec(name)) is not None:
 else:
     print(f"can't find the {name!r} module")
     print(f"installation {name!r} is proceeding...")
-    !pip3 install Pillow
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'Pillow'])
 
+from drawing_catalogue import DrawingCatalogue, ensure_folder, reset_folders, scan_files
 import gc
+from label_export import line_rows, point_columns
+import numpy as np
 import os
 import pandas as pd
 from pathlib import Path
 from PIL import Image, ImageDraw
 import regex as re
-import sys
+from result_store import drawing_key, read_results, result_file
+from run_manifest import RunManifest
 from tqdm import tqdm
 
 def get_file_list(dir_name):
     
     ''' For the given path, get the List of all files in the directory tree '''
-    
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-    
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-                
-    return all_files
 
-def markup_PID(name: Path):
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
+
+def markup_PID(name: Path, force=False, source='csv'):
     
-    ''' Mark up the bounding box from *.csv file on the rasterized drawing file (*.png or *.jpg) '''
+    ''' Mark up the bounding box from *.csv file on the rasterized drawing file (*.png or *.jpg), the unchanged drawings of the last run are skipped
+
+    source='store' reads the boxes of each drawing from the Parquet result store ('.\\Results\\uhv') instead of the CSV files '''
     
     # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
     os.chdir(name)
+    reset_folders()
     
     raster_folder = ".\\PNG"
-    csv_folder = ".\\CSV"
-    list_raster_files = get_file_list(raster_folder)
-    list_csv_files = get_file_list(csv_folder)
-    list_data_files = list(zip(list_raster_files,list_csv_files))
+    catalogue = DrawingCatalogue()
+    list_raster_files = catalogue.paths('PNG')
+    plant = os.path.basename(os.getcwd())
+    if source == 'store':
+        list_csv_files = [result_file('uhv', plant, drawing_key(f, raster_folder)) for f in list_raster_files]
+        list_data_files = list(zip(list_raster_files,list_csv_files))
+    else:
+        # The raster and CSV files are paired by the sub-folder and the drawing name, not by the order of the listings
+        list_data_files = [(raster_filename, csv_filename) for _, raster_filename, csv_filename in catalogue.pairs('PNG', 'CSV')]
+        for raster_filename in catalogue.missing('PNG', 'CSV')['CSV']:
+            print('Skipping the raster without CSV file:', raster_filename)
     list_data_files = pd.DataFrame(list_data_files, columns=['PNG','CSV'])
+    manifest = RunManifest('markup_PID')
     
     for idx in tqdm(list_data_files.index):
         # Get the file location
         raster_filename = list_data_files.loc[idx,'PNG']
         csv_filename = list_data_files.loc[idx,'CSV']
         
-        piping_df = pd.read_csv(csv_filename, index_col=0)
-        
         # Define related parameters and check the existing save folder
         listname = re.split(r'\\|\.', raster_filename)
         filename = listname[-2]  
-        list_folders = os.listdir('.\\PNG')
         save_markup_folder = '.\\MarkUp'
         trim_char = ['','PNG',filename,'png']
-    
-        if not os.path.exists(save_markup_folder):
-            os.makedirs(save_markup_folder)
+        ensure_folder(save_markup_folder)
         
         # Save file location
         if bool(len(list_raster_files) != 0):
 
             prior_folder = [folder for folder in listname if folder not in trim_char]
             prior_folder = "".join(prior_folder)
-            if not os.path.exists(save_markup_folder+'\\'+prior_folder): # Check the whether if existing folder is created
-                os.makedirs(save_markup_folder+'\\'+prior_folder)
+            ensure_folder(save_markup_folder+'\\'+prior_folder) # Each folder is checked once
             saveinfo_path = save_markup_folder+'\\'+prior_folder+'\\'+filename+'.png'
             print('Saving bounding box markup file at:', saveinfo_path)
         else:
             saveinfo_path = save_markup_folder+'\\'+filename+'.png'
         
+        # Skip the drawing, which was marked up from the same raster and CSV contents
+        if (not force) and manifest.is_done(raster_filename, [raster_filename, csv_filename], [saveinfo_path]):
+            continue
+        
+        # The result store keeps the boxes as the float columns, which are read without parsing the point texts
+        if source == 'store':
+            piping_df = read_results('uhv', plant, drawing_key(raster_filename, raster_folder), points=False)
+        else:
+            piping_df = pd.read_csv(csv_filename, index_col=0)
+        
+        # One box per line number, the paired texts are marked up by their combined box
+        piping_df = line_rows(piping_df)
+        (llx, lly), (urx, ury) = point_columns(piping_df, 'LowLeft'), point_columns(piping_df, 'UpRight')
+        boxes = np.column_stack([np.minimum(llx, urx), np.minimum(lly, ury), np.maximum(llx, urx), np.maximum(lly, ury)]).tolist()
+        
         with Image.open(raster_filename) as img:
             img = img.convert('RGB')
             draw = ImageDraw.Draw(img)
 
-            for i in piping_df.index:
-                lowleft = [float(s) for s in piping_df.loc[i,'LowLeft'].strip()[1:-1].split(", ")]
-                upright = [float(s) for s in piping_df.loc[i,'UpRight'].strip()[1:-1].split(", ")]
-                draw.rectangle(lowleft+upright, outline='red', width=1)
+            for box in boxes:
+                draw.rectangle(box, outline='red', width=1)
         
         img.save(saveinfo_path)
+        manifest.record(raster_filename, [raster_filename, csv_filename], [saveinfo_path])
         
         print('Saving location of file:', saveinfo_path)
             
+    manifest.compact()
+    print('Run manifest:', manifest.summary())
     print('Bounding boxes markup on P&ID is now complete!!!')
     gc.collect()
     
@@ -111,4 +123,5 @@ DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Projec
 # Testing!!!
 # Ensure the working directory before executing!!!
 
-markup_PID(DIR)
+if __name__ == '__main__':
+    markup_PID(DIR)
@@ -1,108 +1,160 @@
+from drawing_catalogue import ensure_folder, reset_folders, scan_files
 import gc
+from label_export import CocoWriter, icdar_quads, line_rows, quad_boxes, write_yolo
+import numpy as np
 import pandas as pd
 import os
 from pathlib import Path
+from raster_transform import image_size, read_sidecar
 import regex as re
+from result_store import list_drawings, read_results, result_file
+from run_manifest import RunManifest
 from tqdm import tqdm
 
 def get_file_list(dir_name):
     
     ''' For the given path, get the List of all files in the directory tree '''
-    
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-    
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-                
-    return all_files
+
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
   
-def convert_ICDAR_format(name: Path):
+def raster_size(raster_file):
 
-  ''' Convert, clean and tidy the .csv dataframe into ICDAR format'''
+  ''' Image size (width, height) of the rasterized drawing from its sidecar or file header, None if the drawing is not rasterized '''
 
-  # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
-  os.chdir(name)
+  metadata = read_sidecar(raster_file)
+  if metadata is not None:
+      return tuple(metadata['Size'])
 
-  print('CSV files have been converted into ICDAR format.','\n')
-  print('Conversion is proceeding...')
+  return image_size(raster_file) if os.path.exists(raster_file) else None
 
-  list_files = get_file_list('CSV')
+def icdar_path(csv_file, folder='.\\ICDAR', extension='.csv'):
 
-  for idx in tqdm( range(len(list_files)) ):
+  ''' Label file of the CSV file: '<folder>\\<sub-folders>\\<drawing><extension>' (the sub-folders are joined) '''
 
-      filename_path = list_files[idx]
+  listname = re.split(r'\\|\.', csv_file)
+  filename = listname[-2]
+  prior_folder = "".join([folder for folder in listname if folder not in ['','CSV',filename,'csv']])
 
-      # Get the data file and remove unnecessary columns
-      df = pd.read_csv(filename_path, index_col=0)
+  return folder+'\\'+prior_folder+'\\'+filename+extension
 
-      # Get the filename
-      listname = re.split(r'\\|\.', filename_path)
-      filename = listname[-2]
+def icdar_drawing(csv_file, saveinfo_path):
 
-      # Define related parameters and check the existing save folder
-      save_icdar_folder = '.\\ICDAR'
-      trim_char = ['','CSV',filename,'csv']
+  ''' Convert the CSV file of one drawing into the ICDAR file (4 corners of each box) '''
 
-      if not os.path.exists(save_icdar_folder):
-          os.makedirs(save_icdar_folder)
+  ensure_folder(os.path.dirname(saveinfo_path))
+  icdar_quads(pd.read_csv(csv_file, index_col=0)).to_csv(saveinfo_path)
 
-      # Save file
-      if bool(len(list_files) != 0):
+def convert_ICDAR_format(name: Path, force=False, source='csv', formats=('icdar',), category=None, categories=('text',), lines=False):
 
-          prior_folder = [folder for folder in listname if folder not in trim_char]
-          prior_folder = "".join(prior_folder)
-          if not os.path.exists(save_icdar_folder+'\\'+prior_folder): # Check the whether if existing folder is created
-              os.makedirs(save_icdar_folder+'\\'+prior_folder)
-          saveinfo_path = save_icdar_folder+'\\'+prior_folder+'\\'+filename+'.csv'
+  ''' Convert, clean and tidy the .csv dataframe into ICDAR format, the unchanged files of the last run are skipped (force=True converts all)
 
-      else:
-          saveinfo_path = save_csv_folder+'\\'+filename+'.csv'
+  source='store' reads the drawings from the Parquet result store ('.\\Results\\uhv') instead of the CSV files
+  formats: any of 'icdar' (one CSV per drawing), 'coco' (one annotation file of the plant, '.\\COCO\\annotations.json') and
+  'yolo' (one label file per drawing, '.\\YOLO'), which are written in one pass over the plant. The COCO and YOLO boxes need
+  the image size, which is read from the sidecar or the header of the raster file ('.\\PNG').
+  category: the column of the category (e.g. 'Type'), which values are in categories, otherwise all boxes are 'text'
+  lines: one box per line number (the combined box and the merged name of the paired texts) instead of one box per text '''
 
-      # Verify wether if there is any row in the dataframe
-      if df.shape[0] == 0:
-          df = pd.DataFrame(columns=['tlx', 'tly', 'trx', 'try', 'brx', 'bry', 'blx', 'bly', 'text'])
+  # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
+  os.chdir(name)
+  reset_folders()
+
+  print('CSV files have been converted into ICDAR format.','\n')
+  print('Conversion is proceeding...')
 
-      else:            
-          df = df.drop(['ID','Rotation','Type','Pattern','Filename'], axis=1)
-          # Convert the 2-rasterized coordinates into 4 locations (8 positions) of bounding boxes 
-          lowleft = pd.Series([re.sub(r'\(|\)','',df.loc[i,'LowLeft']) for i in df.index]).str.split(',')
-          blx = [float(x) for x,y in lowleft] # 1
-          bly = [float(y) for x,y in lowleft] # 2
+  plant = os.path.basename(os.getcwd())
+  if source == 'store':
+      # The drawings of the store are named as their CSV files, so the ICDAR files are saved at the same location
+      drawings = [drawing for _, drawing in list_drawings('uhv', plant)]
+      list_files = ['.\\CSV\\'+drawing.replace('/', '\\')+'.csv' for drawing in drawings]
+      list_inputs = [result_file('uhv', plant, drawing) for drawing in drawings]
+  else:
+      list_files = get_file_list('CSV')
+      list_inputs = list_files
+
+  # The raster of the drawing is at the same sub-folder of the raster folder
+  list_raster_files = [os.path.splitext(re.sub(r'^(\.[\\/])?CSV', r'\1PNG', f))[0] + '.png' for f in list_files]
+
+  categories = list(categories)
+  manifest = RunManifest('convert_ICDAR_format', {'formats': sorted(formats), 'category': category, 'categories': categories,
+                                                  'lines': lines})
+
+  # The COCO file holds all drawings, so it is written again when any drawing has changed
+  coco = None
+  coco_path = '.\\COCO\\annotations.json'
+  if 'coco' in formats:
+      coco_inputs = list_inputs + [f for f in list_raster_files if os.path.exists(f)]
+      if force or not manifest.is_done(coco_path, coco_inputs, [coco_path]):
+          coco = CocoWriter(coco_path, categories)
 
-          upright = pd.Series([re.sub(r'\(|\)','',df.loc[i,'UpRight']) for i in df.index]).str.split(',')
-          trx = [float(x) for x,y in upright] # 3
-          _try = [float(y) for x,y in upright] # 4
+  for idx in tqdm( range(len(list_files)) ):
 
-          tlx = blx
-          tly = _try
-          brx = trx
-          bry = bly
+      filename_path = list_files[idx]
+      input_path = list_inputs[idx]
+      raster_file = list_raster_files[idx]
+
+      # Save file
+      saveinfo_path = icdar_path(filename_path)
+      yolo_path = icdar_path(filename_path, '.\\YOLO', '.txt')
+      outputs = ([saveinfo_path] if 'icdar' in formats else []) + ([yolo_path] if 'yolo' in formats else [])
+      size = raster_size(raster_file) if ('yolo' in formats) or (coco is not None) else None
+      inputs = [input_path] + ([raster_file] if (size is not None) and os.path.exists(raster_file) else [])
+
+      # Skip the file, which was converted from the same content (the COCO file still needs all drawings)
+      done = (not force) and manifest.is_done(filename_path, inputs, outputs)
+      if done and (coco is None):
+          continue
+
+      # Get the data file
+      if source == 'store':
+          df = read_results('uhv', plant, drawings[idx], points=False).drop(['Plant', 'Drawing'], axis=1)
+      else:
+          df = pd.read_csv(filename_path, index_col=0)
+      if lines:
+          df = line_rows(df)
+
+      # Convert the 2-rasterized coordinates into 4 locations (8 positions) of bounding boxes at once
+      icdar_df = icdar_quads(df)
+      boxes = quad_boxes(icdar_df)
+
+      # The boxes of the other categories are not exported
+      if category is not None:
+          labels = df[category].astype(str).to_numpy() if df.shape[0] != 0 else np.zeros(0, dtype=str)
+          known = np.isin(labels, categories)
+          labels, class_boxes = labels[known].tolist(), boxes[known]
+      else:
+          labels, class_boxes = [categories[0]] * len(boxes), boxes
 
-          # Add the 8 positions into dataframe and remove unnecessary columns
-          df = df.assign(tlx=tlx, tly=tly, trx=trx, _try=_try, brx=brx, bry=bry,blx=blx, bly=bly)
-          df = df.drop(['LowLeft','UpRight'], axis=1)
+      if (size is None) and (('yolo' in formats) or (coco is not None)):
+          print('Skipping COCO and YOLO labels of the drawing without the raster size:', raster_file)
 
-          # Sort the columns order
-          cols = ['tlx', 'tly', 'trx', '_try', 'brx', 'bry', 'blx', 'bly', 'Name']
-          df = df[cols]
+      if coco is not None and size is not None:
+          coco.add_image(os.path.relpath(raster_file, '.'), size, class_boxes, labels)
 
-          # Change the column name which violate the rule of setup variable name (_try)
-          df.columns = ['tlx', 'tly', 'trx', 'try', 'brx', 'bry', 'blx', 'bly', 'text']
+      if done:
+          continue
 
-      df.to_csv(saveinfo_path)
+      if 'icdar' in formats:
+          ensure_folder(os.path.dirname(saveinfo_path))
+          icdar_df.to_csv(saveinfo_path)
+      if ('yolo' in formats) and (size is not None):
+          write_yolo(yolo_path, class_boxes, size, [categories.index(label) for label in labels])
+      manifest.record(filename_path, inputs, [output for output in outputs if os.path.exists(output)])
 
       print('Saving location of file:', saveinfo_path)
 
+  if coco is not None:
+      coco.close()
+      manifest.record(coco_path, coco_inputs, [coco_path])
+  if 'yolo' in formats:
+      if not os.path.exists('.\\YOLO'):
+          os.makedirs('.\\YOLO')
+      with open('.\\YOLO\\classes.txt', 'w') as f:
+          f.write('\n'.join(categories))
+
+  manifest.compact()
+  print('Run manifest:', manifest.summary())
   print('\n','Complete!!!')
   gc.collect()
     
@@ -112,4 +164,5 @@ DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Projec
 # Testing!!!
 # Ensure the working directory before executing!!!
 
-convert_ICDAR_format(DIR)
+if __name__ == '__main__':
+    convert_ICDAR_format(DIR)
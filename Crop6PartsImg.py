@@ -1,4 +1,5 @@
 import importlib.util
+import subprocess
 import sys
 
 # For illustrative purposes.
@@ -14,7 +15,7 @@ elif (spec := importlib.util.find_spec(name)) is not None:
 else:
     print(f"can't find the {name!r} module")
     print(f"installation {name!r} is proceeding...")
-    !pip3 install Pillow
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'Pillow'])
     
 import gc
 import matplotlib.pyplot as plt
@@ -24,101 +25,195 @@ import pandas as pd
 from pathlib import Path
 from PIL import Image
 import regex as re
+from crop_shards import ShardWriter, SHARD_SIZE
+from drawing_catalogue import DrawingCatalogue, ensure_folder, reset_folders, scan_files
+from run_manifest import RunManifest
+from sheet_tiler import tile_sheet
 from tqdm import tqdm
 
 def get_file_list(dir_name):
     
     ''' For the given path, get the List of all files in the directory tree '''
+
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
+
+def part_name(filename):
+
+    ''' File name of the parts, which the quote, slash and ampersand characters are removed, and the long name is cut at the first space '''
+
+    filename = re.sub('"','',filename)
+    filename = re.sub('\/','_',filename)
+    filename = re.sub('\&','_',filename)
+
+    if len(filename) > 30:
+        filename = "".join(filename.split(' ')[0])
+
+    return filename
+
+def six_part_boxes(width, height):
+
+    ''' Boxes of the 6 parts: 4 quadrants (q1 to q4) and the vertical and horizontal one-third bands (ov and oh) '''
+
+    return {'q1': (width/2, 0, width, height/2), 'q2': (0, 0, width/2, height/2),
+            'q3': (0, height/2, width/2, height), 'q4': (width/2, height/2, width, height),
+            'ov': ((1/3)*width, 0, (2/3)*width, height), 'oh': (0, (1/3)*height, width, (2/3)*height)}
+
+def part_paths(file_raster_location):
+
+    ''' Paths of the 6 parts of the drawing: '.\\Crop6PartsImg\\<sub-folders>\\<drawing>\\<drawing>_<part>.png' '''
+
+    listname = re.split(r'\\|\.', file_raster_location)
+    filename = part_name(listname[-2])
+    prior_folder = "".join([folder for folder in listname if folder not in ['','PNG',filename,'png']])
+    save_prefix = '.\\Crop6PartsImg\\'+prior_folder+'\\'+filename+'\\'+filename
+
+    return [save_prefix+'_'+part+'.png' for part in ['q1','q2','q3','q4','ov','oh']]
+
+def crop6parts_drawing(file_raster_location, save_paths=None, shards=None):
+
+    ''' Crop one drawing into the 6 parts, which are saved into save_paths (part_paths order), or written into the shards
+    (ShardWriter) with their part name, source drawing and box '''
+
+    with Image.open(file_raster_location) as img:
+        boxes = six_part_boxes(img.width, img.height)
+
+        if shards is not None:
+            for part, box in boxes.items():
+                shards.write(img.crop(box), {'Label': part, 'Drawing': file_raster_location, 'Box': list(box)})
+            return
+
+        ensure_folder(os.path.dirname(save_paths[0]))
+        for box, save_path in zip(boxes.values(), save_paths):
+            img.crop(box).save(save_path)
+
+def crop6parts_image(name: Path, force=False, shard_size=None):
     
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-    
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-                
-    return all_files
-
-def crop6parts_image(name: Path):
-    
-    ''' Crop the image of P&ID into 6 parts for better model training '''
+    ''' Crop the image of P&ID into 6 parts for better model training, the unchanged drawings of the last run are skipped (force=True crops all)
+
+    shard_size (bytes, True for the default size) writes the parts of all drawings into the tar shards of '.\\CropShards\\Crop6PartsImg'
+    instead of the PNG files, each part keeps its name (q1, ..., oh), source drawing and box. '''
     
     # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
     os.chdir(name)
+    reset_folders()
     
     print('Cropping text have been proceeding.')
     
     raster_path = ".\\PNG"
     list_raster_files = get_file_list(raster_path)
+    manifest = RunManifest('crop6parts_image')
+    shards = None
+
+    if shard_size:
+        shard_folder = '.\\CropShards\\Crop6PartsImg'
+        # The shards hold all drawings, so they are skipped only when none of the rasters has changed
+        if (not force) and manifest.is_done(shard_folder, list_raster_files, [os.path.join(shard_folder, 'shards.json')]):
+            manifest.compact()
+            print('Run manifest:', manifest.summary())
+            return
+        shards = ShardWriter(shard_folder, prefix='part', shard_size=SHARD_SIZE if shard_size is True else int(shard_size))
     
     for idx in tqdm(range(len(list_raster_files))):
         
         file_raster_location = list_raster_files[idx]
         
-        listname = re.split(r'\\|\.', file_raster_location)
-        filename = listname[-2]
-        filename = re.sub('"','',filename)
-        filename = re.sub('\/','_',filename)
-        filename = re.sub('\&','_',filename)
-        
-        if len(filename) > 30:
-            filename = "".join(filename.split(' ')[0])
-            
-        save_cropped_folder = '.\\Crop6PartsImg'
-        trim_char = ['','PNG',filename,'png']
-        
-        if not os.path.exists(save_cropped_folder):
-            os.makedirs(save_cropped_folder)
-        
-        if bool(len(list_raster_files) != 0):
-            prior_folder = [folder for folder in listname if folder not in trim_char]
-            prior_folder = "".join(prior_folder)
-            saveinfo_path = save_cropped_folder+'\\'+"".join(prior_folder)+'\\'+filename+'\\'
-            if not os.path.exists(saveinfo_path): # Check the whether if existing folder is created
-                os.makedirs(saveinfo_path)           
-
-        else:
-            saveinfo_path = save_cropped_folder+'\\'+filename+'\\'
-            if not os.path.exists(saveinfo_path): # Check the whether if existing folder is created
-                os.makedirs(saveinfo_path)
-
-        print('Saving cropped images file at:', saveinfo_path)
-        
-        save_prefix = saveinfo_path+filename
-        
-        with Image.open(file_raster_location) as img:
-            height = img.height
-            width = img.width
-            
-            one_third_height = (1/3)*height
-            two_third_height = (2/3)*height
-            one_third_width = (1/3)*width
-            two_third_width = (2/3)*width
-            
-            img_crop_q1 = img.crop((width/2, 0, width, height/2))
-            img_crop_q2 = img.crop((0, 0, width/2, height/2))
-            img_crop_q3 = img.crop((0, height/2, width/2, height))
-            img_crop_q4 = img.crop((width/2, height/2, width, height))
-            img_crop_ov = img.crop((one_third_width, 0, two_third_width, height))
-            img_crop_oh = img.crop((0, one_third_height, width, two_third_height))
-            
-            img_crop_q1.save(save_prefix+'_q1.png')
-            img_crop_q2.save(save_prefix+'_q2.png')
-            img_crop_q3.save(save_prefix+'_q3.png')
-            img_crop_q4.save(save_prefix+'_q4.png')
-            img_crop_ov.save(save_prefix+'_ov.png')
-            img_crop_oh.save(save_prefix+'_oh.png')
+        save_paths = part_paths(file_raster_location) if shards is None else None
+        print('Saving cropped images file at:', os.path.dirname(save_paths[0]) if shards is None else shard_folder)
+
+        # Skip the drawing, which was cropped from the same raster content
+        if (shards is None) and (not force) and manifest.is_done(file_raster_location, [file_raster_location], save_paths):
+            continue
+
+        crop6parts_drawing(file_raster_location, save_paths, shards)
+
+        if shards is None:
+            manifest.record(file_raster_location, [file_raster_location], save_paths)
+
+    if shards is not None:
+        shards.close()
+        manifest.record(shard_folder, list_raster_files, [os.path.join(shard_folder, 'shards.json')])
             
+    manifest.compact()
+    print('Run manifest:', manifest.summary())
     print('Image cropping is now finished!!!')
     gc.collect()
+
+def crop_tiles(name: Path, tile_size=1024, stride=None, overlap=0, policy='truncate', min_visibility=0.5, force=False, shard_size=None):
+
+    ''' Crop the image of P&ID into the fixed size tiles of the sliding window, and then remap the ICDAR boxes into each tile
+
+    The stride is the tile size minus the overlap by default, the last tiles are snapped to the sheet edge. The boxes across
+    the tile boundary are dropped (policy='drop') or truncated (policy='truncate', at least min_visibility of the box area is
+    in the tile). Each tile is saved with its ICDAR file ('.\\CropTiles'), or into the tar shards with its boxes (shard_size). '''
+
+    # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
+    os.chdir(name)
+    reset_folders()
+
+    print('Cropping tiles have been proceeding.')
+
+    # The raster and ICDAR files are paired by the sub-folder and the drawing name, the raster without ICDAR file has no boxes
+    catalogue = DrawingCatalogue()
+    icdar_files = catalogue.files('ICDAR')
+    list_data_files = sorted(catalogue.files('PNG').items())
+    list_raster_files = [file_raster_location for _, file_raster_location in list_data_files]
+    list_icdar_files = [icdar_files.get(key) for key, _ in list_data_files]
+    for file_raster_location in catalogue.missing('PNG', 'ICDAR')['ICDAR']:
+        print('Tiling the raster without ICDAR file (no boxes):', file_raster_location)
+    params = {'tile_size': tile_size, 'stride': stride, 'overlap': overlap, 'policy': policy, 'min_visibility': min_visibility}
+    manifest = RunManifest('crop_tiles', params=params)
+    save_tiles_folder = '.\\CropTiles'
+    shards = None
+
+    if shard_size:
+        shard_folder = '.\\CropShards\\CropTiles'
+        shard_inputs = list_raster_files + [f for f in list_icdar_files if f is not None]
+        # The shards hold all drawings, so they are skipped only when none of the inputs has changed
+        if (not force) and manifest.is_done(shard_folder, shard_inputs, [os.path.join(shard_folder, 'shards.json')]):
+            manifest.compact()
+            print('Run manifest:', manifest.summary())
+            return
+        shards = ShardWriter(shard_folder, prefix='tile', shard_size=SHARD_SIZE if shard_size is True else int(shard_size))
+
+    for file_raster_location, file_icdar_location in tqdm(list(zip(list_raster_files, list_icdar_files))):
+
+        listname = re.split(r'\\|\.', file_raster_location)
+        filename = listname[-2]
+        prior_folder = "".join([folder for folder in listname if folder not in ['', 'PNG', filename, 'png']])
+        saveinfo_path = save_tiles_folder+'\\'+prior_folder+'\\'+filename+'\\'
+        inputs = [f for f in [file_raster_location, file_icdar_location] if f is not None]
+
+        # Skip the drawing, which was tiled from the same raster and ICDAR contents
+        if (shards is None) and (not force) and manifest.is_done(file_raster_location, inputs, [saveinfo_path]):
+            continue
+        if (shards is None) and not os.path.exists(saveinfo_path):
+            os.makedirs(saveinfo_path)
+
+        # The tiles are made one by one, and then saved with the boxes in the tile coordinates
+        df = pd.read_csv(file_icdar_location, index_col=0) if file_icdar_location is not None else None
+        tiles = tile_sheet(file_raster_location, df, tile_size, stride, overlap, policy, min_visibility)
+
+        for row, col, x, y, pixels, tile_df in tiles:
+            if shards is not None:
+                shards.write(pixels, {'Label': f'r{row:03d}_c{col:03d}', 'Drawing': file_raster_location,
+                                      'Box': [x, y, x + tile_size, y + tile_size], 'ICDAR': tile_df.to_dict(orient='records')})
+                continue
+            save_prefix = saveinfo_path+filename+f'_r{row:03d}_c{col:03d}'
+            Image.fromarray(pixels).save(save_prefix+'.png')
+            tile_df.to_csv(save_prefix+'.csv')
+
+        if shards is None:
+            manifest.record(file_raster_location, inputs, [saveinfo_path])
+
+    if shards is not None:
+        shards.close()
+        manifest.record(shard_folder, shard_inputs, [os.path.join(shard_folder, 'shards.json')])
+
+    manifest.compact()
+    print('Run manifest:', manifest.summary())
+    print('Tile cropping is now finished!!!')
+    gc.collect()
     
 # set your working directory:
 DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Project").expanduser()
@@ -126,4 +221,5 @@ DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Projec
 # Testing!!!
 # Ensure the working directory before executing!!!
 
-crop6parts_image(DIR)
+if __name__ == '__main__':
+    crop6parts_image(DIR)
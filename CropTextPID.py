@@ -1,4 +1,5 @@
 import importlib.util
+import subprocess
 import sys
 
 # For illustrative purposes.
@@ -14,8 +15,9 @@ elif (spec := importlib.util.find_spec(name)) is not None:
 else:
     print(f"can't find the {name!r} module")
     print(f"installation {name!r} is proceeding...")
-    !pip3 install Pillow
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'Pillow'])
 
+from concurrent.futures import ThreadPoolExecutor
 import gc
 import matplotlib.pyplot as plt
 import numpy as np
@@ -24,91 +26,161 @@ import pandas as pd
 from pathlib import Path
 from PIL import Image
 import regex as re
+from crop_shards import encode_image, ShardWriter, SHARD_SIZE
+from drawing_catalogue import DrawingCatalogue, ensure_folder, reset_folders, scan_files
+from run_manifest import RunManifest
 from tqdm import tqdm
 
 def get_file_list(dir_name):
     
     ''' For the given path, get the List of all files in the directory tree '''
-    
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-    
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-                
-    return all_files
+
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
   
-def crop_text(name: Path):
+def crop_boxes(df, size):
+
+  ''' Round and clamp all text boxes (tlx, tly, brx, bry) into the image size at once
+
+  Return the (N,4) integer array of the pixel boxes (left, upper, right, lower) and the mask of the valid boxes, which are
+  the finite boxes with a positive area inside the image. '''
+
+  boxes = df[['tlx', 'tly', 'brx', 'bry']].to_numpy(dtype=float).reshape(-1, 4)
+  finite = np.isfinite(boxes).all(axis=1)
+  boxes = np.where(np.isfinite(boxes), boxes, 0)
+
+  # The corners are sorted, and then rounded the same as the crop method of PIL
+  left, right = np.minimum(boxes[:, 0], boxes[:, 2]), np.maximum(boxes[:, 0], boxes[:, 2])
+  upper, lower = np.minimum(boxes[:, 1], boxes[:, 3]), np.maximum(boxes[:, 1], boxes[:, 3])
+  boxes = np.round(np.column_stack([left, upper, right, lower])).astype(int)
+  boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, size[0])
+  boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, size[1])
+  valid = finite & (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+
+  return boxes, valid
+
+def crop_names(df):
+
+  ''' File names of the cropped texts, which the quote and slash characters are removed '''
+
+  return df['text'].astype(str).str.replace('"', '', regex=False).str.replace('/', '_', regex=False).tolist()
+
+def load_pixels(file_raster_location):
+
+  ''' Decode the raster image once into the pixel array, the palette image is converted into RGB '''
+
+  with Image.open(file_raster_location) as img:
+      if img.mode == 'P':
+          img = img.convert('RGB')
+      return np.asarray(img)
+
+def save_crop(pixels, box, path):
+
+  left, upper, right, lower = box
+  Image.fromarray(np.ascontiguousarray(pixels[upper:lower, left:right])).save(path)
+
+def crop_folder(file_raster_location):
+
+  ''' Folder of the text crops of the drawing: '.\\CropImage\\<sub-folders>\\<drawing>\\' (the sub-folders are joined) '''
 
-  ''' Crop the text from the P&ID, and then save into the subfolder, which is the drawing filename'''
+  listname = re.split(r'\\|\.', file_raster_location)
+  filename = listname[-2]
+  prior_folder = "".join([folder for folder in listname if folder not in ['','PNG',filename,'png']])
+
+  return '.\\CropImage\\'+prior_folder+'\\'+filename+'\\'
+
+def crop_drawing(file_raster_location, file_icdar_location, saveinfo_path=None, writer=None, shards=None):
+
+  ''' Crop all texts of one drawing, the raster is decoded once, and the crops are saved (or encoded) by the writer threads
+
+  The crops are saved into saveinfo_path, or written into the shards (ShardWriter) with their text label, source drawing and
+  box. Return the number of the crops. '''
+
+  df = pd.read_csv(file_icdar_location, index_col=0)
+  pixels = load_pixels(file_raster_location)
+  boxes, valid = crop_boxes(df, (pixels.shape[1], pixels.shape[0]))
+  textnames = crop_names(df)
+  if not valid.all():
+      print('Skipping', int((~valid).sum()), 'empty or outside text boxes of:', file_raster_location)
+  run = writer.map if writer is not None else map
+
+  if shards is not None:
+      # The crops are encoded by the writer threads, and then appended into the shard in the ICDAR order
+      crops = [(textname, box) for textname, box, ok in zip(textnames, boxes, valid) if ok]
+      encoded = run(lambda item: encode_image(pixels[item[1][1]:item[1][3], item[1][0]:item[1][2]]), crops)
+      for (textname, box), data in zip(crops, encoded):
+          shards.write(data, {'Label': textname, 'Drawing': file_raster_location, 'Box': box.tolist()})
+      return len(crops)
+
+  # The texts of the same name are saved once, the last box is kept (the same as overwriting the file)
+  ensure_folder(saveinfo_path)
+  crops = {f'{saveinfo_path+textname}.png': box for textname, box, ok in zip(textnames, boxes, valid) if ok}
+  list(run(lambda item: save_crop(pixels, item[1], item[0]), crops.items()))
+
+  return len(crops)
+
+def crop_text(name: Path, force=False, workers=4, shard_size=None):
+
+  ''' Crop the text from the P&ID, and then save into the subfolder, which is the drawing filename
+  
+  The drawings, which raster and ICDAR files are unchanged since the last run, are skipped (force=True crops all). Each raster
+  is decoded only once, and all texts are cropped from its pixel array, and then saved by the writer threads (workers).
+
+  shard_size (bytes, True for the default size) writes the crops of all drawings into the tar shards of '.\\CropShards\\CropImage'
+  instead of one PNG file per text, each crop keeps its text label, source drawing and box. The shards are written again
+  when any raster or ICDAR file has changed. '''
 
   # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
   os.chdir(name)
+  reset_folders()
 
   print('Cropping text have been proceeding.')
 
-  raster_path = ".\\PNG"
-  icdar_path = ".\\ICDAR"
-  list_raster_files = get_file_list(raster_path)
-  list_icdar_files = get_file_list(icdar_path)
-  list_data_files = list(zip(list_raster_files,list_icdar_files))
-  list_data_files = pd.DataFrame(list_data_files, columns=['PNG','ICDAR'])
+  # The raster and ICDAR files are paired by the sub-folder and the drawing name, not by the order of the listings
+  catalogue = DrawingCatalogue()
+  list_data_files = catalogue.pairs('PNG', 'ICDAR')
+  list_raster_files = [file_raster_location for _, file_raster_location, _ in list_data_files]
+  list_icdar_files = [file_icdar_location for _, _, file_icdar_location in list_data_files]
+  for file_raster_location in catalogue.missing('PNG', 'ICDAR')['ICDAR']:
+      print('Skipping the raster without ICDAR file:', file_raster_location)
+  manifest = RunManifest('crop_text')
+  writer = ThreadPoolExecutor(max_workers=max(int(workers), 1))
+  shards = None
+
+  if shard_size:
+      shard_folder = '.\\CropShards\\CropImage'
+      shard_inputs = list_raster_files + list_icdar_files
+      # The shards hold all drawings, so they are skipped only when none of the inputs has changed
+      if (not force) and manifest.is_done(shard_folder, shard_inputs, [os.path.join(shard_folder, 'shards.json')]):
+          manifest.compact()
+          print('Run manifest:', manifest.summary())
+          return
+      shards = ShardWriter(shard_folder, prefix='crop', shard_size=SHARD_SIZE if shard_size is True else int(shard_size))
 
   for idx in tqdm(range(len(list_raster_files))):
 
       file_raster_location = list_raster_files[idx]
       file_icdar_location = list_icdar_files[idx]
-      df = pd.read_csv(file_icdar_location, index_col=0)
-
-      listname = re.split(r'\\|\.', file_raster_location)
-      filename = listname[-2]
-      save_cropped_folder = '.\\CropImage'
-      trim_char = ['','PNG',filename,'png']
-
-      if not os.path.exists(save_cropped_folder):
-          os.makedirs(save_cropped_folder)
-
-      if bool(len(list_raster_files) != 0):
-          prior_folder = [folder for folder in listname if folder not in trim_char]
-          prior_folder = "".join(prior_folder)
-          saveinfo_path = save_cropped_folder+'\\'+"".join(prior_folder)+'\\'+filename+'\\'
-          if not os.path.exists(saveinfo_path): # Check the whether if existing folder is created
-              os.makedirs(saveinfo_path)           
-
-      else:
-          saveinfo_path = save_cropped_folder+'\\'+filename+'\\'
-          if not os.path.exists(saveinfo_path): # Check the whether if existing folder is created
-              os.makedirs(saveinfo_path)
-
-      print('Saving cropped text image at:', saveinfo_path)
-
-      for row_id in range(df.shape[0]):          
-          # Get the coordinate for cropping image        
-          left = df.loc[row_id,'tlx']
-          upper = df.loc[row_id,'tly']
-          right = df.loc[row_id,'brx']
-          lower = df.loc[row_id,'bry']
-          textname = df.loc[row_id,'text']
-          textname = re.sub('"','',textname)
-          textname = re.sub('/','_',textname)
-
-          with Image.open(file_raster_location) as img:
-              # The crop method from the Image module takes four coordinates as input.
-              # The right can also be represented as (left+width)
-              # and lower can be represented as (upper+height
-              # Here the image "img" is cropped and assigned to new variable im_crop
-              img_crop = img.crop((left, upper, right, lower))
-              img_crop.save(f'{saveinfo_path+textname}.png')
 
+      saveinfo_path = crop_folder(file_raster_location) if shards is None else None
+
+      # Skip the drawing, which was cropped from the same raster and ICDAR contents
+      if (shards is None) and (not force) and manifest.is_done(file_raster_location, [file_raster_location, file_icdar_location], [saveinfo_path]):
+          continue
+
+      print('Saving cropped text image at:', saveinfo_path or shard_folder)
+      crop_drawing(file_raster_location, file_icdar_location, saveinfo_path, writer, shards)
+
+      if shards is None:
+          manifest.record(file_raster_location, [file_raster_location, file_icdar_location], [saveinfo_path])
+
+  if shards is not None:
+      shards.close()
+      manifest.record(shard_folder, shard_inputs, [os.path.join(shard_folder, 'shards.json')])
+
+  writer.shutdown()
+  manifest.compact()
+  print('Run manifest:', manifest.summary())
   print('Image cropping is now finished!!!')
   gc.collect()
     
@@ -118,4 +190,5 @@ DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Projec
 # Testing!!!
 # Ensure the working directory before executing!!!
 
-crop_text(DIR)
+if __name__ == '__main__':
+    crop_text(DIR)
@@ -4,6 +4,19 @@ import os
 
 folder_path = Path(".\\Use Case Project").expanduser() 
 
+# Please install Teigha File Converter by copy and paste the as following link in URL:
+# https://teigha-file-converter.software.informer.com/
+
+# Parameters Setup:
+# TEIGHA_PATH: Location of .exe file
+# Output version: ACAD9, ACAD10, ACAD12, ACAD14, ACAD2000, ACAD2004, ACAD2007, ACAD20010, ACAD2013, ACAD2018
+# Output file type: DWG, DXF, DXB
+# Audit each file: 0, 1
+TEIGHA_PATH = "C:/Program Files (x86)/ODA/Teigha File Converter 4.3.2/TeighaFileConverter.exe"
+OUTVER = "ACAD2018"
+OUTFORMAT = "DXF"
+AUDIT = "1"
+
 def dwg_to_dxf(name: Path):
   
   ''' Convert the DWG file into DXF file format '''
@@ -16,26 +29,15 @@ def dwg_to_dxf(name: Path):
   if not os.path.exists(output_folder):
     os.makedirs(output_folder)
     
-  # Please install Teigha File Converter by copy and paste the as following link in URL:
-  # https://teigha-file-converter.software.informer.com/
-
   # Parameters Setup:
-  # TEIGHA_PATH: Location of .exe file
   # Input folder: Location of input folder
   # Output folder: Location of output folder
-  # Output version: ACAD9, ACAD10, ACAD12, ACAD14, ACAD2000, ACAD2004, ACAD2007, ACAD20010, ACAD2013, ACAD2018
-  # Output file type: DWG, DXF, DXB
   # Recurse Input Folder: 0, 1
-  # Audit each file: 0, 1
   # (Optional) Input files filter: *.DWG, *.DXF
   
-  TEIGHA_PATH = "C:/Program Files (x86)/ODA/Teigha File Converter 4.3.2/TeighaFileConverter.exe"
   INPUT_FOLDER = "./DWG"
   OUTPUT_FOLDER = output_folder
-  OUTVER = "ACAD2018"
-  OUTFORMAT = "DXF"
   RECURSIVE = "1"
-  AUDIT = "1"
   INPUTFILTER = "*.DWG"
 
   # Command to run
@@ -43,3 +45,22 @@ def dwg_to_dxf(name: Path):
 
   # Run
   subprocess.run(cmd, shell=True)
+
+def dxf_path(dwg_file):
+
+  ''' DXF file of the DWG file at the same sub-folder of the DXF folder, the same as the recursive conversion of dwg_to_dxf '''
+
+  return os.path.join('DXF', os.path.splitext(os.path.relpath(dwg_file, 'DWG'))[0] + '.dxf')
+
+def convert_drawing(dwg_file, output_folder):
+
+  ''' Convert one DWG file into the DXF file of the output folder, which is used by the pipeline to convert the drawings one by one '''
+
+  if not os.path.exists(output_folder):
+    os.makedirs(output_folder)
+
+  # The input folder is not recursed, and only the given file passes the input files filter
+  cmd = [TEIGHA_PATH, os.path.dirname(dwg_file) or '.', output_folder, OUTVER, OUTFORMAT, "0", AUDIT, os.path.basename(dwg_file)]
+  subprocess.run(cmd, check=True)
+
+  return os.path.join(output_folder, os.path.splitext(os.path.basename(dwg_file))[0] + '.dxf')
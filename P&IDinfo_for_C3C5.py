@@ -17,6 +17,14 @@ else:
 import ezdxf
 from ezdxf import bbox
 from ezdxf.addons import text2path
+from drawing_catalogue import scan_files
+from drawing_session import DrawingSession
+from line_classifier import LineNumberClassifier, Rule
+from line_pairing import near_points, pair_lines
+from line_register import LineRegister
+from parallel_pool import add_counts, run_ordered, subtract_counts
+from result_store import drawing_key, write_result
+from text_bbox import bbox_cache_stats, text_bbox
 import gc
 import matplotlib
 import os
@@ -24,7 +32,19 @@ import pandas as pd
 from pathlib import Path
 import regex as re
 import subprocess
-import sys
+
+# Define pattern for filters of text entities, all patterns are compiled into one classifier and scanned once per drawing
+pat_full = r'\-[A-Z0-9]{6,8}\-[A-Z]' # -000000[00]-X
+pat_pref_1 = r'\-[A-Z]{1,4}\-[0-9]{6,8}$' # -000000[00]
+pat_suff_1 = r'^\-[A-Z][0-9]' # -X0
+pat_pref_2 = r'\-[A-Z]{1,4}\-[0-9]{6,8}\-$' # -000000[00]-
+pat_suff_2 = r'^[A-Z][0-9]' # X0
+
+line_classifier = LineNumberClassifier([Rule('F', 'F', pat_full, digit=False),
+                                        Rule('P1', 'P', pat_pref_1),
+                                        Rule('S1', 'S', pat_suff_1),
+                                        Rule('P2', 'P', pat_pref_2),
+                                        Rule('S2', 'S', pat_suff_2, requires='')])
 
 # Check whether if the output folder is create
 def dwg_to_dxf():
@@ -68,40 +88,18 @@ def dwg_to_dxf():
 def get_file_list(dir_name):
     
     ''' For the given path, get the List of all files in the directory tree '''
-    
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-    
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-                
-    return all_files
+
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
 
 def get_text_entities(filename):
     
     ''' Open DXF file from input DWG file, and then setup and query the model space of text object from DXF file before extraction '''
     
-    try:
-        doc = ezdxf.readfile(filename)
-    except IOError:
-        print(f"Not a DXF file or a generic I/O error.")
-        sys.exit(1)
-    except ezdxf.DXFStructureError:
-        print(f"Invalid or corrupted DXF file.")
-        sys.exit(2)
-    
-    read_file = ezdxf.readfile(filename) 
-    msp = read_file.modelspace()
-    text = msp.query("TEXT")
+    # The DXF file is streamed only one time (text entities only), and then the text entities are filled into the columnar entity table
+    session = DrawingSession(filename, types=('TEXT',))
+    table = session.entity_table
+    text = table.take(table.is_type("TEXT"))
     
     return text
 
@@ -109,87 +107,55 @@ def text_df(text):
     
     ''' Convert all text objects into dataframe and Filter out the non-piping text object '''
     
-    # Convert the text object into dataframe
-    all_text = [t.dxf.text for t in text]
-    text_id = [t for t in text]
-    text_name = [t.dxf.text for t in text]
-    text_x = [t.dxf.insert[0] for t in text]
-    text_y = [t.dxf.insert[1] for t in text]
-    text_rot = [t.dxf.rotation for t in text]
-    text_dict = {'Text ID':text_id, 'Text Name':text_name, 'Text X':text_x, 'Text Y':text_y, 'Text Rotation':text_rot}
+    # Convert the columns of text entity table into dataframe
+    text_dict = {'Text ID':text.entities, 'Text Name':text['text'], 'Text X':text['x'], 'Text Y':text['y'],
+                 'Text Rotation':text['rotation']}
     text_df = pd.DataFrame(text_dict)
     
     return(text_df)
 
-def cleaned_df(text, text_df):
+def partial_df(text_df, prefix_mask, suffix_mask, pattern):
+    
+    ''' Create the dataframe of the prefix and suffix texts of the partial line pattern (horizontal and vertical texts only) '''
+    
+    linepart_pref = text_df[prefix_mask].assign(Type = pattern, Role = 'P')
+    linepart_suff = text_df[suffix_mask].assign(Type = pattern, Role = 'S')
+    linepart_idx = pd.concat([linepart_pref, linepart_suff], axis=0)
+    linepart_idx = linepart_idx[linepart_idx['Text Rotation'].isin([0, 90])]
+    
+    return linepart_idx
+
+def cleaned_df(text, text_df, bbox_mode='path'):
     
     ''' Clean the import line dataframe into the proper and neat format '''
     
+    # Label all text names with the line number patterns in a single scan
+    labels = line_classifier.classify(text_df['Text Name'])
+    
     # Filter the complete line
-    pat_full = r'\-[A-Z0-9]{6,8}\-[A-Z]' # -000000[00]-X
-    linefull_idx = text_df[text_df['Text Name'].str.contains(pat_full)].reset_index(drop=True)
+    linefull_idx = text_df[labels['F']].reset_index(drop=True)
     linefull_idx = linefull_idx.assign(Type = 'F')
     linefull_idx.sort_values('Text Rotation', ascending=[True], inplace=True)
     linefull_idx = linefull_idx.reset_index(drop=True)
 
     # Filter the partial incomplete line pattern 1
-    pat_pref_1 = r'\-[A-Z]{1,4}\-[0-9]{6,8}$' # -000000[00]
-    pat_suff_1 = r'^\-[A-Z][0-9]' # -X0
-    linepart_pref_1 = text_df[text_df['Text Name'].str.contains(pat_pref_1)]
-    linepart_pref_1 = linepart_pref_1.assign(Type = 'P')
-    linepart_suff_1 = text_df[text_df['Text Name'].str.contains(pat_suff_1)]
-    linepart_suff_1 = linepart_suff_1.assign(Type = 'S')
-    linepart_idx_1 = pd.concat([linepart_pref_1, linepart_suff_1], axis=0, ignore_index=True, verify_integrity=True)
-    linepart_idx_1 = linepart_idx_1.assign(Length = linepart_idx_1['Text Name'].str.len())
-    linepart_idx_1.sort_values('Text Rotation', ascending=[True], inplace=True)
-    linepart_idx_1h = linepart_idx_1[linepart_idx_1['Text Rotation'] == 0].sort_values(['Text X','Text Y'], ascending=[True,True])
-    linepart_idx_1v = linepart_idx_1[linepart_idx_1['Text Rotation'] == 90].sort_values(['Text Y','Text X'], ascending=[True,True])
-    linepart_idx_1 = pd.concat([linepart_idx_1h, linepart_idx_1v], axis=0, ignore_index=True, verify_integrity=True)
-    linepart_idx_1 = linepart_idx_1.assign(Type = 'P1')
+    linepart_idx_1 = partial_df(text_df, labels['P1'], labels['S1'], 'P1')
 
     # Filter the partial incomplete line pattern 2
-    pat_pref_2 = r'\-[A-Z]{1,4}\-[0-9]{6,8}\-$' # -000000[00]-
-    pat_suff_2 = r'^[A-Z][0-9]' # X0
-    linepart_pref_2 = text_df[text_df['Text Name'].str.contains(pat_pref_2)]
-    linepart_pref_2 = linepart_pref_2.assign(Type = 'P')
-    linepart_suff_2 = text_df[text_df['Text Name'].str.contains(pat_suff_2)]
-    linepart_suff_2 = linepart_suff_2.assign(Type = 'S')
-    linepart_idx_2 = pd.concat([linepart_pref_2, linepart_suff_2], axis=0, ignore_index=True, verify_integrity=True)
-    linepart_idx_2 = linepart_idx_2.assign(Length = linepart_idx_2['Text Name'].str.len())
-    linepart_idx_2.sort_values('Text Rotation', ascending=True, inplace=True)
+    linepart_idx_2 = partial_df(text_df, labels['P2'], labels['S2'], 'P2')
 
     # Check whether if the text objects in pattern 2 are piping line text or not
-    if sum(linepart_idx_2.Type == 'P') == 0:
-        linepart_idx_2.drop(labels=linepart_idx_2.index, axis=0, inplace=True) 
-    else :
-        linepart_idx_2h = linepart_idx_2[linepart_idx_2['Text Rotation'] == 0]
-        linepart_idx_2h = linepart_idx_2h[linepart_idx_2h.duplicated('Text X', keep=False)]
-        linepart_idx_2h.sort_values(['Text X','Text Y'], ascending=[True,True], inplace=True)
-        linepart_idx_2v = linepart_idx_2[linepart_idx_2['Text Rotation'] == 90]
-        linepart_idx_2v = linepart_idx_2v[linepart_idx_2v.duplicated('Text Y', keep=False)]
-        linepart_idx_2v.sort_values(['Text Y','Text X'], ascending=[True,True], inplace=True)
-        linepart_idx_2 = pd.concat([linepart_idx_2h, linepart_idx_2v], axis=0, ignore_index=True, verify_integrity=True)
-        linepart_idx_2 = linepart_idx_2.assign(Type = 'P2')
-
-    linepart_idx = pd.concat([linepart_idx_1,linepart_idx_2], axis=0, ignore_index=True, verify_integrity=True)
-
-    # Sort the partial incomplete line for both pattern
-    even = linepart_idx.loc[linepart_idx.index % 2 == 0,].reset_index()
-    odd = linepart_idx.loc[linepart_idx.index % 2 == 1,].reset_index()
-    cond = even.Length - odd.Length
-
-    for i in cond.index:
-        if cond[i] < 0:
-            even.loc[i,'index'] += 1
-            odd.loc[i,'index'] -= 1
-
-    linepart_idx = pd.concat([even,odd], axis=0, ignore_index=True, verify_integrity=True)
-    linepart_idx.drop('Length', axis=1, inplace=True)
-    linepart_idx.sort_values('index', ascending=True, inplace=True)
-    linepart_idx.set_index('index', inplace=True)
+    if sum(linepart_idx_2.Role == 'P') == 0:
+        linepart_idx_2.drop(labels=linepart_idx_2.index, axis=0, inplace=True)
+    else:
+        # Keep only the suffix texts, which are located around the prefix texts (before calculating the bounding boxes)
+        prefix = linepart_idx_2[linepart_idx_2.Role == 'P']
+        radius = (prefix['Text Name'].str.len() + 16) * text['height'][prefix.index]
+        near = near_points(prefix[['Text X','Text Y']].to_numpy(), radius, linepart_idx_2[['Text X','Text Y']].to_numpy())
+        linepart_idx_2 = linepart_idx_2[near | (linepart_idx_2.Role == 'P')]
 
     # Append the complete and partial dataframe
-    line_list = pd.concat([linefull_idx,linepart_idx], axis=0, ignore_index=True, verify_integrity=True)
+    line_list = pd.concat([linefull_idx,linepart_idx_1,linepart_idx_2], axis=0, ignore_index=True, verify_integrity=True)
 
     # Extract the text box into 'listExt' dataframe
     line_idx = []
@@ -201,17 +167,17 @@ def cleaned_df(text, text_df):
     line_up_right_x = []
     line_up_right_y = []
     
-    for t in text:
-        if(t.dxf.text in line_list['Text Name'].to_list()):
-            bbox = ezdxf.path.bbox(text2path.make_paths_from_entity(t))
-            line_idx.append(t)
-            line_name.append(t.dxf.text)
-            line_width.append(bbox.size.x)
-            line_height.append(bbox.size.y)
-            line_low_left_x.append(bbox.extmin[0])
-            line_low_left_y.append(bbox.extmin[1])
-            line_up_right_x.append(bbox.extmax[0])
-            line_up_right_y.append(bbox.extmax[1])
+    # Only the candidate text entities of the line list are converted into the bounding box
+    for t, name in dict(zip(line_list['Text ID'], line_list['Text Name'])).items():
+        bbox = text_bbox(t, bbox_mode)
+        line_idx.append(t)
+        line_name.append(name)
+        line_width.append(bbox.size.x)
+        line_height.append(bbox.size.y)
+        line_low_left_x.append(bbox.extmin[0])
+        line_low_left_y.append(bbox.extmin[1])
+        line_up_right_x.append(bbox.extmax[0])
+        line_up_right_y.append(bbox.extmax[1])
 
     line_ext = pd.DataFrame(list(zip(line_idx, line_name, line_width, line_height, line_low_left_x, line_low_left_y, line_up_right_x, line_up_right_y)),
                            columns=['Text ID','Text Name','Text Width','Text Height','LowerLeft X','LowerLeft Y','UpperRight X','UpperRight Y'])
@@ -234,11 +200,63 @@ def cleaned_df(text, text_df):
         else:
             line_all.loc[i,'Text Name'] = line_all.loc[i,'Text Name'].rstrip()
     
+    # Pair the prefix and suffix texts of each partial pattern with the spatial index, and then merge them into the full line number
+    box = ['LowerLeft X','LowerLeft Y','UpperRight X','UpperRight Y']
+    line_full = line_all[line_all.Type == 'F']
+    line_full = line_full.assign(**{'Pair': -1, 'Line Name': line_full['Text Name']}, **{'Line ' + c: line_full[c] for c in box})
+    line_part_1 = line_all[line_all.Type == 'P1']
+    line_part_1 = pair_lines(line_part_1, line_part_1.Role, name='Text Name', rotation='Text Rotation', box=box)
+    line_part_2 = line_all[line_all.Type == 'P2']
+    
+    # The pairs of pattern 2 are numbered after the pairs of pattern 1, so each pair number is unique in the drawing
+    line_part_2 = pair_lines(line_part_2, line_part_2.Role, name='Text Name', rotation='Text Rotation', box=box,
+                             start=(line_part_1.Pair >= 0).sum() // 2)
+    
+    # The texts of pattern 2 are piping line texts only if they are paired
+    line_part_2 = line_part_2[line_part_2.Pair >= 0]
+    
+    line_all = pd.concat([line_full,line_part_1,line_part_2], axis=0, ignore_index=True)
+    line_all.drop('Role', axis=1, inplace=True)
+    
     return line_all
 
-def info_extract_pid(name: Path):
+def extraction_stats():
+    
+    ''' Statistics of the line number classifier and the text bounding box cache in the current process '''
+    
+    # Only the counts are kept, so the statistics of all workers can be added up
+    cache_stats = {cache: {key: value for key, value in counts.items() if key not in ('Size','Max Size')}
+                   for cache, counts in bbox_cache_stats().items()}
+    
+    return {'Line number pattern hits': line_classifier.report(), 'Text bounding box cache': cache_stats}
+
+def extract_drawing(filename, bbox_mode='path'):
+    
+    ''' Extract the line list of one DXF file, the worker of the process pool
+    
+    Return the compact result (the entity IDs are converted into text) and the statistics of this drawing '''
     
-    ''' Extract the information from the DWG file in the folder, and then save the relevant information into *.csv file '''
+    stats = extraction_stats()
+    
+    text = get_text_entities(filename)
+    all_line_df = text_df(text)
+    clean_df = cleaned_df(text, all_line_df, bbox_mode)
+    clean_df['Text ID'] = clean_df['Text ID'].astype(str)
+    
+    # Add the filename
+    listname = re.split(r'\\|\.', filename)
+    file = listname[-2]
+    clean_df = clean_df.assign(Filename = file)
+    
+    return clean_df, subtract_counts(extraction_stats(), stats)
+
+def info_extract_pid(name: Path, bbox_mode='path', workers=1, store=False, register=False):
+    
+    ''' Extract the information from the DWG file in the folder, and then save the relevant information into *.csv file
+    
+    workers: number of worker processes (None for all CPU cores), the drawings are spread across the process pool
+    store: also write the result of each drawing into the Parquet result store ('.\\Results\\c3c5'), partitioned by plant and drawing
+    register: also upsert the line numbers of each drawing into the line register ('.\\LineRegister.sqlite') '''
     
     # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
     os.chdir(name)
@@ -254,16 +272,26 @@ def info_extract_pid(name: Path):
     print('Information extraction is proceeding.')
     
     list_files = get_file_list('DXF')
+    line_register = LineRegister() if register else None
+    stats = {}
+    failures = []
     
-    for filename in list_files:
-        text = get_text_entities(filename)
-        all_line_df = text_df(text)
-        clean_df = cleaned_df(text, all_line_df)
+    # The results are returned in the order of the files, so the CSV files are written deterministically
+    for idx, result, failure in run_ordered(extract_drawing, [(filename, bbox_mode) for filename in list_files], workers=workers,
+                                            desc='Drawings'):
+        filename = list_files[idx]
+        
+        # A failed drawing is reported, and the batch goes on with the next drawing
+        if failure is not None:
+            failures.append(failure)
+            print('Failed drawing:', filename, failure.error)
+            continue
+        
+        clean_df, drawing_stats = result
+        add_counts(stats, drawing_stats)
         
-        # Add the filename
         listname = re.split(r'\\|\.', filename)
         file = listname[-2]
-        clean_df = clean_df.assign(Filename = file)
         
         # Define related parameters and check the existing save folder
         list_folders = os.listdir('.\\DXF')
@@ -285,8 +313,18 @@ def info_extract_pid(name: Path):
             saveinfo_path = save_folder+'\\'+file+'.csv'
         
         clean_df.to_csv(saveinfo_path)
+        if store:
+            write_result(clean_df, 'c3c5', os.path.basename(os.getcwd()), drawing_key(filename, 'DXF'))
+        if line_register is not None:
+            line_register.register(clean_df, os.path.basename(os.getcwd()), drawing_key(filename, 'DXF'), 'c3c5')
         print('Saving location of file:', saveinfo_path)
         
+    for key, value in stats.items():
+        print(key+':', value)
+    if len(failures) != 0:
+        print(f'{len(failures)} drawing(s) failed:', [failure.task[0] for failure in failures])
+    if line_register is not None:
+        line_register.close()
     print('\n','Complete!!!')
     gc.collect()
     
@@ -297,5 +335,7 @@ DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Projec
 # Testing!!!
 # Ensure the working directory before executing!!!
 # All drawing file must be located in the 'DWG' sub-folder
+# Set workers=None to spread the drawings across all CPU cores
 
-info_extract_pid(DIR)
+if __name__ == '__main__':
+    info_extract_pid(DIR)
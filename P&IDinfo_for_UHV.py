@@ -1,4 +1,5 @@
 import importlib.util
+import subprocess
 import sys
 
 # For illustrative purposes.
@@ -14,19 +15,43 @@ elif (spec := importlib.util.find_spec(name)) is not None:
 else:
     print(f"can't find the {name!r} module")
     print(f"installation {name!r} is proceeding...")
-    !pip3 install ezdxf[draw]
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'ezdxf[draw]'])
 
 import ezdxf
 from ezdxf import bbox
 from ezdxf.addons import text2path
+from drawing_catalogue import DrawingCatalogue, ensure_folder, reset_folders, scan_files
+from drawing_session import DrawingSession
+from frame_detection import drawing_hash, frame_dimension as detect_frame_dimension
+from line_classifier import LineNumberClassifier, Rule
+from line_pairing import line_boxes, pair_lines
+from line_register import LineRegister
+from parallel_pool import add_counts, run_ordered, subtract_counts
+from raster_transform import SIDECAR_FOLDER, adjust_boxes, assign_boxes, box_array, raster_transform, ratio_transform, sidecar_path, transform_boxes
+from result_store import drawing_key, result_file, write_result
+from run_manifest import RunManifest
+from streaming_loader import EXTRACTION_TYPES
+from text_bbox import bbox_cache_stats, text_bbox
 import gc
 import matplotlib
+import numpy as np
 import os
 import pandas as pd
 from pathlib import Path
 import regex as re
-import subprocess
-import sys
+
+# Define pattern for filters of text entities, all patterns are compiled into one classifier and scanned once per drawing
+pat_full = r'.*\d\"\-[A-Z]{1,4}\-[A-Z\d]{6,8}\-[A-Z].*' # 00"-XXXX-000000[00]-X
+pat_pref1 = r'\-[A-Z]{1,4}\-[0-9]{6,8}$' # -000000[00]
+pat_suff1 = r'^\-[A-Z][0-9]' # -X0
+pat_pref2 = r'(\"\-[A-Z]{1,4}\-$)|(\"\-[A-Z]{1,4}$)' # 0"-XXXX-
+pat_suff2 = r'(^[0-9]{6,8}\-[A-Z][0-9])|(^\-[0-9]{6,8}\-[A-Z][0-9])' # 000000[00]-
+
+line_classifier = LineNumberClassifier([Rule('F', 'F', pat_full, requires='"-'),
+                                        Rule('P1', 'P', pat_pref1),
+                                        Rule('S1', 'S', pat_suff1),
+                                        Rule('P2', 'P', pat_pref2, requires='"-', digit=False),
+                                        Rule('S2', 'S', pat_suff2)])
 
 # Check whether if the output folder is create
 def dwg_to_dxf():
@@ -71,149 +96,25 @@ def get_file_list(dir_name):
   
     ''' For the given path, get the List of all files in the directory tree '''
 
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-
-    return all_files
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
  
-def get_modelspace(filename):
-    
-    ''' Open DXF file from input DWG file, and then setup and query the model space of text object from DXF file before extraction '''
+def get_modelspace(filename, bbox_mode='path'):
     
-    try:
-        doc = ezdxf.readfile(filename)
-    except IOError:
-        print(f"Not a DXF file or a generic I/O error.")
-        sys.exit(1)
-    except ezdxf.DXFStructureError:
-        print(f"Invalid or corrupted DXF file.")
-        sys.exit(2)
+    ''' Open DXF file once, and then create the drawing session, which shares the model space queries and the frame dimension between the extraction stages '''
     
-    doc = ezdxf.readfile(filename)
-    model_space = doc.modelspace()
+    # bbox_mode: 'path' (exact outline by text2path) or 'metric' (fast font metrics) for the text bounding boxes
+    # Only the texts, inserts and frame geometry are streamed from the model space, the blocks are loaded when they are referenced
+    session = DrawingSession(filename, frame_func=frame_dimension, bbox_mode=bbox_mode, types=EXTRACTION_TYPES)
         
-    return model_space
+    return session
 
 def frame_dimension(model_space):
     
-    ''' Calculate the drawing frame dimension (width x height) '''
-    
-    frame_name_list = ['CCP_A1_Template FOR PID-20180103','CCP_A1_Template FOR PID','CCP_A1_Template FOR PID-REV.0',
-                       'CCP_A1_Template FOR UDD','FW TIT','Title Block-UHV-01','gtdf','A$C46B42D60']
+    ''' Calculate the drawing frame dimension (width x height), the result is memoized per drawing content hash '''
     
-    if len( [i for i in model_space.query('3DFACE')] ) != 0:
-    
-        face3d = model_space.query('3DFACE')
-
-        frame_idx = []
-        frame_width = []
-        frame_height = []
-        frame_originate = []
-
-        for e in face3d:
-            frame_idx.append(e)
-            frame_width.append( round(abs(e.dxf.vtx2[0] - e.dxf.vtx0[0]),4) )
-            frame_height.append( round(abs(e.dxf.vtx2[1] - e.dxf.vtx0[1]),4) )
-            originate = min(e.dxf.vtx0, e.dxf.vtx1, e.dxf.vtx2, e.dxf.vtx3)
-            frame_originate.append( (round(originate[0],4),round(originate[1],4)) )
-
-        face3d_df = pd.DataFrame(list(zip(frame_idx, frame_width, frame_height, frame_originate)),
-                                 columns=['Frame Index','Frame Width','Frame Height','Frame Originate'])
-
-        face3d_df['Distance'] = ( (face3d_df['Frame Width'])**2 + (face3d_df['Frame Height'])**2)**0.5
-        idx = face3d_df['Distance'].argmax()
-        frame_dim = face3d_df.iloc[idx,1:4].to_dict()
-        pass
-    
-    elif len( [insert for insert in model_space.query('INSERT') if (insert.dxf.name in frame_name_list)] ) != 0:
-        
-        inserts = model_space.query('INSERT')
-        cache = bbox.Cache()
-        framebbox = BoundingBox2d( bbox.extents(inserts, cache=cache) )
-        
-        frame_idx = [insert.dxf.handle for insert in inserts if (insert.dxf.name in frame_name_list)]
-        frame_width = [ round( abs(framebbox.extmax[0] - framebbox.extmin[0]), 4) ]
-        frame_height = [ round( abs(framebbox.extmax[1] - framebbox.extmin[1]), 4) ]
-        frame_originate = [ (round(framebbox.extmin[0],4), round(framebbox.extmin[1],4)) 
-                           for insert in inserts if (insert.dxf.name in frame_name_list) ]
-        
-        frame_df = pd.DataFrame(list(zip(frame_idx, frame_width, frame_height, frame_originate)), 
-                                columns=['Frame Index','Frame Width','Frame Height','Frame Originate'])
-        
-        frame_df['Distance'] = ( (frame_df['Frame Width'])**2 + (frame_df['Frame Height'])**2)**0.5
-        idx = frame_df['Distance'].argmax()
-        frame_dim = frame_df.iloc[idx,1:4].to_dict()
-        
-    else:
-        lwpolylines = model_space.query('LWPOLYLINE')
-        
-        lwpolyline_idx = []
-        lwpolyline_width = []
-        lwpolyline_height = []
-        lwpolyline_originate = []
-
-        for e in lwpolylines:
-            if (e.dxf.flags == 1) & (e.__len__() == 4):
-                lwpolyline_idx.append(e.dxf.handle)
-                lwpolyline_width.append( round(abs(e.get_points(format='xy')[3][0] - e.get_points(format='xy')[1][0]),4) )
-                lwpolyline_height.append( round(abs(e.get_points(format='xy')[3][1] - e.get_points(format='xy')[1][1]),4) )
-                originate = list( min(e.get_points(format='xy')[0], e.get_points(format='xy')[1],
-                                      e.get_points(format='xy')[2], e.get_points(format='xy')[3]) )
-                lwpolyline_originate.append( (round(originate[0],4),round(originate[1],4)) )
-
-        lwpolyline_df = pd.DataFrame(list(zip(lwpolyline_idx, lwpolyline_width, lwpolyline_height, lwpolyline_originate)),
-                                         columns=['Frame Index','Frame Width','Frame Height','Frame Originate'])
-
-        lwpolyline_df['Distance'] = ( (lwpolyline_df['Frame Width'])**2 + (lwpolyline_df['Frame Height'])**2)**0.5
-        lwpolyline_idx = lwpolyline_df['Distance'].argmax()
-        lwpolyline_dim = pd.Series(lwpolyline_df.iloc[lwpolyline_idx,1:4])
-
-        lines = model_space.query('LINE')
-        
-        line_idx = []
-        line_starts_x = []
-        line_starts_y = []
-        line_ends_x = []
-        line_ends_y = []
-
-        for line in lines:
-            starts = line.dxf.start
-            ends = line.dxf.end
-            if (ends[1] - starts[1]) == 0:
-                line_idx.append(line.dxf.handle)
-                line_starts_x.append(starts[0])
-                line_starts_y.append(starts[1])
-                line_ends_x.append(ends[0])
-                line_ends_y.append(ends[1])
-
-        line_df = pd.DataFrame(list(zip(line_idx, line_starts_x, line_starts_y, line_ends_x, line_ends_y)),
-                                         columns=['Frame Index','Frame Sx','Frame Sy','Frame Ex','Frame Ey'])
-
-        lowleft = line_df.sort_values(['Frame Sx','Frame Sy'], ascending=[True, True])[0:1].squeeze()[1:3]
-        lowleft = [round(s, 4) for s in lowleft]
-        upright = line_df.sort_values(['Frame Ex','Frame Ey'], ascending=[False, False])[0:1].squeeze()[3:]
-        upright = [round(s, 4) for s in upright]
-
-        line_dict = {'Frame Width': round(upright[0] - lowleft[0], 4),
-                     'Frame Height': round(upright[1] - lowleft[1], 4),
-                     'Frame Originate': tuple(lowleft)}
-
-        line_dim = pd.Series(line_dict)
-
-        frame_dim = pd.DataFrame([lwpolyline_dim, line_dim]).sort_values('Frame Width', ascending=False).reset_index(drop=True)
-        frame_dim = frame_dim.iloc[0].to_dict()
+    # The candidate frame geometry is pulled out in one pass, and then the largest frame is picked with vectorized math
+    frame_dim = detect_frame_dimension(model_space.modelspace, filename=model_space.filename)
 
     return frame_dim
 
@@ -224,117 +125,73 @@ def text_rotation_cleansing(text_df):
     idx_h = (text_df['Rotation'] != 0) & ((text_df['Rotation'] > -10) | (text_df['Rotation'] > 350)) & (text_df['Rotation'] < 10)
     idx_v = (text_df['Rotation'] != 90) & (text_df['Rotation'] > 80) & (text_df['Rotation'] < 100)
     
-    # Checking whether if there is any abnormal text rotation in the horizontal orientation (0')
-    for h in text_df[idx_h].index:  
-        if text_df.loc[idx_h].shape[0] != 0:
-            text_df.loc[h,'Rotation'] = round(0.0,-1)
-    
-    # Checking whether if there is any abnormal text rotation in the vertical orientation (90')        
-    for v in text_df[idx_v].index:
-        if text_df.loc[idx_v].shape[0] != 0:
-            text_df.loc[v,'Rotation'] = round(90.0,-1)
+    # Correct the abnormal text rotation in the horizontal (0') and the vertical (90') orientation
+    text_df.loc[idx_h,'Rotation'] = 0.0
+    text_df.loc[idx_v,'Rotation'] = 90.0
             
     return text_df
 
-def round_up(n, decimals=0):
-    multiplier = 10 ** decimals
-    return math.ceil(n * multiplier) / multiplier
-
-def round_down(n, decimals=0):
-    multiplier = 10 ** decimals
-    return math.floor(n * multiplier) / multiplier
+# Rounding and padding of the coordinate ratio per text pattern: {rotation: (rounding, padding)}, which have one item per box
+# column (LowLeft X, LowLeft Y, UpRight X, UpRight Y)
+BOX_ADJUSTMENTS = {
+    'I': {0: (('round',)*4, (0.001, 0, -0.001, 0.001)), 90: (('round',)*4, (0, 0.001, 0, -0.001))},
+    'F': {0: (('round',)*4, (-0.002, 0, -0.005, 0)), 90: (('round',)*4, (0, -0.001, 0, -0.01))},
+    'P1': {0: (('round',)*4, (-0.001, 0, -0.002, 0)), 90: (('round',)*4, (0, -0.001, 0, -0.002))},
+    'P2': {0: (('up','down','down','up'), (-0.002, 0, -0.001, 0)), 90: (('down','up','up','down'), (0, -0.001, 0, -0.002))},
+}
 
 def entities_dim_transform_ratio(frame_dim, entities_df):
     
     ''' Transform the coordinate in the dxf file in to ratio value before convert to the rasterized coordinate '''
-            
-    entities_df_ratio = entities_df.copy()
-
-    lowleft_x = [ (lowleft_x - frame_dim['Frame Originate'][0]) / frame_dim['Frame Width'] for lowleft_x, lowleft_y in entities_df_ratio['LowLeft']]
-    lowleft_y = [ (lowleft_y - frame_dim['Frame Originate'][1]) / frame_dim['Frame Height'] for lowleft_x, lowleft_y in entities_df_ratio['LowLeft']]
-    upright_x = [ (upright_x - frame_dim['Frame Originate'][0]) / frame_dim['Frame Width'] for upright_x, upright_y in entities_df_ratio['UpRight']]
-    upright_y = [ (upright_y - frame_dim['Frame Originate'][1]) / frame_dim['Frame Height'] for upright_x, upright_y in entities_df_ratio['UpRight']]
-
-    entities_df_ratio['LowLeft'] = tuple(zip(lowleft_x, lowleft_y))
-    entities_df_ratio['UpRight'] = tuple(zip(upright_x, upright_y))
     
-    return entities_df_ratio
-
-def translation_matrix(x: float, y: float) -> np.ndarray:
-    m = np.eye(3)
-    m[0, 2] = x
-    m[1, 2] = y
-    return m
-
-def scale_matrix(x: float, y: float) -> np.ndarray:
-    return np.diag((x, y, 1))
-
-def get_wcs_to_image_transform(ax: plt.Axes, image_size: Tuple[int, int]) -> np.ndarray:
-    x1, x2 = ax.get_xlim()
-    y1, y2 = ax.get_ylim()
-    data_width, data_height = x2 - x1, y2 - y1
-    image_width, image_height = image_size
-    # +1 to counteract the effect of the pixels being flipped in y
-    return (translation_matrix(0, image_height + 1) @
-            scale_matrix(image_width / data_width, -image_height / data_height) @
-            translation_matrix(-x1, -y1))
-
-def transform_point(x:float, y: float, m: np.ndarray) -> Tuple[float, float]:
-    return tuple((m @ [x, y, 1])[:2].tolist())
+    # All bounding boxes are transformed by one matrix operation
+    boxes = transform_boxes(box_array(entities_df), ratio_transform(frame_dim))
+    
+    return assign_boxes(entities_df, boxes)
 
-def entities_dim_transform_raster(raster_file, entities_df_scale):
+def entities_box_adjust(entities_ratio, pattern):
     
-    ''' Transform the scale coordinate ratio from dxf file into coordinate for raster file '''
+    ''' Round and pad the coordinate ratio of the bounding boxes by the text pattern and rotation '''
     
-    # Calculate the transform matrix for coordinate conversion from dxf to raster file
-    fig = plt.figure()
-    ax = fig.add_axes([0, 0, 1, 1])
-    img = Image.open(raster_file)
-    m = get_wcs_to_image_transform(ax, img.size)
-    plt.close()
+    boxes = adjust_boxes(box_array(entities_ratio), entities_ratio['Rotation'], BOX_ADJUSTMENTS[pattern])
     
-    entities_df_raster = entities_df_scale.copy()
-    lowleft = [[x,y] for x,y in entities_df_raster['LowLeft']]
-    upright = [[x,y] for x,y in entities_df_raster['UpRight']]
+    return assign_boxes(entities_ratio, boxes)
+
+def entities_dim_transform_raster(raster_file, entities_df_scale, frame_dim=None):
     
-    for i in entities_df_raster.index:  
-        lowleft[i] = transform_point(lowleft[i][0], lowleft[i][1], m)
-        upright[i] = transform_point(upright[i][0], upright[i][1], m)
+    ''' Transform the scale coordinate ratio from dxf file into coordinate for raster file '''
     
-    entities_df_raster['LowLeft'] = tuple(lowleft)
-    entities_df_raster['UpRight'] = tuple(upright)
+    # Calculate the transform matrix for coordinate conversion from dxf to raster file by the sidecar of the rasterizer,
+    # otherwise only the image header is read
+    m = raster_transform(raster_file, frame_dim)
     
-    entities_df_raster['LowLeft'] = tuple([np.round(each_arr, decimals=3) for each_arr in entities_df_raster['LowLeft']])
-    entities_df_raster['UpRight'] = tuple([np.round(each_arr, decimals=3) for each_arr in entities_df_raster['UpRight']])
+    boxes = np.round(transform_boxes(box_array(entities_df_scale), m), decimals=3)
     
-    return entities_df_raster
+    return assign_boxes(entities_df_scale, boxes)
 
 def piping_insert_full(modelspace):
     
     ''' Extract the bounding box coordinate ratio from insert entities in the model space from DXF file '''    
     
-    inserts = modelspace.query('INSERT')
-    frame_dim = frame_dimension(modelspace)
+    table = modelspace.entity_table
+    frame_dim = modelspace.frame_dim
     prefixes = ['Pipeline', 'LINE NO']
     
-    # Define entities list for verification with criteria condition
-    insert_id = [insert for insert in inserts if insert.dxf.name.startswith(tuple(prefixes))]
+    # Define entities list for verification with criteria condition (the attributes of the piping inserts)
+    insert_mask = table.is_type('INSERT') & table.startswith('block', prefixes)
+    attrib_mask = table.is_type('ATTRIB') & insert_mask[np.maximum(table['owner'], 0)] & (table['text'] != ' ')
     
     # Verify the text availability from insert entities, if criteria was met, then create the insert dataframe
-    if len(insert_id) == 0:
-        insert_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight'])
+    if insert_mask.sum() == 0:
+        insert_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight','Pair','Line Name'])
     else:
-        insert_name = [attrib.dxf.text for insert in inserts if insert.dxf.name.startswith(tuple(prefixes)) for attrib in insert.attribs]
-        insert_name = [name for name in insert_name if name != ' ']
-        insert_x = [round(insert.dxf.insert[0],3) for insert in inserts if insert.dxf.name.startswith(tuple(prefixes))]
-        insert_y = [round(insert.dxf.insert[1],3) for insert in inserts if insert.dxf.name.startswith(tuple(prefixes))]
-        insert_rot = [float(insert.dxf.rotation) for insert in inserts if insert.dxf.name.startswith(tuple(prefixes))]
-        insert_scale_x = [float(insert.dxf.xscale) for insert in inserts if insert.dxf.name.startswith(tuple(prefixes))]
-        insert_scale_y = [float(insert.dxf.yscale) for insert in inserts if insert.dxf.name.startswith(tuple(prefixes))]
-        insert_dict = {'ID':insert_id, 'Name':insert_name, 'Text X':insert_x, 'Text Y':insert_y, 'Rotation':insert_rot,
-                      'Text Scale X':insert_scale_x, 'Text Scale Y':insert_scale_y}
+        owner = table['owner'][attrib_mask]
+        insert_dict = {'ID':table.entities[owner], 'Name':table['text'][attrib_mask],
+                       'Text X':np.round(table['x'][owner],3), 'Text Y':np.round(table['y'][owner],3),
+                       'Rotation':table['rotation'][owner],
+                       'Text Scale X':table['xscale'][owner], 'Text Scale Y':table['yscale'][owner]}
         insert_df = pd.DataFrame(insert_dict)
-        insert_df = insert_df.assign(Type = 'I', Pattern = 'F')
+        insert_df = insert_df.assign(**{'Type': 'I', 'Pattern': 'F', 'Pair': -1, 'Line Name': insert_df['Name'].str.rstrip()})
         
         # Clean the text rotation column
         insert_df = text_rotation_cleansing(insert_df)
@@ -353,21 +210,19 @@ def piping_insert_full(modelspace):
         insert_width = []
         insert_height = []
 
-        for insert in inserts:
-            if(insert.dxf.name.startswith(tuple(prefixes))):
-                for attrib in insert.attribs:
-                    if attrib.dxf.text != ' ':
-                        bbox = ezdxf.path.bbox(text2path.make_paths_from_entity(attrib))
-                        insert_idx.append(insert)
-                        insert_text.append(attrib.dxf.text)
-                        insert_rot.append(insert.dxf.rotation)
-
-                        if insert.dxf.rotation == 0: # Horizontal orientation
-                            insert_width.append( (bbox.size.x/scale_x) - 3 )
-                            insert_height.append( (bbox.size.y/scale_y) )
-                        else : # Vertical orientation
-                            insert_width.append( (bbox.size.x/scale_x) )
-                            insert_height.append( (bbox.size.y/scale_y) - 2 )
+        for attrib, insert, text, rotation in zip(table.entities[attrib_mask], insert_dict['ID'], insert_dict['Name'],
+                                                  insert_dict['Rotation']):
+            bbox = text_bbox(attrib, modelspace.bbox_mode)
+            insert_idx.append(insert)
+            insert_text.append(text)
+            insert_rot.append(rotation)
+
+            if rotation == 0: # Horizontal orientation
+                insert_width.append( (bbox.size.x/scale_x) - 3 )
+                insert_height.append( (bbox.size.y/scale_y) )
+            else : # Vertical orientation
+                insert_width.append( (bbox.size.x/scale_x) )
+                insert_height.append( (bbox.size.y/scale_y) - 2 )
 
         insert_ext = pd.DataFrame(list(zip(insert_idx, insert_text, insert_rot, insert_width, insert_height)),
                                   columns=['ID','Name','Rotation','Text Width','Text Height'])
@@ -387,43 +242,33 @@ def piping_insert_full(modelspace):
         insert_all.drop(['Text X','Text Y','Text Scale X','Text Scale Y','Text Width','Text Height'], axis=1, inplace=True)
         
         # Remove the incorrect piping text pattern
-        pat_full = r'.*\d\"\-[A-Z]{1,4}\-[A-Z\d]{6,8}\-[A-Z].*' # 00"-XXXX-000000[00]-X
-        insert_all = insert_all[insert_all.Name.str.contains(r'.*\d\"\-[A-Z]{1,4}\-[A-Z\d]{6,8}\-[A-Z].*', regex=True)]
+        insert_all = insert_all[line_classifier.classify(insert_all.Name)['F']]
         insert_all = insert_all.reset_index(drop=True)
         
         # Transform the coordinate of dxf file into ratio value
         insert_ratio = entities_dim_transform_ratio(frame_dim, insert_all)
         
-        # Transform the coordinate ratio in the dxf file by scaling value        
-        lowleft = [[x,y] for x,y in insert_ratio['LowLeft']]
-        upright = [[x,y] for x,y in insert_ratio['UpRight']]
-
-        for i in insert_ratio[insert_ratio['Rotation'] == 0].index:
-            lowleft[i][0] = round(lowleft[i][0], 3) + 0.001
-            lowleft[i][1] = round(lowleft[i][1], 3)
-            upright[i][0] = round(upright[i][0], 3) - 0.001
-            upright[i][1] = round(upright[i][1], 3) + 0.001
-
-        for j in insert_ratio[insert_ratio['Rotation'] == 90].index:
-            lowleft[j][0] = round(lowleft[j][0], 3)
-            lowleft[j][1] = round(lowleft[j][1], 3) + 0.001
-            upright[j][0] = round(upright[j][0], 3)
-            upright[j][1] = round(upright[j][1], 3) - 0.001
-
-        insert_ratio['LowLeft'] = tuple(lowleft)
-        insert_ratio['UpRight'] = tuple(upright)        
+        # Round and pad the coordinate ratio by the text rotation
+        insert_ratio = entities_box_adjust(insert_ratio, 'I')
         
     return insert_ratio
 
-def text_bbox_wh(text_modelspace, text_df):
+def text_pattern_df(table, mask, pattern):
+    
+    ''' Create the text dataframe from the selected rows of the entity table '''
+    
+    text_dict = {'ID':table.entities[mask], 'Name':table['text'][mask], 'Rotation':table['rotation'][mask]}
+    text_df = pd.DataFrame(text_dict).assign(Type = 'T', Pattern = pattern)
+    
+    return text_df
+
+def text_bbox_wh(text_df, bbox_mode='path'):
     
     ''' Calculate the width and height with adjustment of bounding box for insert entities '''
     
     if text_df.shape[0] == 0:
-        text_ext = pd.DataFrame(columns=['ID','Name','Rotation','Text Width','Text Height','LowLeft X','LowLeft Y','Distance'])
+        text_ext = pd.DataFrame(columns=['ID','Name','Rotation','Text Width','Text Height','LowLeft X','LowLeft Y'])
     else:       
-        text = text_modelspace
-
         text_idx = []
         text_name = []
         text_rot = []
@@ -432,57 +277,62 @@ def text_bbox_wh(text_modelspace, text_df):
         text_lowleft_x = []
         text_lowleft_y = []
 
-        for t in text:
-            if(t.dxf.text in text_df['Name'].to_list()):
-                bbox = ezdxf.path.bbox(text2path.make_paths_from_entity(t))
-                text_idx.append(t)
-                text_name.append(t.dxf.text)
-                text_rot.append((t.dxf.rotation))
-                    
-                if ((t.dxf.rotation > -10) | (t.dxf.rotation > 350)) & (t.dxf.rotation < 10): # Horizontal orientation
-                    text_width.append( (bbox.size.x / 0.8) )
-                    text_height.append( (bbox.size.y / 0.75) )
-                    text_lowleft_x.append( (bbox.extmin[0] - 0.25) )
-                    text_lowleft_y.append( (bbox.extmin[1] - 0.25) )
-
-                elif (t.dxf.rotation > 80) & (t.dxf.rotation < 100): # Vertical orientation
-                    text_width.append( (bbox.size.x / 0.75) + 0.05 )
-                    text_height.append( (bbox.size.y / 0.75) - 1.5 )
-                    text_lowleft_x.append( (bbox.extmin[0] - 0.5) )
-                    text_lowleft_y.append( (bbox.extmin[1] - 0.25) )
-                    
+        # Only the candidate text entities of the dataframe are converted into the bounding box
+        for t, name in zip(text_df['ID'], text_df['Name']):
+            rotation = t.dxf.rotation
+            is_horizontal = ((rotation > -10) | (rotation > 350)) & (rotation < 10)
+            is_vertical = (rotation > 80) & (rotation < 100)
+            if not (is_horizontal | is_vertical):
+                continue
+
+            bbox = text_bbox(t, bbox_mode)
+            text_idx.append(t)
+            text_name.append(name)
+            text_rot.append(rotation)
+                
+            if is_horizontal: # Horizontal orientation
+                text_width.append( (bbox.size.x / 0.8) )
+                text_height.append( (bbox.size.y / 0.75) )
+                text_lowleft_x.append( (bbox.extmin[0] - 0.25) )
+                text_lowleft_y.append( (bbox.extmin[1] - 0.25) )
+
+            else: # Vertical orientation
+                text_width.append( (bbox.size.x / 0.75) + 0.05 )
+                text_height.append( (bbox.size.y / 0.75) - 1.5 )
+                text_lowleft_x.append( (bbox.extmin[0] - 0.5) )
+                text_lowleft_y.append( (bbox.extmin[1] - 0.25) )
+                
         text_rot = [round(rot, 0) for rot in text_rot]
                 
         text_ext = pd.DataFrame(list(zip(text_idx, text_name, text_rot, text_width, text_height, text_lowleft_x,text_lowleft_y)),
                                 columns=['ID','Name','Rotation','Text Width','Text Height','LowLeft X','LowLeft Y'])
-        
-        text_ext['Distance'] = ( (text_ext['LowLeft X'])**2 + (text_ext['LowLeft Y'])**2 )**0.5
                 
-        return text_ext
+    return text_ext
+
 def text_bbox_xy(text_df, text_ext):
     
     ''' Calculate the coordinate both lower left (x0,y0) and upper right (x1,y1) of bounding box for insert entities'''
     
     # Merge and remove the duplicate columns
     if text_df.shape[0] == 0:
-        text_all = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight'])
+        text_all = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight','Pair','Line Name'])
     else:
         text_all = pd.merge(left=text_df, right=text_ext, on='ID', suffixes=('', '_remove'), validate='one_to_one')
         text_all.drop([i for i in text_all.columns if 'remove' in i], axis=1, inplace=True)
         
-        # Sort the text name based on rotation and distance
-        if sum(text_all['Pattern'].str.startswith(('P','S'))) > 0:  
-            text_all.sort_values('Rotation', ascending=True, inplace=True)
-            text_all_h = text_all[text_all['Rotation'] == 0].sort_values('Distance', ascending=False)
-            text_all_v = text_all[text_all['Rotation'] == 90].sort_values('Distance', ascending=True)
-            text_all = pd.concat([text_all_h,text_all_v], axis=0, ignore_index=True, verify_integrity=True )
+        # Pair the prefix and suffix texts with the spatial index, the prefix row comes before its suffix row
+        text_all['UpRight X'] = text_all['LowLeft X'] + text_all['Text Width']
+        text_all['UpRight Y'] = text_all['LowLeft Y'] + text_all['Text Height']
+        text_all = pair_lines(text_all, text_all['Pattern'].str[0], name='Name', rotation='Rotation',
+                              box=['LowLeft X','LowLeft Y','UpRight X','UpRight Y'])
 
         # Calculate the coordinate of entities
         text_all['LowLeft'] = tuple(zip(text_all['LowLeft X'], text_all['LowLeft Y']))
-        text_all['UpRight'] = tuple(zip(text_all['LowLeft X'] + text_all['Text Width'], text_all['LowLeft Y'] + text_all['Text Height']))
+        text_all['UpRight'] = tuple(zip(text_all['UpRight X'], text_all['UpRight Y']))
         
-        # Drop the unnecessary columns from the dataframe
-        text_all.drop(['Text Width','Text Height','LowLeft X','LowLeft Y','Distance'], axis=1, inplace=True)
+        # Drop the unnecessary columns from the dataframe (the line boxes are combined from the raster boxes, see line_bbox)
+        text_all.drop(['Text Width','Text Height','LowLeft X','LowLeft Y','UpRight X','UpRight Y'], axis=1, inplace=True)
+        text_all.drop(['Line LowLeft X','Line LowLeft Y','Line UpRight X','Line UpRight Y'], axis=1, inplace=True)
     
     return text_all
 
@@ -500,31 +350,25 @@ def piping_text_full(modelspace):
     
     ''' Extract the information from text entities, which display in the full piping pattern in the model space from DXF file '''
     
-    text = modelspace.query('TEXT')
-    frame_dim = frame_dimension(modelspace)
-    
-    # Define pattern for filters of text entities
-    pat_full = r'.*\d\"\-[A-Z]{1,4}\-[A-Z\d]{6,8}\-[A-Z].*' # 00"-XXXX-000000[00]-X
+    table = modelspace.entity_table
+    frame_dim = modelspace.frame_dim
     
-    # Create entities list for verification with criteria condition
-    text_full_id = [t for t in text if bool(re.search(pat_full, t.dxf.text))]
+    # Create entities mask for verification with criteria condition (full piping pattern)
+    text_full_mask = modelspace.classify(line_classifier)['F']
     
     # Create the text dataframe
-    if len(text_full_id) == 0:
-        text_full_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight'])
+    if text_full_mask.sum() == 0:
+        text_full_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight','Pair','Line Name'])
     else:
         # Full piping pattern dataframe
-        text_full_name = [t.dxf.text for t in text if bool(re.search(pat_full, t.dxf.text))]
-        text_full_rot = [float(t.dxf.rotation) for t in text if bool(re.search(pat_full, t.dxf.text))]
-        text_full_rot = [round(rot, 0) for rot in text_full_rot]
-        text_full_dict = {'ID':text_full_id, 'Name':text_full_name, 'Rotation':text_full_rot}
-        text_full_df = pd.DataFrame(text_full_dict).assign(Type = 'T', Pattern = 'F')
+        text_full_df = text_pattern_df(table, text_full_mask, 'F')
+        text_full_df['Rotation'] = text_full_df['Rotation'].round(0)
         
         # Clean the text rotation column
         text_full_df = text_rotation_cleansing(text_full_df)
         
         # Get the extension dataframe
-        text_full_ext = text_bbox_wh(text, text_full_df)
+        text_full_ext = text_bbox_wh(text_full_df, modelspace.bbox_mode)
         
         # Merge the lineList and lineExt by 'Text Name' columms
         text_full_all = text_bbox_xy(text_full_df, text_full_ext)
@@ -535,23 +379,8 @@ def piping_text_full(modelspace):
         # Remove the text that located out of the drawing frame area
         text_full_ratio = text_outofframe_cleansing(text_full_ratio)
         
-        lowleft = [[x,y] for x,y in text_full_ratio['LowLeft']]
-        upright = [[x,y] for x,y in text_full_ratio['UpRight']]
-
-        for i in text_full_ratio[text_full_ratio['Rotation'] == 0].index:
-            lowleft[i][0] = round(lowleft[i][0], 3) - 0.002
-            lowleft[i][1] = round(lowleft[i][1], 3)
-            upright[i][0] = round(upright[i][0], 3) - 0.005
-            upright[i][1] = round(upright[i][1], 3)
-
-        for j in text_full_ratio[text_full_ratio['Rotation'] == 90].index:
-            lowleft[j][0] = round(lowleft[j][0], 3)
-            lowleft[j][1] = round(lowleft[j][1], 3) - 0.001
-            upright[j][0] = round(upright[j][0], 3)
-            upright[j][1] = round(upright[j][1], 3) - 0.01
-
-        text_full_ratio['LowLeft'] = tuple(lowleft)
-        text_full_ratio['UpRight'] = tuple(upright)
+        # Round and pad the coordinate ratio by the text rotation
+        text_full_ratio = entities_box_adjust(text_full_ratio, 'F')
     
     return text_full_ratio
 
@@ -559,41 +388,27 @@ def piping_text_pattern1(modelspace):
     
     ''' Extract the information from text entities, which display in the partial piping pattern (#1) in the model space from DXF file '''
     
-    text = modelspace.query('TEXT')
-    frame_dim = frame_dimension(modelspace)
+    table = modelspace.entity_table
+    frame_dim = modelspace.frame_dim
     
-    # Define pattern for filters of text entities
-    pat_pref1 = r'\-[A-Z]{1,4}\-[0-9]{6,8}$' # -000000[00]
-    pat_suff1 = r'^\-[A-Z][0-9]' # -X0
-      
-    # Create entities list for verification with criteria condition
-    text_pref1_id = [t for t in text if bool(re.search(pat_pref1, t.dxf.text))]
+    # Create entities mask for verification with criteria condition (partial piping pattern #1)
+    labels = modelspace.classify(line_classifier)
+    text_pref1_mask = labels['P1']
     
     # Create the text dataframe
-    if len(text_pref1_id) == 0:
-        text_pat1_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight'])
+    if text_pref1_mask.sum() == 0:
+        text_pat1_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight','Pair','Line Name'])
     else:
         # Partial piping pattern dataframe
-        text_pref1_name = [t.dxf.text for t in text if bool(re.search(pat_pref1, t.dxf.text))]
-        
-        if len(text_pref1_name) > 0:
-            text_pref1_rot = [t.dxf.rotation for t in text if bool(re.search(pat_pref1, t.dxf.text))]
-            text_pref1_dict = {'ID':text_pref1_id, 'Name':text_pref1_name, 'Rotation':text_pref1_rot}
-            text_pref1_df = pd.DataFrame(text_pref1_dict).assign(Type = 'T', Pattern = 'P1')
-
-            text_suff1_id = [t for t in text if bool(re.search(pat_suff1, t.dxf.text))]
-            text_suff1_name = [t.dxf.text for t in text if bool(re.search(pat_suff1, t.dxf.text))]
-            text_suff1_rot = [t.dxf.rotation for t in text if bool(re.search(pat_suff1, t.dxf.text))]
-            text_suff1_dict = {'ID':text_suff1_id, 'Name':text_suff1_name, 'Rotation':text_suff1_rot}
-            text_suff1_df = pd.DataFrame(text_suff1_dict).assign(Type = 'T', Pattern = 'S1')
-
-            text_pat1_df = pd.concat([text_pref1_df, text_suff1_df], axis=0, ignore_index=True, verify_integrity=True)
+        text_pref1_df = text_pattern_df(table, text_pref1_mask, 'P1')
+        text_suff1_df = text_pattern_df(table, labels['S1'], 'S1')
+        text_pat1_df = pd.concat([text_pref1_df, text_suff1_df], axis=0, ignore_index=True, verify_integrity=True)
         
         # Clean the text rotation column
         text_pat1_df = text_rotation_cleansing(text_pat1_df)
         
         # Get the extension dataframe
-        text_pat1_ext = text_bbox_wh(text, text_pat1_df)
+        text_pat1_ext = text_bbox_wh(text_pat1_df, modelspace.bbox_mode)
         
         # Merge the lineList and lineExt by 'Text Name' columms
         text_pat1_all = text_bbox_xy(text_pat1_df, text_pat1_ext)
@@ -601,23 +416,8 @@ def piping_text_pattern1(modelspace):
         # Transform the coordinate of dxf file into ratio value
         text_pat1_ratio = entities_dim_transform_ratio(frame_dim, text_pat1_all)
         
-        lowleft = [[x,y] for x,y in text_pat1_ratio['LowLeft']]
-        upright = [[x,y] for x,y in text_pat1_ratio['UpRight']]
-
-        for i in text_pat1_ratio[text_pat1_ratio['Rotation'] == 0].index:
-            lowleft[i][0] = round(lowleft[i][0], 3) - 0.001
-            lowleft[i][1] = round(lowleft[i][1], 3)
-            upright[i][0] = round(upright[i][0], 3) - 0.002
-            upright[i][1] = round(upright[i][1], 3)
-
-        for j in text_pat1_ratio[text_pat1_ratio['Rotation'] == 90].index:
-            lowleft[j][0] = round(lowleft[j][0], 3)
-            lowleft[j][1] = round(lowleft[j][1], 3) - 0.001
-            upright[j][0] = round(upright[j][0], 3)
-            upright[j][1] = round(upright[j][1], 3) - 0.002
-
-        text_pat1_ratio['LowLeft'] = tuple(lowleft)
-        text_pat1_ratio['UpRight'] = tuple(upright)
+        # Round and pad the coordinate ratio by the text rotation
+        text_pat1_ratio = entities_box_adjust(text_pat1_ratio, 'P1')
     
     return text_pat1_ratio
 
@@ -625,41 +425,27 @@ def piping_text_pattern2(modelspace):
     
     ''' Extract the information from text entities, which display in the partial piping pattern (#3) in the model space from DXF file '''
     
-    text = modelspace.query('TEXT')
-    frame_dim = frame_dimension(modelspace)
+    table = modelspace.entity_table
+    frame_dim = modelspace.frame_dim
     
-    # Define pattern for filters of text entities
-    pat_pref2 = r'(\"\-[A-Z]{1,4}\-$)|(\"\-[A-Z]{1,4}$)' # 0"-XXXX-
-    pat_suff2 = r'(^[0-9]{6,8}\-[A-Z][0-9])|(^\-[0-9]{6,8}\-[A-Z][0-9])' # 000000[00]-
-      
-    # Create entities list for verification with criteria condition
-    text_pref2_id = [t for t in text if bool(re.search(pat_pref2, t.dxf.text))]
+    # Create entities mask for verification with criteria condition (partial piping pattern #2)
+    labels = modelspace.classify(line_classifier)
+    text_pref2_mask = labels['P2']
     
     # Create the text dataframe
-    if len(text_pref2_id) == 0:
-        text_pat2_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight'])
+    if text_pref2_mask.sum() == 0:
+        text_pat2_ratio = pd.DataFrame(columns=['ID','Name','Rotation','Type','Pattern','LowLeft','UpRight','Pair','Line Name'])
     else:
         # Partial piping pattern dataframe
-        text_pref2_name = [t.dxf.text for t in text if bool(re.search(pat_pref2, t.dxf.text))]
-        
-        if len(text_pref2_name) > 0:
-            text_pref2_rot = [t.dxf.rotation for t in text if bool(re.search(pat_pref2, t.dxf.text))]
-            text_pref2_dict = {'ID':text_pref2_id, 'Name':text_pref2_name, 'Rotation':text_pref2_rot}
-            text_pref2_df = pd.DataFrame(text_pref2_dict).assign(Type = 'T', Pattern = 'P2')
-
-            text_suff2_id = [t for t in text if bool(re.search(pat_suff2, t.dxf.text))]
-            text_suff2_name = [t.dxf.text for t in text if bool(re.search(pat_suff2, t.dxf.text))]
-            text_suff2_rot = [t.dxf.rotation for t in text if bool(re.search(pat_suff2, t.dxf.text))]
-            text_suff2_dict = {'ID':text_suff2_id, 'Name':text_suff2_name, 'Rotation':text_suff2_rot}
-            text_suff2_df = pd.DataFrame(text_suff2_dict).assign(Type = 'T', Pattern = 'S2')
-
-            text_pat2_df = pd.concat([text_pref2_df, text_suff2_df], axis=0, ignore_index=True, verify_integrity=True)
+        text_pref2_df = text_pattern_df(table, text_pref2_mask, 'P2')
+        text_suff2_df = text_pattern_df(table, labels['S2'], 'S2')
+        text_pat2_df = pd.concat([text_pref2_df, text_suff2_df], axis=0, ignore_index=True, verify_integrity=True)
         
         # Clean the text rotation column
         text_pat2_df = text_rotation_cleansing(text_pat2_df)
         
         # Get the extension dataframe
-        text_pat2_ext = text_bbox_wh(text, text_pat2_df)
+        text_pat2_ext = text_bbox_wh(text_pat2_df, modelspace.bbox_mode)
         
         # Merge the lineList and lineExt by 'Text Name' columms
         text_pat2_all = text_bbox_xy(text_pat2_df, text_pat2_ext)
@@ -667,100 +453,179 @@ def piping_text_pattern2(modelspace):
         # Transform the coordinate of dxf file into ratio value
         text_pat2_ratio = entities_dim_transform_ratio(frame_dim, text_pat2_all)
 
-        lowleft = [[x,y] for x,y in text_pat2_ratio['LowLeft']]
-        upright = [[x,y] for x,y in text_pat2_ratio['UpRight']]
+        # Round and pad the coordinate ratio by the text rotation (also without any vertical text)
+        text_pat2_ratio = entities_box_adjust(text_pat2_ratio, 'P2')
+    
+    return text_pat2_ratio
 
-        for i in text_pat2_ratio[text_pat2_ratio['Rotation'] == 0].index:
-            lowleft[i][0] = round_up(lowleft[i][0], 3) - 0.002
-            lowleft[i][1] = round_down(lowleft[i][1], 3)
-            upright[i][0] = round_down(upright[i][0], 3) - 0.001
-            upright[i][1] = round_up(upright[i][1], 3)
+def extraction_stats():
+    
+    ''' Statistics of the line number classifier and the text bounding box cache in the current process '''
+    
+    # Only the counts are kept, so the statistics of all workers can be added up
+    cache_stats = {cache: {key: value for key, value in counts.items() if key not in ('Size','Max Size')}
+                   for cache, counts in bbox_cache_stats().items()}
+    
+    return {'Line number pattern hits': line_classifier.report(), 'Text bounding box cache': cache_stats}
 
-        for j in text_pat2_ratio[text_pat2_ratio['Rotation'] == 90].index:
-            lowleft[j][0] = round_down(lowleft[j][0], 3)
-            lowleft[j][1] = round_up(lowleft[j][1], 3) - 0.001
-            upright[j][0] = round_up(upright[j][0], 3)
-            upright[j][1] = round_down(upright[j][1], 3) - 0.002
+def line_bbox(piping_df):
+    
+    ''' Add the bounding box of the line (Line LowLeft and Line UpRight) to each row: the combined box of both texts of the
+    paired line number, otherwise the own box of the text '''
+    
+    boxes = line_boxes(box_array(piping_df), pd.to_numeric(piping_df['Pair']).to_numpy(dtype=float))
+    lines = assign_boxes(piping_df[[]], boxes)
+    
+    return piping_df.assign(**{'Line LowLeft': lines['LowLeft'], 'Line UpRight': lines['UpRight']})
 
-            text_pat2_ratio['LowLeft'] = tuple(lowleft)
-            text_pat2_ratio['UpRight'] = tuple(upright)
+def extract_drawing(dxf_filename, raster_filename, bbox_mode='path'):
     
-    return text_pat2_ratio
+    ''' Extract the piping line texts of one drawing (DXF and raster file), the worker of the process pool
+    
+    Return the compact result (the entity IDs are converted into text), the statistics of this drawing and the content hash of
+    the DXF file (hashed once for the frame cache, and then reused by the run manifest) '''
+    
+    stats = extraction_stats()
+    
+    # Create the drawing session, and then share it for all extraction stages
+    model_space = get_modelspace(dxf_filename, bbox_mode)
+    
+    # Get the drawing dimension from model space, which is calculated only one time per drawing
+    frame_dim = model_space.frame_dim
+    
+    # Create the component dataframes of each piping text pattern
+    insert_ratio_df = piping_insert_full(model_space)
+    text_full_ratio_df = piping_text_full(model_space)
+    text_pat1_ratio_df = piping_text_pattern1(model_space)
+    text_pat2_ratio_df = piping_text_pattern2(model_space)
+    
+    # Number the pairs of the pattern 2 after the pairs of the pattern 1, so each pair number is unique in the drawing
+    pair_1 = pd.to_numeric(text_pat1_ratio_df['Pair'])
+    pair_2 = pd.to_numeric(text_pat2_ratio_df['Pair'])
+    pair_offset = int(pair_1.max()) + 1 if (pair_1 >= 0).any() else 0
+    text_pat2_ratio_df = text_pat2_ratio_df.assign(Pair = pair_2.where(pair_2 < 0, pair_2 + pair_offset))
+    
+    # Append all of component dataframes
+    piping_df = pd.concat([insert_ratio_df,text_full_ratio_df,text_pat1_ratio_df,text_pat2_ratio_df], axis=0,
+                          ignore_index=True, verify_integrity=True)
+    
+    # Transform the scale coordinate ratio from dxf file into coordinate for raster file (all boxes of the drawing at once)
+    piping_df = entities_dim_transform_raster(raster_filename, piping_df, frame_dim)
+    piping_df['ID'] = piping_df['ID'].astype(str)
+    piping_df = line_bbox(piping_df)
+    
+    # Add the filename
+    listname = re.split(r'\\|\.', dxf_filename)
+    filename = listname[-2]
+    piping_df = piping_df.assign(Filename = filename)
+    
+    return piping_df, subtract_counts(extraction_stats(), stats), drawing_hash(dxf_filename)
 
-def info_extract_pid_uhv(name: Path):
+def csv_path(dxf_filename):
     
-    ''' Extract the information from the DWG file, and then save the relevant information into *.csv file '''
+    ''' CSV file of the drawing: '.\\CSV\\<sub-folders>\\<drawing>.csv' (the sub-folders are joined), the folder is created '''
+    
+    listname = re.split(r'\\|\.', dxf_filename)
+    filename = listname[-2]
+    prior_folder = "".join([folder for folder in listname if folder not in ['','DXF',filename,'dxf']])
+    ensure_folder('.\\CSV\\'+prior_folder)
+    
+    return '.\\CSV\\'+prior_folder+'\\'+filename+'.csv'
+
+def info_extract_pid_uhv(name: Path, bbox_mode='path', workers=1, force=False, store=False, register=False):
+    
+    ''' Extract the information from the DWG file, and then save the relevant information into *.csv file
+    
+    workers: number of worker processes (None for all CPU cores), the drawings are spread across the process pool
+    force: extract all drawings, otherwise the unchanged drawings of the last run are skipped
+    store: also write the result of each drawing into the Parquet result store ('.\\Results\\uhv'), partitioned by plant and drawing
+    register: also upsert the line numbers of each drawing into the line register ('.\\LineRegister.sqlite') '''
     
     # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
     os.chdir(name)
+    reset_folders()
         
     dxf_folder = ".\\DXF"
     raster_folder = ".\\PNG"
-    list_dxf_files = get_file_list(dxf_folder)
-    list_raster_files = get_file_list(raster_folder)
+    catalogue = DrawingCatalogue()
+    list_dxf_files = catalogue.paths('DXF')
+    
+    # The sidecar files of the rasterizer are enough for the extraction, when the raster files are not on this host
+    raster_kind = 'PNG' if os.path.exists(raster_folder) else SIDECAR_FOLDER
     
-    if len(list_dxf_files) != len(list_raster_files):
-        sys.exit('Numbers of drawing files (.dxf) do not equal to raster (.png, .jpg) files.')
+    # The drawing and raster files are paired by the sub-folder and the drawing name, not by the order of the listings
+    missing = catalogue.missing('DXF', raster_kind)[raster_kind]
+    if len(missing) != 0:
+        sys.exit(f'Drawing files (.dxf) without raster (.png, .jpg) files: {missing}')
     
-    list_data_files = list(zip(list_dxf_files,list_raster_files))
+    list_data_files = [(dxf_filename, raster_filename) for _, dxf_filename, raster_filename in catalogue.pairs('DXF', raster_kind)]
     list_data_files = pd.DataFrame(list_data_files, columns=['DXF','PNG'])
-         
-    for idx in tqdm(list_data_files.index):
+    manifest = RunManifest('info_extract_pid_uhv', {'bbox_mode': bbox_mode})
+    plant = os.path.basename(os.getcwd())
+    line_register = LineRegister() if register else None
+    tasks = []
+    save_paths = []
+    raster_inputs = []
+    
+    for dxf_filename, raster_filename in zip(list_data_files['DXF'], list_data_files['PNG']):
+        
+        # Save file CSV (each folder is checked once)
+        saveinfo_path = csv_path(dxf_filename)
+        
+        # The raster coordinate depends only on the sidecar (world-to-pixel affine), if the rasterizer has written it
+        raster_input = sidecar_path(raster_filename)
+        if not os.path.exists(raster_input):
+            raster_input = raster_filename
+        
+        # The result store keeps the same result in the partition of the drawing
+        outputs = [saveinfo_path]
+        if store:
+            outputs.append(result_file('uhv', plant, drawing_key(dxf_filename, dxf_folder)))
+        
+        # Skip the drawing, which was extracted from the same DXF and raster contents with the same parameters (and registered)
+        if (not force) and ((line_register is None) or line_register.has_drawing(plant, drawing_key(dxf_filename, dxf_folder), 'uhv')) and \
+           manifest.is_done(dxf_filename, [dxf_filename, raster_input], outputs):
+            continue
+        
+        tasks.append((dxf_filename, raster_filename, bbox_mode))
+        save_paths.append(outputs)
+        raster_inputs.append(raster_input)
+    
+    stats = {}
+    failures = []
+    
+    # The results are returned in the order of the drawings, so the CSV files are written deterministically
+    for idx, result, failure in run_ordered(extract_drawing, tasks, workers=workers, desc='Drawings'):
         
         # Get the file location
-        dxf_filename = list_data_files.loc[idx,'DXF']
-        raster_filename = list_data_files.loc[idx,'PNG']
-        
-        # Create and query the model space
-        model_space = get_modelspace(dxf_filename)
-        
-        # Get the drawing dimension from model space
-        frame_dim = frame_dimension(model_space)
-        
-        # Create the component dataframes of each piping text pattern
-        insert_ratio_df = piping_insert_full(model_space)
-        text_full_ratio_df = piping_text_full(model_space)
-        text_pat1_ratio_df = piping_text_pattern1(model_space)
-        text_pat2_ratio_df = piping_text_pattern2(model_space)
-        
-        # Transform the scale coordinate ratio from dxf file into coordinate for raster file
-        insert_df = entities_dim_transform_raster(raster_filename, insert_ratio_df)
-        text_full_df = entities_dim_transform_raster(raster_filename, text_full_ratio_df)
-        text_pat1_df = entities_dim_transform_raster(raster_filename, text_pat1_ratio_df)
-        text_pat2_df = entities_dim_transform_raster(raster_filename, text_pat2_ratio_df)
-        
-        # Append all of component dataframes
-        piping_df = pd.concat([insert_df,text_full_df,text_pat1_df,text_pat2_df], axis=0,
-                              ignore_index=True, verify_integrity=True)
-        
-        # Add the filename
-        listname = re.split(r'\\|\.', dxf_filename)
-        filename = listname[-2]
-        piping_df = piping_df.assign(Filename = filename)      
-                
-        # Define related parameters and check the existing save folder
-        list_folders = os.listdir('.\\DXF')
-        save_csv_folder = '.\\CSV'
-        trim_char = ['','DXF',filename,'dxf']
-    
-        if not os.path.exists(save_csv_folder):
-            os.makedirs(save_csv_folder)
-        
-        # Save file CSV
-        if bool(len(list_dxf_files) != 0):
-            prior_folder = [folder for folder in listname if folder not in trim_char]
-            prior_folder = "".join(prior_folder)
-            
-            # Check the whether if existing folder is created        
-            if not os.path.exists(save_csv_folder+'\\'+prior_folder): 
-                os.makedirs(save_csv_folder+'\\'+prior_folder)
-            saveinfo_path = save_csv_folder+'\\'+prior_folder+'\\'+filename+'.csv'
-        else:
-            saveinfo_path = save_csv_folder+'\\'+file_name+'.csv'
+        dxf_filename, raster_filename, _ = tasks[idx]
+        saveinfo_path = save_paths[idx][0]
+        
+        # A failed drawing is reported, and the batch goes on with the next drawing
+        if failure is not None:
+            failures.append(failure)
+            print('Failed drawing:', dxf_filename, failure.error)
+            continue
+        
+        piping_df, drawing_stats, digest = result
+        add_counts(stats, drawing_stats)
         
         piping_df.to_csv(saveinfo_path)
+        if store:
+            write_result(piping_df, 'uhv', plant, drawing_key(dxf_filename, dxf_folder))
+        if line_register is not None:
+            line_register.register(piping_df, plant, drawing_key(dxf_filename, dxf_folder), 'uhv')
+        manifest.record(dxf_filename, [dxf_filename, raster_inputs[idx]], save_paths[idx], digests={dxf_filename: digest})
         print('Saving location of file:', saveinfo_path)
         
+    for key, value in stats.items():
+        print(key+':', value)
+    if len(failures) != 0:
+        print(f'{len(failures)} drawing(s) failed:', [failure.task[0] for failure in failures])
+    if line_register is not None:
+        line_register.close()
+    manifest.compact()
+    print('Run manifest:', manifest.summary())
     print('Information extraction is now complete!!!')
     gc.collect()
     
@@ -770,5 +635,7 @@ DIR = Path(".\\Use Case Project").expanduser()
 # Testing!!!
 # Ensure the working directory before executing!!!
 # All drawing file must be located in the 'DWG' sub-folder
+# Set workers=None to spread the drawings across all CPU cores
 
-info_extract_pid_uhv(DIR)
+if __name__ == '__main__':
+    info_extract_pid_uhv(DIR)
@@ -1,136 +1,466 @@
 import ezdxf
-from ezdxf import recover
+from ezdxf import bbox, recover
 from ezdxf.addons.drawing.config import Configuration, LinePolicy
 from ezdxf.addons.drawing import RenderContext, Frontend
-from ezdxf.addons.drawing import matplotlib
 from ezdxf.addons.drawing.matplotlib import MatplotlibBackend
 from ezdxf.addons.drawing.properties import Properties, LayoutProperties
-from ezdxf.lldxf.const import DXFAttributeError
-from ezdxf.tools import fonts
+from drawing_catalogue import ensure_folder, reset_folders, scan_files
+from drawing_session import DrawingSession
+from parallel_pool import resolve_workers, run_ordered
+from pillow_raster import PillowRaster
+from raster_tiles import TileDirectoryWriter, tile_grid, write_tiled_tiff
+from raster_transform import sidecar_path, wcs_to_image_transform, write_sidecar
+from run_manifest import RunManifest
 import gc
+import matplotlib as mpl
 import matplotlib.pyplot as plt
+import numpy as np
 import os
+import pandas as pd
 from pathlib import Path
 from PIL import Image
 import regex as re
 import sys
+import time
+from tqdm import tqdm
+
+try:
+    from ezdxf.fonts import fonts
+except ImportError:
+    from ezdxf.tools import fonts
+
+try:
+    from ezdxf.addons.drawing.config import BackgroundPolicy, ColorPolicy
+except ImportError: # Older ezdxf, the colour is overridden by the frontend
+    BackgroundPolicy = ColorPolicy = None
+
+try:
+    import resource # The memory guard is only available on POSIX systems
+except ImportError:
+    resource = None
 
 def get_file_list(dir_name):
     
     ''' For the given path, get the List of all files in the directory tree '''
-    
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-    
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-                
-    return all_files
+
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
   
 def get_modelspace(filename):
     
     ''' Load, and verify the DXF file, and convert all entities in the modelspace  '''
     
-    # Safe file loading procedure
-    try:
-        doc, auditor = recover.readfile(filename)
-    except IOError:
-        print(f'Not a DXF file or a generic I/O error.')
-        sys.exit(1)
-    except ezdxf.DXFStructureError:
-        print(f'Invalid or corrupted DXF file.')
-        sys.exit(2)
+    # Safe file loading procedure, the recovered document is used for rendering without reading the file again
+    session = DrawingSession(filename, audit=True)
+    doc, auditor = session.doc, session.auditor
 
     # DXF file can still have unrecoverable errors, but this is maybe just a problem when saving the recovered DXF file.
     if auditor.has_errors:
         auditor.print_error_report()
         raise Exception("This DXF document is damaged and can't be converted! --> ", filename)
-        filename = filename =+ 1
     
-    # Read file and convert all entities in the modelspace
-    doc = ezdxf.readfile(filename)
-    msp = doc.modelspace()
+    # The entities are drawn in black by the render configuration, so the document is never modified
+    return session.modelspace
+ 
+def draw_modelspace(ax, msp, bg='#FFFFFF', fg='#000000', config=None, finalize=True, filter_func=None):
+    
+    ''' Draw the model space on the matplotlib axes by the ezdxf frontend '''
+    
+    ctx = RenderContext(msp.doc)
+    layout_properties = LayoutProperties.from_layout(msp)
+    layout_properties.set_colors(bg, fg)
+    out = MatplotlibBackend(ax)
+    frontend = Frontend(ctx, out, config or render_config())
+    
+    # Older ezdxf without the colour policy: all entities are drawn by the foreground color
+    if ColorPolicy is None:
+        frontend.override_properties = lambda entity, properties: setattr(properties, 'color', fg)
+    
+    frontend.draw_layout(msp, finalize=finalize, filter_func=filter_func, layout_properties=layout_properties)
+    ax.get_figure().patch.set_facecolor(bg)
+
+def canvas_image(fig, mode='L'):
+    
+    ''' Draw the figure on the Agg canvas, and then convert the canvas buffer into the image of the given mode '''
+    
+    fig.canvas.draw()
+    
+    # The Agg buffer is wrapped without copying, and then it is converted once into the final image mode
+    width, height = fig.canvas.get_width_height()
+    img = Image.frombuffer('RGBA', (width, height), fig.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1).convert('L')
+    if mode == '1':
+        img = img.convert('1', dither=0)
+    
+    return img
+
+def render_drawing(msp, bg='#FFFFFF', fg='#000000', dpi=720, config=None, mode='L'):
+    
+    ''' Render the model space on the in-memory canvas (the same view as matplotlib.qsave), and return the image and the view limits
+    
+    mode: 'L' (grayscale) or '1' (bilevel) image, which is converted directly from the canvas buffer '''
+    
+    fig = plt.figure(dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    draw_modelspace(ax, msp, bg, fg, config)
+    img = canvas_image(fig, mode)
+    
+    # The view limits are read after drawing, so the aspect ratio adjustment of the axes is already applied
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    plt.close(fig)
+    
+    return img, xlim, ylim
+
+def sheet_view(msp, dpi=720):
+    
+    ''' View limits and pixel size of the whole sheet without rendering it, the same view as render_drawing: the drawing extents
+    with the default margins of matplotlib, and the figure aspect of the ezdxf backend '''
+    
+    extents = bbox.extents(msp)
+    x0, y0, x1, y1 = extents.extmin.x, extents.extmin.y, extents.extmax.x, extents.extmax.y
+    margin_x = (x1 - x0) * mpl.rcParams['axes.xmargin']
+    margin_y = (y1 - y0) * mpl.rcParams['axes.ymargin']
+    xlim, ylim = (x0 - margin_x, x1 + margin_x), (y0 - margin_y, y1 + margin_y)
+    
+    # The pixel size is the same in both directions (equal aspect), and then the view is fitted to the whole pixels
+    fig_width, fig_height = plt.figaspect((ylim[1] - ylim[0]) / (xlim[1] - xlim[0]))
+    scale = (fig_height * dpi) / (ylim[1] - ylim[0])
+    width, height = int(fig_width * dpi), int(fig_height * dpi)
+    xlim = (xlim[0], xlim[0] + width / scale)
+    ylim = (ylim[1] - height / scale, ylim[1])
+    
+    return xlim, ylim, (width, height), scale
+
+def entity_extents(msp):
+    
+    ''' Bounding box of each model space entity (by the handle), which is used to skip the entities out of the tile '''
     
-    # Change the color of all dxf objects in the same layer properties (ACI = 256)
+    cache = bbox.Cache()
+    extents = {}
     for e in msp:
-        try:
-            e.dxf.color = 256
-        except DXFAttributeError:
-            # Attribute is not present
-            pass
-    
-    # Change the layer color to black (ACI = 7)
-    for layer in doc.layers:
-        layer.color = 7
+        ext = bbox.extents([e], cache=cache)
+        if ext.has_data:
+            extents[e.dxf.handle] = (ext.extmin.x, ext.extmin.y, ext.extmax.x, ext.extmax.y)
+    
+    return extents
+
+def render_window(msp, xlim, ylim, size, bg='#FFFFFF', fg='#000000', dpi=720, config=None, mode='L', filter_func=None,
+                  backend='matplotlib', supersample=2):
+    
+    ''' Render the given view (world limits) of the model space into the image of the given size (pixels)
+    
+    backend: 'matplotlib' (ezdxf frontend) or 'pillow' (the lightweight line-art backend with the anti-aliasing by supersample),
+    the entities, which the Pillow backend does not support, are drawn by the ezdxf frontend and merged into the image '''
+    
+    width, height = size
+    
+    if backend == 'pillow':
+        raster = PillowRaster(msp.doc, xlim, ylim, size, dpi=dpi, supersample=supersample)
+        raster.draw(msp, filter_func)
+        fallback = None
+        if len(raster.unsupported) != 0:
+            handles = set(e.dxf.handle for e in raster.unsupported)
+            fallback = render_window(msp, xlim, ylim, size, bg, fg, dpi, config, 'L', lambda e: e.dxf.handle in handles)
+        return raster.image(fallback, mode)
+    
+    fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    draw_modelspace(ax, msp, bg, fg, config, finalize=False, filter_func=filter_func)
+    ax.set_aspect('auto')
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    img = canvas_image(fig, mode)
+    plt.close(fig)
+    
+    # The canvas size is truncated to the whole pixels, the missing edge is filled by the background
+    if img.size != (width, height):
+        window = Image.new(img.mode, (width, height), 255)
+        window.paste(img, (0, 0))
+        img = window
+    
+    return img
+
+def render_tiles(msp, tile_size=2048, bg='#FFFFFF', fg='#000000', dpi=720, config=None, mode='L', backend='matplotlib',
+                 supersample=2):
+    
+    ''' Render the model space in the fixed-size tiles, so the peak memory depends on the tile size only (not on the sheet size)
+    
+    Return the view limits, the sheet size and the generator of the tile images: (row, col, x, y, image) in the row-major order '''
+    
+    xlim, ylim, size, scale = sheet_view(msp, dpi)
+    extents = entity_extents(msp)
+    
+    # The entity is drawn on the tile, which overlaps its bounding box (with a small margin for the line weight)
+    margin = 8 / scale
+    
+    def tiles():
+        for row, col, x, y, width, height in tile_grid(size[0], size[1], tile_size):
+            window = (xlim[0] + x / scale, ylim[1] - (y + height) / scale, xlim[0] + (x + width) / scale, ylim[1] - y / scale)
+            
+            def on_tile(e):
+                box = extents.get(e.dxf.handle)
+                return (box is None) or ((box[0] <= window[2] + margin) & (box[2] >= window[0] - margin) &
+                                         (box[1] <= window[3] + margin) & (box[3] >= window[1] - margin))
+            
+            img = render_window(msp, (window[0], window[2]), (window[1], window[3]), (width, height), bg, fg, dpi, config, mode,
+                                on_tile, backend, supersample)
+            
+            yield row, col, x, y, img
+    
+    return xlim, ylim, size, tiles()
+
+def render_config():
+    
+    ''' Rendering configuration of the rasterization '''
+    
+    config = Configuration.defaults()
+    config = config.with_changes(lineweight_scaling=0.5, line_policy=LinePolicy.ACCURATE)
+    
+    # Draw all entities in black on the white background (instead of the entity and layer colors)
+    if ColorPolicy is not None:
+        config = config.with_changes(color_policy=ColorPolicy.BLACK, background_policy=BackgroundPolicy.WHITE)
+    
+    return config
+
+def check_memory_limit(memory_limit=None):
+
+    ''' Memory limit (MB) of the rendering workers, which can be applied on this system, otherwise None with a warning
+
+    The guard is the address space limit of the resource module, which is not available on Windows. '''
+
+    if (memory_limit is not None) and (resource is None):
+        print(f'The memory limit ({memory_limit} MB) is not supported on this system (no resource module), '
+              'the workers render without the memory guard.')
+        return None
+
+    return memory_limit
+
+def render_worker_init(memory_limit=None):
+    
+    ''' Warm up the rendering worker: the non-interactive backend and the font cache are loaded one time per process
+    
+    memory_limit: maximum memory (MB) of the worker process, the drawing, which needs more memory, fails with MemoryError
+    (see check_memory_limit). It is the initializer of the worker processes only, never of the current process. '''
+    
+    mpl.use('Agg')
+    fonts.load()
+    
+    # Render a small drawing, so the lazy imports of the rendering (e.g. the font outlines) are done before the memory guard
+    doc = ezdxf.new()
+    doc.modelspace().add_text('WARM-UP')
+    render_drawing(doc.modelspace(), dpi=72)
+    
+    if (memory_limit is not None) and (resource is not None):
+        limit = int(memory_limit) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def rasterize_drawing(filename, saveinfo_path, dpi=720, mode='L', tile_size=None, backend='matplotlib', supersample=2):
+    
+    ''' Render one DXF file into the raster image and its sidecar, the worker of the process pool
+    
+    tile_size: render the sheet in the tiles of this size (pixels), which are streamed into the tiled TIFF (*.tif) or into the
+    tile directory (index.json and one PNG file per tile)
+    backend: 'matplotlib' or 'pillow' (see render_window) '''
+    
+    try:
+        entities = get_modelspace(filename)
         
-    return msp
- 
-def rasterize(name: Path, filetype='png', dpi=720):
+        if (tile_size is None) and (backend == 'pillow'):
+            xlim, ylim, size, _ = sheet_view(entities, dpi)
+            img = render_window(entities, xlim, ylim, size, dpi=dpi, mode=mode, backend=backend, supersample=supersample)
+            img.save(saveinfo_path)
+        elif tile_size is None:
+            img, xlim, ylim = render_drawing(entities, bg='#FFFFFF', fg='#000000', dpi=dpi, mode=mode)
+            size = img.size
+            
+            # The grayscale (or bilevel) image is encoded only one time
+            img.save(saveinfo_path)
+        else:
+            xlim, ylim, size, tiles = render_tiles(entities, tile_size, bg='#FFFFFF', fg='#000000', dpi=dpi, mode=mode,
+                                                   backend=backend, supersample=supersample)
+            metadata = {'DPI': dpi, 'Frame': [xlim[0], ylim[0], xlim[1], ylim[1]],
+                        'Matrix': wcs_to_image_transform(size, xlim, ylim).tolist()}
+            
+            # Each tile is written as soon as it is rendered
+            if saveinfo_path.lower().endswith(('.tif', '.tiff')):
+                write_tiled_tiff(saveinfo_path, size, tile_size, (img for _, _, _, _, img in tiles), mode, metadata)
+            else:
+                writer = TileDirectoryWriter(saveinfo_path, size, tile_size, mode, metadata)
+                for row, col, x, y, img in tiles:
+                    writer.write(row, col, x, y, img)
+                writer.close()
+        
+        # Keep the world-to-pixel affine of the rendering, so the extraction never reads the image
+        write_sidecar(saveinfo_path, xlim, ylim, dpi, size)
+    finally:
+        # Release the figure and the document before the next drawing of this worker
+        plt.close('all')
+        gc.collect()
+    
+    return saveinfo_path
+
+def raster_path(filename, filetype='png', tile_size=None):
+
+    ''' Raster file of the DXF file: '.\\<FILETYPE>\\<sub-folders>\\<drawing>.<filetype>' (the sub-folders are joined), and
+    the tile directory '.\\TILES\\<sub-folders>\\<drawing>' of the tiled rendering, which is not the tiled TIFF file
+
+    The save folder is created, if it does not exist. '''
+
+    listname = re.split(r'\\|\.', filename)
+    file = listname[-2]
+    save_folder = '.\\'+filetype.upper()
+    extension = '.'+filetype
+
+    # The tile directory of the tiled rendering has no file extension
+    if (tile_size is not None) and (filetype.lower() not in ('tif', 'tiff')):
+        save_folder, extension = '.\\TILES', ''
+
+    prior_folder = "".join([folder for folder in listname if folder not in ['','DXF',file,'dxf']])
+    ensure_folder(save_folder+'\\'+prior_folder)
+
+    return save_folder+'\\'+prior_folder+'\\'+file+extension
+
+def rasterize(name: Path, filetype='png', dpi=720, force=False, workers=1, memory_limit=None, mode='L', tile_size=None,
+              backend='matplotlib', supersample=2):
+    
+    ''' Convert the DXF file into raster image file type, the unchanged drawings of the last run are skipped (force=True renders all)
     
-    ''' Convert the DXF file into raster image file type '''
+    mode: 'L' (grayscale) or '1' (bilevel) image
+    tile_size: tiled rendering (pixels per tile) for the very large sheets, the tiles are written into the tiled TIFF file (filetype
+    'tif', which requires tifffile) or into the tile directory in the 'TILES' sub-folder
+    backend: 'matplotlib' (ezdxf frontend) or 'pillow' (the lightweight line-art backend, see benchmark_backends to choose per plant)
+    supersample: anti-aliasing factor of the Pillow backend (1 is no anti-aliasing)
+    workers: number of rendering processes (None for all CPU cores), each worker loads the fonts once and renders many drawings
+    memory_limit: maximum memory (MB) per worker, the drawing over the limit is reported as failed, and the others go on (the
+    guard is applied only to the worker processes, never to the current process with one worker or one drawing, and it is not
+    available on Windows) '''
     
     # Set working directory, which there is sub-folder name 'DXF' consists of *.dxf files
     os.chdir(name)
+    reset_folders()
     
     print(f'DXF files have been converted into {filetype!r} files.','\n')
     print('Rasterization is proceeding...')
     
     list_files = get_file_list('DXF')
-    config = Configuration.defaults()
-    config = config.with_changes(lineweight_scaling=0.5, line_policy=LinePolicy.ACCURATE)
     bgcol = '#FFFFFF' # for white background: ('#FFFFFF00') to get a transparent background and a black foreground color (ACI=7)
+    manifest = RunManifest('rasterize', {'filetype': filetype, 'dpi': dpi, 'mode': mode, 'tile_size': tile_size, 'backend': backend,
+                                        'supersample': supersample if backend == 'pillow' else None, 'lineweight_scaling': 0.5,
+                                        'line_policy': 'ACCURATE', 'color_policy': 'BLACK'})
+    tasks = []
     
     for filename in list_files:
-        entities = get_modelspace(filename)
             
-        # Add the filename
-        listname = re.split(r'\\|\.', filename)
-        file = listname[-2]
+        saveinfo_path = raster_path(filename, filetype, tile_size)
+
+        # Skip the drawing, which was rendered from the same content with the same parameters
+        sidecar_file = sidecar_path(saveinfo_path)
+        if (not force) and manifest.is_done(filename, [filename], [saveinfo_path, sidecar_file]):
+            continue
         
-        # Define related parameters and check the existing save folder
-        list_folders = os.listdir('.\\DXF')
-        save_folder = '.\\'+filetype.upper()
-        trim_char = ['','DXF',file,'dxf']
+        tasks.append((filename, saveinfo_path, dpi, mode, tile_size, backend, supersample))
+    
+    failures = []
+    memory_limit = check_memory_limit(memory_limit)
+    
+    # With one worker (or one drawing), the drawings render in the current process, which keeps its backend and memory
+    initializer = render_worker_init
+    if min(resolve_workers(workers), max(len(tasks), 1)) == 1:
+        initializer = None
+        if memory_limit is not None:
+            print(f'The memory limit ({memory_limit} MB) applies to the worker processes only, '
+                  'the drawings render in the current process without the memory guard.')
+    
+    # The drawings are reported in the order of the files, while the workers render them concurrently
+    for idx, result, failure in run_ordered(rasterize_drawing, tasks, workers=workers, desc='Rasterization',
+                                            initializer=initializer, initargs=(memory_limit,)):
         
-        if not os.path.exists(save_folder):
-            os.makedirs(save_folder)
+        filename, saveinfo_path = tasks[idx][:2]
         
-        # Save file
-        if bool(len(list_files) != 0):
-            prior_folder = [folder for folder in listname if folder not in trim_char]
-            prior_folder = "".join(prior_folder)
-            if not os.path.exists(save_folder+'\\'+prior_folder): # Check the whether if existing folder is created
-                os.makedirs(save_folder+'\\'+prior_folder)
-            saveinfo_path = save_folder+'\\'+prior_folder+'\\'+file+'.'+filetype
-        else:
-            saveinfo_path = save_folder+'\\'+file+'.'+filetype
-
-        matplotlib.qsave(entities, filename=saveinfo_path, bg='#FFFFFF', fg='#000000', dpi=dpi, config=config)
-        
-        # Adjust the gray scale color
-        with Image.open(saveinfo_path) as img:
-            img = img.convert('L')
-            img.save(saveinfo_path)
+        # A failed drawing (damaged file or out of memory) is reported, and the batch goes on with the next drawing
+        if failure is not None:
+            failures.append(failure)
+            print('Failed drawing:', filename, failure.error)
+            continue
         
+        manifest.record(filename, [filename], [saveinfo_path, sidecar_path(saveinfo_path)])
         print('Saving location of file:', saveinfo_path)
     
+    if len(failures) != 0:
+        print(f'{len(failures)} drawing(s) failed:', [failure.task[0] for failure in failures])
+    manifest.compact()
+    print('Run manifest:', manifest.summary())
     print('\n','Complete!!!')
     gc.collect()
 
+def compare_images(reference, img):
+    
+    ''' Pixel difference of the image against the reference image (the same size): the mean absolute difference, the share of the
+    pixels which differ by more than a quarter of the gray scale, and the overlap (IoU) of the drawn (dark) pixels '''
+    
+    reference = np.asarray(reference.convert('L'), dtype=np.int16)
+    img = np.asarray(img.convert('L'), dtype=np.int16)
+    diff = np.abs(reference - img)
+    ink_ref, ink = reference < 128, img < 128
+    union = (ink_ref | ink).sum()
+    
+    return {'Mean Abs Diff': float(diff.mean()), 'Diff Pixels (%)': float((diff > 64).mean() * 100),
+            'Ink IoU': float((ink_ref & ink).sum() / union) if union else 1.0}, Image.fromarray((255 - diff).astype(np.uint8))
+
+def benchmark_backends(name: Path, dpi=720, supersample=2, limit=None):
+    
+    ''' Benchmark the Pillow backend against the matplotlib backend on the drawings of the plant, and then report the render
+    time and the pixel difference of each drawing (the same view and image size for both backends)
+    
+    The report is saved at '.\\Benchmark\\backend_benchmark.csv', and the difference image of each drawing (dark = different)
+    is saved next to it. '''
+    
+    # Set working directory, which there is sub-folder name 'DXF' consists of *.dxf files
+    os.chdir(name)
+    
+    list_files = get_file_list('DXF')[:limit]
+    save_folder = '.\\Benchmark'
+    if not os.path.exists(save_folder):
+        os.makedirs(save_folder)
+    render_worker_init()
+    rows = []
+    
+    for filename in tqdm(list_files):
+        entities = get_modelspace(filename)
+        xlim, ylim, size, _ = sheet_view(entities, dpi)
+        
+        start = time.perf_counter()
+        reference = render_window(entities, xlim, ylim, size, dpi=dpi)
+        time_matplotlib = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        img = render_window(entities, xlim, ylim, size, dpi=dpi, backend='pillow', supersample=supersample)
+        time_pillow = time.perf_counter() - start
+        
+        # Entities, which are drawn by the fallback (ezdxf frontend)
+        raster = PillowRaster(entities.doc, xlim, ylim, (1, 1), dpi=dpi)
+        fallback = sum(not raster.is_supported(e) for e in entities)
+        
+        metrics, diff = compare_images(reference, img)
+        file = os.path.splitext(os.path.basename(filename))[0]
+        diff.save(save_folder+'\\'+file+'_diff.png')
+        rows.append({'Filename': file, 'Size': f'{size[0]}x{size[1]}', 'Matplotlib (s)': time_matplotlib, 'Pillow (s)': time_pillow,
+                     'Speedup': time_matplotlib / time_pillow, 'Fallback Entities': fallback, **metrics})
+        plt.close('all')
+        gc.collect()
+    
+    report = pd.DataFrame(rows)
+    report.to_csv(save_folder+'\\backend_benchmark.csv', index=False)
+    print(report.to_string(index=False, float_format='{:.3f}'.format))
+    
+    return report
+
 # set your working directory:
 DIR = Path(".\\Use Case Project").expanduser()
 
 # Testing!!!
 # Ensure the working directory before executing!!!
 # All drawing file must be located in the 'DXF' sub-folder
+# Set workers=None to render the drawings on all CPU cores
 
-rasterize(name=DIR, filetype=png, dpi=720)
+if __name__ == '__main__':
+    rasterize(name=DIR, filetype='png', dpi=720)
@@ -1,4 +1,5 @@
 import importlib.util
+import subprocess
 import sys
 
 # For illustrative purposes.
@@ -14,7 +15,7 @@ elif (spec := importlib.util.find_spec(name)) is not None:
 else:
     print(f"can't find the {name!r} module")
     print(f"installation {name!r} is proceeding...")
-    !pip3 install Pillow
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'Pillow'])
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -23,75 +24,145 @@ import pandas as pd
 from pathlib import Path
 from PIL import Image
 import regex as re
+from drawing_catalogue import DrawingCatalogue, ensure_folder, reset_folders, scan_files
+from run_manifest import RunManifest
 from tqdm import tqdm
 
 def get_file_list(dir_name):
     
     ''' For the given path, get the List of all files in the directory tree '''
+
+    # The tree is walked once by os.scandir (see drawing_catalogue)
+    return scan_files(dir_name)
+
+# Target sizes of the resized drawings {label: (width, height)}, the empty label is saved at the root of the resized folder
+# l: 4077 x 2880 --- M: 2437 x 1721
+RESIZE_SIZES = {'': (2437, 1721)}
+
+# Both sizes in one pass, each size is saved into its label sub-folder ('.\Resized\L' and '.\Resized\M')
+RESIZE_SIZES_LM = {'L': (4077, 2880), 'M': (2437, 1721)}
+
+def rescale_icdar(df, scale):
+
+    ''' Rescale the pixel boxes of the ICDAR dataframe by the (x, y) scale of the resized drawing '''
+
+    df = df.copy()
+    df[['tlx', 'trx', 'brx', 'blx']] = df[['tlx', 'trx', 'brx', 'blx']].astype(float) * scale[0]
+    df[['tly', 'try', 'bry', 'bly']] = df[['tly', 'try', 'bry', 'bly']].astype(float) * scale[1]
+
+    return df
+
+def resize_pyramid(img, sizes, resample=Image.Resampling(1), reducing_gap=None):
+
+    ''' Resize the decoded image into all target sizes {label: (width, height)}, the largest size first
+
+    reducing_gap=None resizes each size from the source with the plain resampling filter (the same output as before).
+    With reducing_gap (e.g. 3.0), each size is resized from the smallest image so far (the source or a larger output), which is
+    at least reducing_gap times the target size, and the large reductions are first reduced by the integer box filter
+    (reducing_gap of PIL), so the slow resampling filter works on a few pixels. This is faster, but the pixels differ slightly
+    from the plain resize. Return {label: resized image}. '''
+
+    resized = {}
+    levels = [img]
+
+    for label, size in sorted(sizes.items(), key=lambda item: -item[1][0] * item[1][1]):
+        chained = [level for level in levels if (reducing_gap is not None) and (level.width >= reducing_gap * size[0]) and
+                   (level.height >= reducing_gap * size[1])]
+        source = chained[-1] if len(chained) != 0 else img
+        resized[label] = source.resize(tuple(size), resample=resample, reducing_gap=reducing_gap)
+        levels.append(resized[label])
+
+    return resized
+
+def resized_paths(file_location, sizes):
+
+    ''' Paths of the resized drawing {label: '.\\Resized\\<label>\\<sub-folders>\\<drawing>.png'} (the sub-folders are joined) '''
+
+    listname = re.split(r'\\|\.', file_location)
+    filename = listname[-2]
+    prior_folder = "".join([folder for folder in listname if folder not in ['','PNG',filename,'png']])
+
+    saveinfo_paths = {}
+    for label in sizes:
+        save_resized_folder = '.\\Resized' + ('\\'+label if label else '')
+        save_folder = save_resized_folder+'\\'+prior_folder if prior_folder else save_resized_folder
+        saveinfo_paths[label] = save_folder+'\\'+filename+'.png'
+
+    return saveinfo_paths
+
+def resize_drawing(file_location, file_icdar_location, saveinfo_paths, sizes, dpi=216, reducing_gap=None):
+
+    ''' Resize one drawing into all target sizes, the drawing is decoded once, and the ICDAR file (if any) is rescaled
+    into each size, and then saved next to the resized image (*.csv) '''
+
+    # Decode the drawing once for all target sizes
+    with Image.open(file_location) as img:
+        img.load()
+        source_size = img.size
+        img_resized = resize_pyramid(img, sizes, reducing_gap=reducing_gap)
+
+    df = pd.read_csv(file_icdar_location, index_col=0) if file_icdar_location is not None else None
+
+    # Save the resized images and reduce dpi from 300 to 216, and then the rescaled boxes of each size
+    for label, saveinfo_path in saveinfo_paths.items():
+        ensure_folder(os.path.dirname(saveinfo_path))
+        img_resized[label].save(saveinfo_path, dpi=(dpi, dpi))
+        if df is not None:
+            scale = (sizes[label][0] / source_size[0], sizes[label][1] / source_size[1])
+            rescale_icdar(df, scale).to_csv(os.path.splitext(saveinfo_path)[0]+'.csv')
+
+def resized_drawing(name: Path, dpi=216, force=False, sizes=None, reducing_gap=None):
     
-    # create a list of file and sub directories 
-    # names in the given directory 
-    list_of_file = os.listdir(dir_name)
-    all_files = []
-    
-    # Iterate over all the entries
-    for entry in list_of_file:
-        # Create full path
-        full_path = os.path.join(dir_name, entry)
-        # If entry is a directory then get the list of files in this directory 
-        if os.path.isdir(full_path):
-            all_files = all_files + get_file_list(full_path)
-        else:
-            all_files.append(full_path)
-                
-    return all_files
-
-def resized_drawing(name: Path, dpi=216):
-    
-    ''' Resize the drawing of specific folders into required size by using pillow library'''
+    ''' Resize the drawing of specific folders into required size by using pillow library, the unchanged drawings of the last run are skipped
+
+    Each drawing is decoded once, and then resized into all target sizes {label: (width, height)}, e.g. RESIZE_SIZES_LM
+    {'L': (4077, 2880), 'M': (2437, 1721)}, which are saved into the label sub-folder of '.\\Resized'. The ICDAR file of the
+    drawing is rescaled into each size at the same pass, and then saved next to the resized image (*.csv).
+    reducing_gap: see resize_pyramid, None keeps the plain resize of each size from the source '''
     
     # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
     os.chdir(name)
+    reset_folders()
     
     print('Drawing resize have been proceeding.')
     
-    raster_folder = ".\\PNG"
-    list_raster_files = get_file_list(raster_folder)
+    # The raster and ICDAR files are paired by the sub-folder and the drawing name, the raster without ICDAR file is resized alone
+    catalogue = DrawingCatalogue()
+    icdar_files = catalogue.files('ICDAR')
+    list_data_files = sorted(catalogue.files('PNG').items())
+    list_raster_files = [file_location for _, file_location in list_data_files]
+    list_icdar_files = [icdar_files.get(key) for key, _ in list_data_files]
+    for file_location in catalogue.missing('PNG', 'ICDAR')['ICDAR']:
+        print('Resizing the raster without ICDAR file (no boxes):', file_location)
+    
+    # Provide the target width and height of the images
+    sizes = {label: tuple(size) for label, size in (sizes or RESIZE_SIZES).items()}
+    manifest = RunManifest('resized_drawing', {'sizes': sizes, 'dpi': dpi, 'resample': 1, 'reducing_gap': reducing_gap})
          
     for idx in tqdm(range(len(list_raster_files))):
         
         file_location = list_raster_files[idx]
+        file_icdar_location = list_icdar_files[idx]
+
+        # Save file of each target size
+        saveinfo_paths = resized_paths(file_location, sizes)
+
+        inputs = [file_location] + ([file_icdar_location] if file_icdar_location is not None else [])
+        outputs = list(saveinfo_paths.values())
+        if file_icdar_location is not None:
+            outputs += [os.path.splitext(path)[0]+'.csv' for path in saveinfo_paths.values()]
+        
+        # Skip the drawing, which was resized from the same raster content with the same target sizes
+        if (not force) and manifest.is_done(file_location, inputs, outputs):
+            continue
         
-        with Image.open(file_location) as img:
-            
-            # Provide the target width and height of the image
-            # l: 4077 x 2880 --- M: 2437 x 1721
-            (width, height) = (2437, 1721)
-            
-            img_resized = img.resize((width, height), resample=Image.Resampling(1))
-            
-            listname = re.split(r'\\|\.', file_location)
-            filename = listname[-2]
-            save_resized_folder = '.\\Resized'
-            trim_char = ['','PNG',filename,'png']
-
-            if not os.path.exists(save_resized_folder):
-                os.makedirs(save_resized_folder)
-
-            # Save file
-            if bool(len(list_raster_files) != 0):
-
-                prior_folder = [folder for folder in listname if folder not in trim_char]
-                prior_folder = "".join(prior_folder)
-                if not os.path.exists(save_resized_folder+'\\'+prior_folder): # Check the whether if existing folder is created
-                    os.makedirs(save_resized_folder+'\\'+prior_folder)
-                saveinfo_path = save_resized_folder+'\\'+prior_folder+'\\'+filename+'.png'
-                print('Saving resized image file at:', saveinfo_path)
-            else:
-                saveinfo_path = save_resized_folder+'\\'+filename+'.png'
-                
-        # Save the resized image and reduce dpi from 300 to 216
-        img_resized.save(saveinfo_path, dpi=(dpi, dpi))
+        print('Saving resized image files at:', ', '.join(saveinfo_paths.values()))
+        
+        resize_drawing(file_location, file_icdar_location, saveinfo_paths, sizes, dpi, reducing_gap)
+        manifest.record(file_location, inputs, outputs)
+    
+    manifest.compact()
+    print('Run manifest:', manifest.summary())
     
 # set your working directory:
 DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Project").expanduser()
@@ -99,4 +170,7 @@ DIR = Path("D:\\ENQA\\Training\\VISTEC\\[2021] Data Science Lv2\\Use Case Projec
 # Testing!!!
 # Ensure the working directory before executing!!!
 
-resized_drawing(DIR, dpi=96)
+if __name__ == '__main__':
+    resized_drawing(DIR, dpi=96)
+    # Both sizes in one pass, with the faster chained reduction:
+    # resized_drawing(DIR, dpi=96, sizes=RESIZE_SIZES_LM, reducing_gap=3.0)
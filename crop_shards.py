@@ -0,0 +1,155 @@
+import glob
+import io
+import json
+import numpy as np
+import os
+from PIL import Image
+import tarfile
+import time
+
+# Default target size of one shard (bytes)
+SHARD_SIZE = 256 * 1024 * 1024
+
+# Index file of the shard folder, which is written last
+INDEX_FILE = 'shards.json'
+
+def encode_image(img, fmt='png'):
+
+    ''' Encode the image (PIL image or pixel array) into the file bytes '''
+
+    if isinstance(img, np.ndarray):
+        img = Image.fromarray(np.ascontiguousarray(img))
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt.upper())
+
+    return buffer.getvalue()
+
+class ShardWriter:
+
+    ''' Write the encoded crops into the tar shards ({prefix}-000000.tar, ...) of the target size
+
+    Each sample is kept as 2 members of the same key: the image ({key}.png) and its metadata ({key}.json), e.g. the label,
+    the source drawing and the box. A shard is written into a temporary file, and then renamed when it is full, so the reader
+    never sees an incomplete shard. The index of all shards is written at the end. '''
+
+    def __init__(self, folder, prefix='crops', shard_size=SHARD_SIZE, fmt='png'):
+
+        self.folder = folder
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.fmt = fmt
+        self.shards = []
+        self.count = 0
+        self._tar = None
+        self._path = None
+        self._samples = 0
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # The shards of the last run are replaced, so no stale shard is left behind the new index
+        for stale in glob.glob(os.path.join(folder, f'{prefix}-*.tar')) + [os.path.join(folder, INDEX_FILE)]:
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    def _open(self):
+
+        self._path = os.path.join(self.folder, f'{self.prefix}-{len(self.shards):06d}.tar')
+        self._tar = tarfile.open(self._path + '.tmp', mode='w')
+        self._samples = 0
+
+    def _close(self):
+
+        if self._tar is None:
+            return
+        self._tar.close()
+        os.replace(self._path + '.tmp', self._path)
+        self.shards.append({'File': os.path.basename(self._path), 'Samples': self._samples, 'Bytes': os.path.getsize(self._path)})
+        self._tar = None
+
+    def _add(self, name, data):
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def write(self, image, metadata):
+
+        ''' Append one sample, the image is the encoded bytes, PIL image or pixel array '''
+
+        if self._tar is None:
+            self._open()
+
+        data = image if isinstance(image, bytes) else encode_image(image, self.fmt)
+        key = f'{self.count:09d}'
+        self._add(f'{key}.{self.fmt}', data)
+        self._add(f'{key}.json', json.dumps(metadata, default=str).encode('utf-8'))
+        self.count += 1
+        self._samples += 1
+
+        # Start the next shard, when the current shard reaches the target size
+        if self._tar.fileobj.tell() >= self.shard_size:
+            self._close()
+
+    def close(self):
+
+        self._close()
+        index = {'Prefix': self.prefix, 'Format': self.fmt, 'Samples': self.count, 'Shards': self.shards}
+        with open(os.path.join(self.folder, INDEX_FILE), 'w') as f:
+            json.dump(index, f)
+
+        return [os.path.join(self.folder, shard['File']) for shard in self.shards]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def shard_files(path):
+
+    ''' Shard files of the shard folder (the index order, or the file order without the index) or the list of shard files '''
+
+    if isinstance(path, (list, tuple)):
+        return list(path)
+    if not os.path.isdir(path):
+        return [path]
+
+    index_file = os.path.join(path, INDEX_FILE)
+    if os.path.exists(index_file):
+        with open(index_file, 'r') as f:
+            return [os.path.join(path, shard['File']) for shard in json.load(f)['Shards']]
+
+    return sorted(glob.glob(os.path.join(path, '*.tar')))
+
+def read_shards(path, decode=True):
+
+    ''' Stream the samples of the shards one by one: {'Key', 'Image', ...metadata}
+
+    The tar files are read sequentially (no seek), so the shards can also be read from a pipe or a network file system.
+    decode=False keeps the encoded image bytes. '''
+
+    for shard in shard_files(path):
+        with tarfile.open(shard, mode='r|') as tar:
+            sample = {}
+            for member in tar:
+                if not member.isfile():
+                    continue
+                key, ext = member.name.split('.', 1)
+                # The members of the same key are consecutive, the sample is finished when the next key starts
+                if sample and (sample['Key'] != key):
+                    yield sample
+                    sample = {}
+                sample['Key'] = key
+                data = tar.extractfile(member).read()
+                if ext == 'json':
+                    sample.update(json.loads(data.decode('utf-8')))
+                elif decode:
+                    with Image.open(io.BytesIO(data)) as img:
+                        img.load()
+                        sample['Image'] = img
+                else:
+                    sample['Image'] = data
+            if sample:
+                yield sample
@@ -0,0 +1,135 @@
+import os
+import regex as re
+
+# Folders of the drawing artefacts at the plant level (working directory), and the extensions of each kind
+ARTEFACT_FOLDERS = {'DWG': 'DWG', 'DXF': 'DXF', 'PNG': 'PNG', 'CSV': 'CSV', 'ICDAR': 'ICDAR', 'RasterMeta': 'RasterMeta'}
+ARTEFACT_EXTENSIONS = {'DWG': ('.dwg',), 'DXF': ('.dxf',), 'PNG': ('.png', '.jpg', '.jpeg', '.tif', '.tiff'), 'CSV': ('.csv',),
+                       'ICDAR': ('.csv',), 'RasterMeta': ('.json',)}
+
+# Folders created (or found) in the current run, see reset_folders
+_created_folders = set()
+
+def scan_files(dir_name, extensions=None):
+
+    ''' For the given path, get the list of all files in the directory tree (sorted), the tree is walked once by os.scandir
+
+    The directory entries carry their type, so no extra stat call is made per file, which matters on the network shares. '''
+
+    all_files = []
+    folders = [dir_name]
+
+    while len(folders) != 0:
+        folder = folders.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            # Create full path (the same as os.path.join of the folder and the name)
+            full_path = os.path.join(folder, entry.name)
+            if entry.is_dir():
+                folders.append(full_path)
+            elif (extensions is None) or entry.name.lower().endswith(tuple(extensions)):
+                all_files.append(full_path)
+
+    return sorted(all_files)
+
+def artefact_key(path, folder, plant=''):
+
+    ''' Key of the artefact: (plant, sub-folder, drawing stem)
+
+    The sub-folders under the artefact folder are joined into one name, the same as the output folders of the scripts
+    (.\\DXF\\Area\\Unit\\file.dxf and .\\PNG\\AreaUnit\\file.png have the same key). '''
+
+    relative = os.path.relpath(path, folder)
+    parts = [part for part in re.split(r'[\\/]+', os.path.splitext(relative)[0]) if part not in ('', '.')]
+
+    return (plant, "".join(parts[:-1]), parts[-1])
+
+def ensure_folder(folder):
+
+    ''' Create the folder, if it does not exist, the created (or existing) folders are cached, so each folder is checked once per run '''
+
+    if not folder:
+        return folder
+
+    path = os.path.abspath(folder)
+    if path not in _created_folders:
+        os.makedirs(path, exist_ok=True)
+        _created_folders.add(path)
+
+    return folder
+
+def reset_folders():
+
+    ''' Forget the folders of the last run, which is called at the start of each run, so the folders deleted since then (e.g. the
+    output folders cleaned between two runs of the same session) are created again '''
+
+    _created_folders.clear()
+
+class DrawingCatalogue:
+
+    ''' Catalogue of the drawing artefacts of one plant, each artefact folder is scanned once and keyed by (plant, sub-folder, stem)
+
+    The artefacts of the same drawing are paired by their keys, so a missing or extra file never shifts the other pairs. '''
+
+    def __init__(self, root='.', plant=None, folders=None):
+
+        self.root = root
+        self.plant = plant if plant is not None else os.path.basename(os.path.abspath(root))
+        self.folders = dict(ARTEFACT_FOLDERS, **(folders or {}))
+        self._files = {}
+
+    def folder(self, kind):
+        return os.path.join(self.root, self.folders.get(kind, kind))
+
+    def files(self, kind):
+
+        ''' {key: path} of the artefact kind, the first file (sorted) is kept, when two files have the same key '''
+
+        if kind not in self._files:
+            folder = self.folder(kind)
+            files = {}
+            for path in scan_files(folder, ARTEFACT_EXTENSIONS.get(kind)):
+                key = artefact_key(path, folder, self.plant)
+                if key in files:
+                    print(f'Duplicated {kind} file of the drawing {key[1:]}:', path, '(kept:', files[key] + ')')
+                    continue
+                files[key] = path
+            self._files[kind] = files
+
+        return self._files[kind]
+
+    def paths(self, kind):
+
+        ''' Paths of the artefact kind in the key order '''
+
+        return [path for _, path in sorted(self.files(kind).items())]
+
+    def pairs(self, *kinds):
+
+        ''' Pair the artefacts of the same drawing: [(key, path of kind 1, path of kind 2, ...)] in the key order
+
+        Only the drawings, which have all kinds, are paired, the others are returned by missing(). '''
+
+        files = [self.files(kind) for kind in kinds]
+        keys = sorted(set(files[0]).intersection(*files[1:]))
+
+        return [(key,) + tuple(f[key] for f in files) for key in keys]
+
+    def missing(self, *kinds):
+
+        ''' {kind: [paths]} of the first kind, which have no artefact of the other kind '''
+
+        files = self.files(kinds[0])
+
+        return {kind: [files[key] for key in sorted(set(files) - set(self.files(kind)))] for kind in kinds[1:]}
+
+    def refresh(self, kind=None):
+
+        ''' Scan the folder again (all folders by default) on the next access, e.g. after a stage has written its outputs '''
+
+        if kind is None:
+            self._files.clear()
+        else:
+            self._files.pop(kind, None)
@@ -0,0 +1,89 @@
+import ezdxf
+from ezdxf import recover
+from entity_table import build_entity_table
+from streaming_loader import stream_drawing
+import numpy as np
+import sys
+
+class DrawingSession:
+
+    ''' Parse a DXF file once, and then share the document, the model space queries and the frame dimension between all extraction stages '''
+
+    def __init__(self, filename, frame_func=None, audit=False, bbox_mode='path', types=None):
+
+        self.filename = filename
+        self.bbox_mode = bbox_mode
+        self._frame_func = frame_func
+        self._queries = {}
+        self._frame_dim = None
+        self._entity_table = None
+        self._labels = {}
+
+        # Safe file loading procedure, the file is parsed only one time per session
+        # The extraction-only run (types is given) streams the model space, and keeps only the entities of the given types
+        try:
+            if audit:
+                self.doc, self.auditor = recover.readfile(filename)
+                self.modelspace = self.doc.modelspace()
+            elif types is not None:
+                self.doc, self.modelspace = stream_drawing(filename, types)
+                self.auditor = None
+            else:
+                self.doc, self.auditor = ezdxf.readfile(filename), None
+                self.modelspace = self.doc.modelspace()
+        except IOError:
+            print(f'Not a DXF file or a generic I/O error.')
+            sys.exit(1)
+        except ezdxf.DXFStructureError:
+            print(f'Invalid or corrupted DXF file.')
+            sys.exit(2)
+
+    def query(self, query_string='*'):
+
+        ''' Query the model space, the result of each query string is kept for the next stage '''
+
+        if query_string not in self._queries:
+            self._queries[query_string] = self.modelspace.query(query_string)
+
+        return self._queries[query_string]
+
+    @property
+    def frame_dim(self):
+
+        ''' Drawing frame dimension (width x height), which is calculated only one time per session '''
+
+        if self._frame_dim is None:
+            if self._frame_func is None:
+                raise ValueError('No frame function was given to the drawing session.')
+            self._frame_dim = self._frame_func(self)
+
+        return self._frame_dim
+
+    @property
+    def entity_table(self):
+
+        ''' Columnar table of the text, insert and attribute entities, which is filled in one model space pass per session '''
+
+        if self._entity_table is None:
+            self._entity_table = build_entity_table(self.modelspace)
+
+        return self._entity_table
+
+    def classify(self, classifier, types=('TEXT',)):
+
+        ''' Label the text rows of the entity table with the line number classifier, the masks are kept for the next stage '''
+
+        key = (id(classifier), types)
+        if key not in self._labels:
+            table = self.entity_table
+            rows = np.flatnonzero(table.is_type(*types))
+            masks = {}
+            for label, mask in classifier.classify(table['text'][rows]).items():
+                masks[label] = np.zeros(len(table), dtype=bool)
+                masks[label][rows[mask]] = True
+            self._labels[key] = masks
+
+        return self._labels[key]
+
+    def __iter__(self):
+        return iter(self.modelspace)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+# Columns of the entity table
+TABLE_COLUMNS = ['handle', 'type', 'text', 'x', 'y', 'rotation', 'height', 'style', 'block', 'xscale', 'yscale', 'owner']
+
+STRING_COLUMNS = ['handle', 'type', 'text', 'style', 'block']
+
+class EntityTable:
+
+    ''' Columnar table (NumPy arrays) of the text, insert and attribute entities in the model space '''
+
+    def __init__(self, columns, entities):
+
+        self.columns = columns
+        self.entities = entities
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def is_type(self, *types):
+
+        ''' Boolean mask of the rows, which have one of the given entity types '''
+
+        return np.isin(self.columns['type'], types)
+
+    def startswith(self, name, prefixes):
+
+        ''' Boolean mask of the rows, which the given string column starts with one of the prefixes '''
+
+        mask = np.zeros(len(self), dtype=bool)
+        for prefix in prefixes:
+            mask |= np.char.startswith(self.columns[name], prefix)
+
+        return mask
+
+    def owner_column(self, name):
+
+        ''' Value of the given column from the owner insert of each attribute row (own value for the other rows) '''
+
+        owner = self.columns['owner']
+        idx = np.where(owner >= 0, owner, np.arange(len(self)))
+
+        return self.columns[name][idx]
+
+    def take(self, mask):
+
+        ''' Create the sub table of the selected rows, the owner index is kept only for the selected owners '''
+
+        rows = np.flatnonzero(mask)
+        columns = {name: col[rows] for name, col in self.columns.items()}
+
+        # Remap the owner index into the sub table
+        position = np.full(len(self), -1)
+        position[rows] = np.arange(rows.shape[0])
+        owner = columns['owner']
+        columns['owner'] = np.where(owner >= 0, position[np.maximum(owner, 0)], -1)
+
+        return EntityTable(columns, self.entities[rows])
+
+    def to_frame(self, columns=None):
+
+        ''' Convert the table into pandas dataframe, the entity object is kept in the 'ID' column '''
+
+        columns = list(self.columns) if columns is None else columns
+        df = pd.DataFrame({name: self.columns[name] for name in columns})
+        df.insert(0, 'ID', self.entities)
+
+        return df
+
+def build_entity_table(model_space, types=('TEXT', 'INSERT')):
+
+    ''' Fill the columnar entity table in one pass over the model space, the attributes of inserts are added after their owner '''
+
+    rows = {name: [] for name in TABLE_COLUMNS}
+    entities = []
+
+    def add_row(e, dxftype, owner):
+        dxf = e.dxf
+        insert = dxf.insert
+        is_insert = (dxftype == 'INSERT')
+        rows['handle'].append(dxf.handle)
+        rows['type'].append(dxftype)
+        rows['text'].append('' if is_insert else dxf.text)
+        rows['x'].append(insert[0])
+        rows['y'].append(insert[1])
+        rows['rotation'].append(float(dxf.rotation))
+        rows['height'].append(np.nan if is_insert else dxf.height)
+        rows['style'].append('' if is_insert else dxf.style)
+        rows['block'].append(dxf.name if is_insert else '')
+        rows['xscale'].append(float(dxf.xscale) if is_insert else 1.0)
+        rows['yscale'].append(float(dxf.yscale) if is_insert else 1.0)
+        rows['owner'].append(owner)
+        entities.append(e)
+
+    for e in model_space:
+        dxftype = e.dxftype()
+        if dxftype not in types:
+            continue
+        add_row(e, dxftype, -1)
+        if dxftype == 'INSERT':
+            owner = len(entities) - 1
+            for attrib in e.attribs:
+                add_row(attrib, 'ATTRIB', owner)
+
+    columns = {}
+    for name, values in rows.items():
+        if name in STRING_COLUMNS:
+            columns[name] = np.array(values, dtype=str)
+        elif name == 'owner':
+            columns[name] = np.array(values, dtype=int)
+        else:
+            columns[name] = np.array(values, dtype=float)
+
+    entity_array = np.empty(len(entities), dtype=object)
+    entity_array[:] = entities
+
+    return EntityTable(columns, entity_array)
@@ -0,0 +1,306 @@
+from contextlib import contextmanager
+from ezdxf import bbox
+import hashlib
+import json
+import numpy as np
+import os
+import tempfile
+import time
+
+# Title block names of the drawing templates, which are used as the drawing frame
+FRAME_NAME_LIST = ['CCP_A1_Template FOR PID-20180103','CCP_A1_Template FOR PID','CCP_A1_Template FOR PID-REV.0',
+                   'CCP_A1_Template FOR UDD','FW TIT','Title Block-UHV-01','gtdf','A$C46B42D60']
+
+FRAME_CACHE_FILE = os.path.join('Cache', 'frame_cache.json')
+
+# In-process memo of the content hash per drawing file (path, size and modification time)
+_hash_memo = {}
+
+def drawing_hash(filename, chunk_size=1 << 20):
+
+    ''' Calculate the content hash (SHA-1) of the drawing file, the same hash as run_manifest.file_hash
+
+    The hash is kept per file size and modification time, so the frame detection and the run manifest hash the file once. '''
+
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if key in _hash_memo:
+        return _hash_memo[key]
+
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    _hash_memo[key] = sha1.hexdigest()
+
+    return _hash_memo[key]
+
+class FrameCache:
+
+    ''' Persistent cache of frame dimensions per drawing content hash, and the local extents per title block template '''
+
+    def __init__(self, path=FRAME_CACHE_FILE):
+
+        self.path = path
+        self.drawings = {}
+        self.templates = {}
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.drawings = data.get('drawings', {})
+            self.templates = data.get('templates', {})
+
+    def get(self, key):
+
+        frame_dim = self.drawings.get(key)
+        if frame_dim is not None:
+            frame_dim = dict(frame_dim, **{'Frame Originate': tuple(frame_dim['Frame Originate'])})
+
+        return frame_dim
+
+    def put(self, key, frame_dim):
+
+        self.drawings[key] = dict(frame_dim, **{'Frame Originate': list(frame_dim['Frame Originate'])})
+        self.save()
+
+    def save(self):
+
+        ''' Merge the entries into the cache file, the workers of the process pool save into the same file
+
+        The file is re-read and merged under the lock file, and then written into a unique temporary file, which replaces the cache.
+        A failed save only loses the persistence, the entries are still kept in this process. '''
+
+        try:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+
+            with cache_lock(self.path + '.lock'):
+                if os.path.exists(self.path):
+                    with open(self.path, 'r') as f:
+                        data = json.load(f)
+                    self.drawings = dict(data.get('drawings', {}), **self.drawings)
+                    self.templates = dict(data.get('templates', {}), **self.templates)
+
+                # Write into a temporary file first, so an interrupted run never leaves a broken cache
+                handle, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', suffix='.tmp', dir=folder or '.')
+                try:
+                    with os.fdopen(handle, 'w') as f:
+                        json.dump({'drawings': self.drawings, 'templates': self.templates}, f)
+                    os.replace(temp_path, self.path)
+                except BaseException:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+
+        except (OSError, ValueError) as e:
+            print('Frame cache is not saved:', f'{type(e).__name__}: {e}')
+            return False
+
+        return True
+
+@contextmanager
+def cache_lock(path, timeout=30.0, stale=60.0):
+
+    ''' Lock file of the cache across the processes (the lock file is created exclusively), the lock of a crashed process is
+    taken over after the stale time '''
+
+    start = time.monotonic()
+    while True:
+        try:
+            handle = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale:
+                    os.remove(path)
+                    continue
+            except OSError: # The lock has just been released
+                continue
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f'The lock file is held by another process: {path}')
+            time.sleep(0.01)
+
+    try:
+        yield
+    finally:
+        os.close(handle)
+        os.remove(path)
+
+# In-process memo of the frame dimension per drawing content hash
+_frame_memo = {}
+_frame_cache = None
+
+def get_frame_cache(path=FRAME_CACHE_FILE):
+
+    ''' Get the persistent frame cache of the current working directory (plant level) '''
+
+    global _frame_cache
+
+    if (_frame_cache is None) or (_frame_cache.path != path):
+        _frame_cache = FrameCache(path)
+
+    return _frame_cache
+
+def frame_candidates(model_space, frame_name_list=FRAME_NAME_LIST):
+
+    ''' Pull the candidate frame geometry out of the model space in one pass into NumPy arrays '''
+
+    faces = []
+    polylines = []
+    lines = []
+    inserts = []
+
+    for e in model_space:
+        dxftype = e.dxftype()
+        if dxftype == '3DFACE':
+            faces.append( [(v[0], v[1]) for v in (e.dxf.vtx0, e.dxf.vtx1, e.dxf.vtx2, e.dxf.vtx3)] )
+        elif dxftype == 'LWPOLYLINE':
+            if (e.dxf.flags == 1) & (len(e) == 4):
+                polylines.append( e.get_points(format='xy') )
+        elif dxftype == 'LINE':
+            starts = e.dxf.start
+            ends = e.dxf.end
+            if (ends[1] - starts[1]) == 0:
+                lines.append( [starts[0], starts[1], ends[0], ends[1]] )
+        elif dxftype == 'INSERT':
+            if e.dxf.name in frame_name_list:
+                inserts.append(e)
+
+    # The streamed model space keeps the horizontal segments of the LINE entities as one array, not as the entities
+    lines = np.array(lines, dtype=float).reshape(-1, 4)
+    if hasattr(model_space, 'horizontal_lines'):
+        lines = np.vstack([lines, model_space.horizontal_lines])
+
+    candidates = {'3DFACE': np.array(faces, dtype=float).reshape(-1, 4, 2),
+                  'LWPOLYLINE': np.array(polylines, dtype=float).reshape(-1, 4, 2),
+                  'LINE': lines,
+                  'INSERT': inserts}
+
+    return candidates
+
+def _lexicographic_min(vertices):
+
+    ''' Get the smallest vertex (compare x, and then y) of each (N, 4, 2) quadrilateral, same as min() of tuples '''
+
+    order = np.lexsort((vertices[:, :, 1], vertices[:, :, 0]), axis=-1)[:, 0]
+
+    return vertices[np.arange(vertices.shape[0]), order]
+
+def _largest_frame(width, height, originate):
+
+    ''' Pick the frame, which has the largest diagonal '''
+
+    width = np.round(width, 4)
+    height = np.round(height, 4)
+    originate = np.round(originate, 4)
+    idx = int(np.argmax((width**2 + height**2)**0.5))
+
+    frame_dim = {'Frame Width': float(width[idx]),
+                 'Frame Height': float(height[idx]),
+                 'Frame Originate': (float(originate[idx, 0]), float(originate[idx, 1]))}
+
+    return frame_dim
+
+def template_extents(insert, cache=None):
+
+    ''' Get the local extents of the title block definition, the extents are kept per template in the frame cache '''
+
+    block = insert.doc.blocks.get(insert.dxf.name)
+    key = f'{insert.dxf.name}|{len(block)}|{tuple(block.block.dxf.base_point)}'
+
+    if (cache is not None) and (key in cache.templates):
+        return np.array(cache.templates[key], dtype=float)
+
+    ext = bbox.extents(block)
+    extents = np.array([ext.extmin[0], ext.extmin[1], ext.extmax[0], ext.extmax[1]], dtype=float)
+
+    if cache is not None:
+        cache.templates[key] = extents.tolist()
+        cache.save()
+
+    return extents
+
+def insert_frame(inserts, cache=None):
+
+    ''' Calculate the frame from the title block inserts by transforming the template extents with the insert matrix '''
+
+    ext_min = []
+    ext_max = []
+
+    for insert in inserts:
+        xmin, ymin, xmax, ymax = template_extents(insert, cache)
+        corners = insert.matrix44().transform_vertices([(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)])
+        corners = np.array([(v.x, v.y) for v in corners])
+        ext_min.append(corners.min(axis=0))
+        ext_max.append(corners.max(axis=0))
+
+    ext_min = np.array(ext_min)
+    ext_max = np.array(ext_max)
+
+    return _largest_frame(np.abs(ext_max[:, 0] - ext_min[:, 0]), np.abs(ext_max[:, 1] - ext_min[:, 1]), ext_min)
+
+def detect_frame(candidates, cache=None):
+
+    ''' Calculate the drawing frame dimension (width x height) from the candidate geometry with vectorized math '''
+
+    faces = candidates['3DFACE']
+    polylines = candidates['LWPOLYLINE']
+    lines = candidates['LINE']
+
+    if faces.shape[0] != 0:
+        frame_dim = _largest_frame(np.abs(faces[:, 2, 0] - faces[:, 0, 0]), np.abs(faces[:, 2, 1] - faces[:, 0, 1]),
+                                   _lexicographic_min(faces))
+
+    elif len(candidates['INSERT']) != 0:
+        frame_dim = insert_frame(candidates['INSERT'], cache)
+
+    else:
+        frames = []
+
+        # The largest closed rectangle polyline
+        if polylines.shape[0] != 0:
+            frames.append( _largest_frame(np.abs(polylines[:, 3, 0] - polylines[:, 1, 0]),
+                                          np.abs(polylines[:, 3, 1] - polylines[:, 1, 1]),
+                                          _lexicographic_min(polylines)) )
+
+        # The frame, which is spanned by the horizontal lines
+        if lines.shape[0] != 0:
+            lowleft = lines[np.lexsort((lines[:, 1], lines[:, 0]))[0], 0:2]
+            upright = lines[np.lexsort((-lines[:, 3], -lines[:, 2]))[0], 2:4]
+            lowleft = np.round(lowleft, 4)
+            upright = np.round(upright, 4)
+            frames.append( {'Frame Width': round(float(upright[0] - lowleft[0]), 4),
+                            'Frame Height': round(float(upright[1] - lowleft[1]), 4),
+                            'Frame Originate': (float(lowleft[0]), float(lowleft[1]))} )
+
+        if len(frames) == 0:
+            raise ValueError('There is no drawing frame candidate in the model space.')
+
+        frame_dim = max(frames, key=lambda frame: frame['Frame Width'])
+
+    return frame_dim
+
+def frame_dimension(model_space, filename=None, frame_name_list=FRAME_NAME_LIST, cache_path=FRAME_CACHE_FILE):
+
+    ''' Calculate the drawing frame dimension, the result is memoized per drawing content hash '''
+
+    cache = get_frame_cache(cache_path) if cache_path is not None else None
+    key = drawing_hash(filename) if filename is not None else None
+
+    if key is not None:
+        if key in _frame_memo:
+            return dict(_frame_memo[key])
+        if (cache is not None) and (cache.get(key) is not None):
+            _frame_memo[key] = cache.get(key)
+            return dict(_frame_memo[key])
+
+    frame_dim = detect_frame(frame_candidates(model_space, frame_name_list), cache)
+
+    if key is not None:
+        _frame_memo[key] = frame_dim
+        if cache is not None:
+            cache.put(key, frame_dim)
+
+    return dict(frame_dim)
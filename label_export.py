@@ -0,0 +1,155 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+
+# Columns of the ICDAR file (the 4 corners of the box and the text)
+ICDAR_COLUMNS = ['tlx', 'tly', 'trx', 'try', 'brx', 'bry', 'blx', 'bly', 'text']
+
+# Number pattern of the point text "(x, y)"
+POINT_PATTERN = r'\(?\s*([-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*,\s*([-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*\)?'
+
+def point_columns(df, column):
+
+    ''' Get the X and Y arrays of the point column: the float columns of the result store, the (x, y) tuples or the "(x, y)" texts '''
+
+    if (f'{column} X' in df.columns) and (f'{column} Y' in df.columns):
+        return df[f'{column} X'].to_numpy(dtype=float), df[f'{column} Y'].to_numpy(dtype=float)
+
+    values = df[column]
+    if (len(values) != 0) and isinstance(values.iloc[0], (tuple, list, np.ndarray)):
+        points = np.array([tuple(value)[:2] for value in values], dtype=float).reshape(-1, 2)
+        return points[:, 0], points[:, 1]
+
+    # All texts of the column are parsed at once by the regular expression of pandas
+    points = values.astype(str).str.extract(POINT_PATTERN).astype(float).to_numpy()
+
+    return points[:, 0], points[:, 1]
+
+def icdar_quads(df, text_column='Name'):
+
+    ''' Convert the LowLeft and UpRight pixels of the results into the 4 corners (8 positions) of the ICDAR boxes
+
+    The top of the box is the UpRight Y and the bottom is the LowLeft Y (the image pixels are flipped in y). '''
+
+    if df.shape[0] == 0:
+        return pd.DataFrame(columns=ICDAR_COLUMNS)
+
+    blx, bly = point_columns(df, 'LowLeft')
+    trx, _try = point_columns(df, 'UpRight')
+
+    return pd.DataFrame({'tlx': blx, 'tly': _try, 'trx': trx, 'try': _try, 'brx': trx, 'bry': bly, 'blx': blx, 'bly': bly,
+                         'text': df[text_column].to_numpy()}, index=df.index, columns=ICDAR_COLUMNS)
+
+def line_rows(df):
+
+    ''' One row per line number: the text without partner, and the first text of each pair, with the combined box (Line LowLeft
+    and Line UpRight) and the merged line name (Line Name) of the pair. The results without the line boxes are unchanged. '''
+
+    if (df.shape[0] == 0) or not any(c.startswith('Line LowLeft') for c in df.columns):
+        return df
+
+    pair = pd.to_numeric(df['Pair'], errors='coerce').fillna(-1).to_numpy()
+    keep = (pair < 0) | ~pd.Series(pair).duplicated().to_numpy()
+    llx, lly = point_columns(df, 'Line LowLeft')
+    urx, ury = point_columns(df, 'Line UpRight')
+
+    df = df.assign(**{'Name': df['Line Name'], 'LowLeft X': llx, 'LowLeft Y': lly, 'UpRight X': urx, 'UpRight Y': ury})
+
+    return df[keep]
+
+def quad_boxes(icdar_df):
+
+    ''' Get the (N,4) array of the axis aligned boxes (left, top, right, bottom) of the ICDAR quads '''
+
+    x = icdar_df[['tlx', 'trx', 'brx', 'blx']].to_numpy(dtype=float).reshape(-1, 4)
+    y = icdar_df[['tly', 'try', 'bry', 'bly']].to_numpy(dtype=float).reshape(-1, 4)
+
+    return np.column_stack([x.min(axis=1), y.min(axis=1), x.max(axis=1), y.max(axis=1)])
+
+class CocoWriter:
+
+    ''' Write the COCO annotation file incrementally, one image (and its annotations) at a time
+
+    The images are written straight into the file, and the annotations are spooled into a temporary file, which is appended
+    at the end, so neither list is held in memory. The file is written into a temporary file, and then renamed at the end. '''
+
+    def __init__(self, path, categories=('text',)):
+
+        self.path = path
+        self.categories = list(categories)
+        self.image_id = 0
+        self.annotation_id = 0
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self._file = open(path + '.tmp', 'w')
+        self._spool = tempfile.TemporaryFile(mode='w+')
+        self._file.write('{"info": {"description": "P&ID text boxes"}, "images": [')
+
+    def add_image(self, file_name, size, boxes, labels=None):
+
+        ''' Add one image (width, height) and its boxes (N,4: left, top, right, bottom) in pixels, labels are the category names '''
+
+        self.image_id += 1
+        width, height = size
+        image = {'id': self.image_id, 'file_name': file_name, 'width': int(width), 'height': int(height)}
+        self._file.write((',' if self.image_id > 1 else '') + json.dumps(image))
+
+        labels = labels if labels is not None else [self.categories[0]] * len(boxes)
+        for box, label in zip(np.asarray(boxes, dtype=float).reshape(-1, 4).tolist(), labels):
+            left, top, right, bottom = box
+            self.annotation_id += 1
+            annotation = {'id': self.annotation_id, 'image_id': self.image_id, 'category_id': self.categories.index(label) + 1,
+                          'bbox': [left, top, right - left, bottom - top], 'area': (right - left) * (bottom - top),
+                          'iscrowd': 0}
+            self._spool.write((',' if self.annotation_id > 1 else '') + json.dumps(annotation))
+
+    def close(self):
+
+        self._file.write('], "annotations": [')
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, self._file)
+        self._spool.close()
+        categories = [{'id': i + 1, 'name': name} for i, name in enumerate(self.categories)]
+        self._file.write('], "categories": ' + json.dumps(categories) + '}')
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+        return self.path
+
+def yolo_lines(boxes, size, classes=None):
+
+    ''' YOLO label lines (class, centre x, centre y, width, height normalized by the image size) of the boxes
+
+    The corners are clipped into the image first, so the box across the image edge keeps only its visible part, and the boxes
+    without any visible area are dropped. '''
+
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    width, height = size
+    boxes = np.clip(boxes, 0, [width, height, width, height])
+    visible = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    classes = np.asarray(classes if classes is not None else [0] * len(boxes))[visible]
+    boxes = boxes[visible]
+
+    centre = np.column_stack([(boxes[:, 0] + boxes[:, 2]) / 2 / width, (boxes[:, 1] + boxes[:, 3]) / 2 / height])
+    extent = np.column_stack([(boxes[:, 2] - boxes[:, 0]) / width, (boxes[:, 3] - boxes[:, 1]) / height])
+
+    return [f'{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}' for c, (x, y, w, h) in zip(classes.tolist(), np.hstack([centre, extent]).tolist())]
+
+def write_yolo(path, boxes, size, classes=None):
+
+    ''' Write the YOLO label file of one image '''
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(yolo_lines(boxes, size, classes)))
+
+    return path
@@ -0,0 +1,86 @@
+from collections import Counter
+import numpy as np
+import regex as re
+
+DIGITS = frozenset('0123456789')
+
+class Rule:
+
+    ''' Line number pattern rule, the label is the pattern name (F, P1, S1, ...) and the role is full (F), prefix (P) or suffix (S) '''
+
+    def __init__(self, label, role, pattern, requires='-', digit=True):
+
+        self.label = label
+        self.role = role
+        self.pattern = pattern
+        self.requires = requires
+        self.digit = digit
+
+    def may_match(self, text):
+
+        ''' Cheap character prefilter, the text can match the rule only if it has all required characters '''
+
+        for char in self.requires:
+            if char not in text:
+                return False
+
+        return (not self.digit) or (not DIGITS.isdisjoint(text))
+
+class LineNumberClassifier:
+
+    ''' Compile all line number rules into one regular expression with named groups, and then label every text in a single scan '''
+
+    def __init__(self, rules):
+
+        self.rules = list(rules)
+
+        # Each rule is an optional lookahead from the start of the text, so the rules are searched independently (same as re.search),
+        # but all of them are reported by one match call
+        lookaheads = [f'(?=(?:[\\s\\S]*?(?P<{rule.label}>{rule.pattern}))?)' for rule in self.rules]
+        self.regex = re.compile('^' + ''.join(lookaheads))
+
+        self.hits = Counter({rule.label: 0 for rule in self.rules})
+        self.scanned = 0
+        self.prefiltered = 0
+
+    def label(self, text):
+
+        ''' Get the list of rule labels, which match the text '''
+
+        self.scanned += 1
+        if not any(rule.may_match(text) for rule in self.rules):
+            self.prefiltered += 1
+            return []
+
+        match = self.regex.match(text)
+        labels = [rule.label for rule in self.rules if match.group(rule.label) is not None]
+        self.hits.update(labels)
+
+        return labels
+
+    def classify(self, texts):
+
+        ''' Label all texts in a single scan, and then return the boolean mask of each rule label '''
+
+        masks = {rule.label: np.zeros(len(texts), dtype=bool) for rule in self.rules}
+
+        for i, text in enumerate(texts):
+            for label in self.label(text):
+                masks[label][i] = True
+
+        return masks
+
+    def role(self, label):
+
+        ''' Get the role of the rule label '''
+
+        return next(rule.role for rule in self.rules if rule.label == label)
+
+    def report(self):
+
+        ''' Per rule hit counts, the numbers of scanned texts and texts rejected by the prefilter '''
+
+        report = dict(self.hits)
+        report.update({'Scanned': self.scanned, 'Prefiltered': self.prefiltered})
+
+        return report
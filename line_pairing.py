@@ -0,0 +1,273 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# Box columns of the pairing engine (lower left and upper right corners in the drawing unit)
+BOX_COLUMNS = ['xmin', 'ymin', 'xmax', 'ymax']
+
+class GridIndex:
+
+    ''' Uniform grid (spatial hash) over the points, each query only visits the cells around the query circle '''
+
+    def __init__(self, points, cell_size):
+
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_size = max(cell_size, 1e-9)
+        self.cells = {}
+
+        keys = np.floor(self.points / self.cell_size).astype(int)
+        for i, key in enumerate(map(tuple, keys)):
+            self.cells.setdefault(key, []).append(i)
+
+    def query(self, point, radius):
+
+        ''' Get the indices of the points within the radius of the query point '''
+
+        x0, y0 = np.floor((np.asarray(point) - radius) / self.cell_size).astype(int)
+        x1, y1 = np.floor((np.asarray(point) + radius) / self.cell_size).astype(int)
+
+        found = []
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                found.extend(self.cells.get((cx, cy), ()))
+
+        found = np.array(found, dtype=int)
+        distance = np.hypot(*(self.points[found] - point).T) if found.shape[0] != 0 else np.zeros(0)
+
+        return found[distance <= radius]
+
+class KDTreeIndex:
+
+    ''' KD-tree over the points (SciPy), same query interface as the uniform grid '''
+
+    def __init__(self, points, cell_size=None):
+        self.tree = cKDTree(np.asarray(points, dtype=float).reshape(-1, 2))
+
+    def query(self, point, radius):
+        return np.array(self.tree.query_ball_point(point, radius), dtype=int)
+
+def build_index(points, cell_size, method='auto'):
+
+    ''' Create the spatial index of the points, method: 'grid', 'kdtree' or 'auto' (KD-tree if SciPy is installed) '''
+
+    if method == 'auto':
+        method = 'kdtree' if cKDTree is not None else 'grid'
+
+    if method == 'kdtree':
+        if cKDTree is None:
+            raise ImportError('SciPy is required for the KD-tree index, please install scipy or use the grid index.')
+        return KDTreeIndex(points)
+    elif method == 'grid':
+        return GridIndex(points, cell_size)
+    else:
+        raise ValueError(f"Unknown spatial index {method!r}, the method must be 'grid', 'kdtree' or 'auto'.")
+
+def near_points(centers, radius, points, method='auto'):
+
+    ''' Boolean mask of the points, which lie within the radius of at least one center (cheap prefilter before the bounding boxes) '''
+
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), (centers.shape[0],))
+    mask = np.zeros(points.shape[0], dtype=bool)
+
+    if (centers.shape[0] == 0) | (points.shape[0] == 0):
+        return mask
+
+    index = build_index(points, float(np.median(radius)), method)
+    for center, r in zip(centers, radius):
+        mask[index.query(center, r)] = True
+
+    return mask
+
+def local_boxes(boxes, rotation):
+
+    ''' Rotate the boxes into the reading frame of the rotation (u: reading direction, v: up direction of the text) '''
+
+    angle = np.radians(rotation)
+    cos = np.cos(angle)[:, None]
+    sin = np.sin(angle)[:, None]
+    xs = boxes[:, [0, 2, 2, 0]]
+    ys = boxes[:, [1, 1, 3, 3]]
+    u = xs*cos + ys*sin
+    v = -xs*sin + ys*cos
+
+    return np.stack([u.min(axis=1), v.min(axis=1), u.max(axis=1), v.max(axis=1)], axis=1)
+
+def pair_cost(prefix, suffix, height, max_gap):
+
+    ''' Cost of the suffix boxes following the prefix box in the reading frame, infinite for the incompatible layout
+
+    The suffix may continue the prefix on the same line (on the right of the prefix), or on the next line (under the prefix) '''
+
+    pu0, pv0, pu1, pv1 = prefix
+    su0, sv0, su1, sv1 = suffix.T
+
+    # Continue on the same line
+    gap = su0 - pu1
+    shift = np.abs(sv0 - pv0)
+    same_line = np.where((gap >= -0.5*height) & (gap <= max_gap*height) & (shift <= 0.5*height),
+                         (np.maximum(gap, 0) + shift) / height, np.inf)
+
+    # Continue on the next line, which is aligned left, center or right with the prefix
+    gap = pv0 - sv1
+    shift = np.minimum.reduce([np.abs(su0 - pu0), np.abs((su0 + su1) / 2 - (pu0 + pu1) / 2), np.abs(su1 - pu1)])
+    next_line = np.where((gap >= -0.5*height) & (gap <= max_gap*height) & (shift <= max_gap*height),
+                         (np.maximum(gap, 0) + shift) / height, np.inf)
+
+    return np.minimum(same_line, next_line)
+
+def pair_boxes(prefix_boxes, prefix_rotation, suffix_boxes, suffix_rotation, max_gap=1.5, angle_tolerance=5.0, method='auto'):
+
+    ''' Pair each prefix text with the nearest compatible suffix text (same orientation, following in the reading order)
+
+    The suffix centers are kept in the spatial index, so each prefix only visits the suffixes nearby, and then all candidate pairs
+    are matched by the global greedy assignment (lowest cost first). Return the (prefix index, suffix index) arrays of the pairs. '''
+
+    prefix_boxes = np.asarray(prefix_boxes, dtype=float).reshape(-1, 4)
+    suffix_boxes = np.asarray(suffix_boxes, dtype=float).reshape(-1, 4)
+    prefix_rotation = np.asarray(prefix_rotation, dtype=float) % 360
+    suffix_rotation = np.asarray(suffix_rotation, dtype=float) % 360
+
+    if (prefix_boxes.shape[0] == 0) | (suffix_boxes.shape[0] == 0):
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    # Search radius of each prefix covers the prefix box, the largest suffix box and the allowed gap
+    prefix_center = (prefix_boxes[:, 0:2] + prefix_boxes[:, 2:4]) / 2
+    suffix_center = (suffix_boxes[:, 0:2] + suffix_boxes[:, 2:4]) / 2
+    prefix_local = local_boxes(prefix_boxes, prefix_rotation)
+    height = np.maximum(prefix_local[:, 3] - prefix_local[:, 1], 1e-9)
+    prefix_reach = np.hypot(*(prefix_boxes[:, 2:4] - prefix_boxes[:, 0:2]).T) / 2
+    suffix_reach = np.hypot(*(suffix_boxes[:, 2:4] - suffix_boxes[:, 0:2]).T).max() / 2
+    radius = prefix_reach + suffix_reach + (max_gap + 0.5)*height
+
+    index = build_index(suffix_center, float(np.median(radius)), method)
+
+    costs = []
+    prefix_idx = []
+    suffix_idx = []
+
+    for i in range(prefix_boxes.shape[0]):
+        found = index.query(prefix_center[i], radius[i])
+        if found.shape[0] == 0:
+            continue
+
+        # Keep the suffixes, which have the same orientation as the prefix
+        turn = np.abs((suffix_rotation[found] - prefix_rotation[i] + 180) % 360 - 180)
+        found = found[turn <= angle_tolerance]
+        if found.shape[0] == 0:
+            continue
+
+        rotation = np.full(found.shape[0], prefix_rotation[i])
+        cost = pair_cost(prefix_local[i], local_boxes(suffix_boxes[found], rotation), height[i], max_gap)
+        valid = np.isfinite(cost)
+        costs.append(cost[valid])
+        prefix_idx.append(np.full(valid.sum(), i))
+        suffix_idx.append(found[valid])
+
+    if len(costs) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    costs = np.concatenate(costs)
+    prefix_idx = np.concatenate(prefix_idx)
+    suffix_idx = np.concatenate(suffix_idx)
+
+    # Global greedy matching, the lowest cost pair is taken first, and each text is used only one time
+    prefix_used = np.zeros(prefix_boxes.shape[0], dtype=bool)
+    suffix_used = np.zeros(suffix_boxes.shape[0], dtype=bool)
+    pairs = []
+
+    for k in np.lexsort((suffix_idx, prefix_idx, costs)):
+        p, s = prefix_idx[k], suffix_idx[k]
+        if prefix_used[p] | suffix_used[s]:
+            continue
+        prefix_used[p] = True
+        suffix_used[s] = True
+        pairs.append((p, s))
+
+    pairs = np.array(sorted(pairs), dtype=int).reshape(-1, 2)
+
+    return pairs[:, 0], pairs[:, 1]
+
+def merge_pairs(prefix_names, prefix_boxes, suffix_names, suffix_boxes, prefix_idx, suffix_idx):
+
+    ''' Merge the paired texts into the full line number, and the combined bounding box of both texts '''
+
+    prefix_boxes = np.asarray(prefix_boxes, dtype=float).reshape(-1, 4)[prefix_idx]
+    suffix_boxes = np.asarray(suffix_boxes, dtype=float).reshape(-1, 4)[suffix_idx]
+    names = [str(p).rstrip() + str(s).strip() for p, s in zip(np.asarray(prefix_names)[prefix_idx], np.asarray(suffix_names)[suffix_idx])]
+
+    merged = pd.DataFrame({'Name': names,
+                           'xmin': np.minimum(prefix_boxes[:, 0], suffix_boxes[:, 0]),
+                           'ymin': np.minimum(prefix_boxes[:, 1], suffix_boxes[:, 1]),
+                           'xmax': np.maximum(prefix_boxes[:, 2], suffix_boxes[:, 2]),
+                           'ymax': np.maximum(prefix_boxes[:, 3], suffix_boxes[:, 3]),
+                           'Prefix': prefix_idx, 'Suffix': suffix_idx})
+
+    return merged
+
+def line_boxes(boxes, pair):
+
+    ''' Bounding box of the line of each row: the combined box of the rows of the same pair number, or the own box of the row
+    without partner (pair -1)
+
+    The corner order of each row is kept, so the boxes in the image pixels (flipped in y) stay flipped. '''
+
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    pair = np.asarray(pair, dtype=float)
+    low = np.minimum(boxes[:, 0:2], boxes[:, 2:4])
+    high = np.maximum(boxes[:, 0:2], boxes[:, 2:4])
+
+    paired = np.flatnonzero(pair >= 0)
+    if paired.shape[0] != 0:
+        _, group = np.unique(pair[paired], return_inverse=True)
+        group_low = np.full((group.max() + 1, 2), np.inf)
+        group_high = np.full((group.max() + 1, 2), -np.inf)
+        np.minimum.at(group_low, group, low[paired])
+        np.maximum.at(group_high, group, high[paired])
+        low[paired] = group_low[group]
+        high[paired] = group_high[group]
+
+    ordered = boxes[:, 0:2] <= boxes[:, 2:4]
+
+    return np.hstack([np.where(ordered, low, high), np.where(ordered, high, low)])
+
+def pair_lines(df, role, name='Name', rotation='Rotation', box=BOX_COLUMNS, start=0, **kwargs):
+
+    ''' Pair the prefix ('P') and suffix ('S') rows of the text dataframe, the role of each row is given by the role array
+
+    Return the dataframe in the order of the pairs (prefix row, and then its suffix row), followed by the rows without partner.
+    The 'Pair' column is the pair number from start (-1 without partner), the 'Line Name' column is the merged full line number,
+    and the 'Line {box column}' columns are the combined box of the pair (the own box of the row without partner). '''
+
+    df = df.reset_index(drop=True)
+    role = np.asarray(role)
+    prefix_rows = np.flatnonzero(role == 'P')
+    suffix_rows = np.flatnonzero(role == 'S')
+    boxes = df[list(box)].to_numpy(dtype=float)
+
+    prefix_idx, suffix_idx = pair_boxes(boxes[prefix_rows], df[rotation].to_numpy(dtype=float)[prefix_rows],
+                                        boxes[suffix_rows], df[rotation].to_numpy(dtype=float)[suffix_rows], **kwargs)
+    merged = merge_pairs(df[name].to_numpy()[prefix_rows], boxes[prefix_rows], df[name].to_numpy()[suffix_rows], boxes[suffix_rows],
+                         prefix_idx, suffix_idx)
+
+    pair = np.full(len(df), -1)
+    line_name = df[name].astype(str).str.rstrip().to_numpy(dtype=object)
+    line_box = boxes.copy()
+    for rows in (prefix_rows[prefix_idx], suffix_rows[suffix_idx]):
+        pair[rows] = start + np.arange(len(merged))
+        line_name[rows] = merged['Name'].to_numpy()
+        line_box[rows] = merged[BOX_COLUMNS].to_numpy()
+
+    # Order the rows by pairs, the prefix row comes before its suffix row
+    paired = np.stack([prefix_rows[prefix_idx], suffix_rows[suffix_idx]], axis=1).reshape(-1)
+    single = np.flatnonzero(pair < 0)
+    order = np.concatenate([paired, single]).astype(int)
+
+    df = df.assign(**{'Pair': pair, 'Line Name': line_name}, **{'Line ' + column: line_box[:, i] for i, column in enumerate(box)})
+
+    return df.iloc[order].reset_index(drop=True)
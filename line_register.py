@@ -0,0 +1,284 @@
+import argparse
+import os
+import pandas as pd
+import sqlite3
+import time
+from label_export import point_columns
+from result_store import drawing_key
+
+# Register of the line numbers at the plant level (working directory), and the version of its schema
+REGISTER_FILE = 'LineRegister.sqlite'
+SCHEMA_VERSION = 1
+
+# Components of the line number: 4"-HC-4000000-C1 is the size (4), service (HC), number (4000000) and class (C1)
+LINE_PATTERN = r'(?:(?P<size>[\d./]+)\"?\s*\-)?(?P<service>[A-Z]{1,4})\-(?P<number>[A-Z\d]{6,8})\-(?P<spec>[A-Z][A-Z\d]*)'
+
+# Columns of the register, and the columns of the UHV and C3C5 results, which are kept in each one
+REGISTER_COLUMNS = ['plant', 'drawing', 'handle', 'dataset', 'text', 'line_name', 'size', 'service', 'number', 'spec', 'type',
+                    'pattern', 'pair', 'rotation', 'llx', 'lly', 'urx', 'ury', 'run']
+RESULT_COLUMNS = {'handle': ('ID', 'Text ID'), 'text': ('Name', 'Text Name'), 'rotation': ('Rotation', 'Text Rotation'),
+                  'line_name': ('Line Name',), 'type': ('Type',), 'pattern': ('Pattern',), 'pair': ('Pair',)}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS lines (
+    plant TEXT NOT NULL,
+    drawing TEXT NOT NULL,
+    handle TEXT NOT NULL,
+    dataset TEXT,
+    text TEXT,
+    line_name TEXT,
+    size TEXT,
+    service TEXT,
+    number TEXT,
+    spec TEXT,
+    type TEXT,
+    pattern TEXT,
+    pair INTEGER,
+    rotation REAL,
+    llx REAL,
+    lly REAL,
+    urx REAL,
+    ury REAL,
+    run INTEGER,
+    PRIMARY KEY (plant, drawing, dataset, handle)
+);
+CREATE TABLE IF NOT EXISTS drawings (
+    plant TEXT NOT NULL,
+    drawing TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    run INTEGER,
+    texts INTEGER,
+    PRIMARY KEY (plant, drawing, dataset)
+);
+CREATE INDEX IF NOT EXISTS lines_line_name ON lines (line_name);
+CREATE INDEX IF NOT EXISTS lines_number ON lines (number);
+CREATE INDEX IF NOT EXISTS lines_spec ON lines (spec, line_name);
+CREATE INDEX IF NOT EXISTS lines_service ON lines (service, line_name);
+CREATE INDEX IF NOT EXISTS lines_size ON lines (size, line_name);
+CREATE INDEX IF NOT EXISTS lines_drawing ON lines (drawing);
+'''
+
+def line_components(names):
+
+    ''' Split the line numbers into their components (size, service, number and spec), all names are parsed at once by pandas '''
+
+    names = pd.Series(names, dtype=object).astype(str)
+    components = names.str.extract(LINE_PATTERN)
+
+    return components.astype(object).where(components.notna(), None)
+
+def register_rows(df, plant, drawing, dataset, run):
+
+    ''' Convert the result of one drawing (UHV or C3C5) into the rows of the register '''
+
+    rows = pd.DataFrame(index=range(df.shape[0]))
+    for column, sources in RESULT_COLUMNS.items():
+        source = next((c for c in sources if c in df.columns), None)
+        rows[column] = df[source].to_numpy() if source is not None else None
+
+    # The line name of the partial texts is the paired name, the other texts are their own line names
+    rows['line_name'] = rows['line_name'].where(rows['line_name'].notna(), rows['text'])
+    rows[['size', 'service', 'number', 'spec']] = line_components(rows['line_name']).to_numpy()
+
+    # The boxes are the LowLeft and UpRight points (UHV, in pixels) or the LowerLeft and UpperRight columns (C3C5, in drawing units),
+    # the combined box of the line (both texts of the paired line number) is kept, if the result has it
+    line = 'Line ' if any(c.startswith(('Line LowLeft', 'Line LowerLeft')) for c in df.columns) else ''
+    if 'LowLeft' in df.columns or 'LowLeft X' in df.columns:
+        (rows['llx'], rows['lly']), (rows['urx'], rows['ury']) = point_columns(df, line+'LowLeft'), point_columns(df, line+'UpRight')
+    else:
+        for column, source in (('llx', 'LowerLeft X'), ('lly', 'LowerLeft Y'), ('urx', 'UpperRight X'), ('ury', 'UpperRight Y')):
+            rows[column] = df[line+source].to_numpy(dtype=float) if line+source in df.columns else None
+
+    rows = rows.assign(plant=plant, drawing=drawing, dataset=dataset, run=run)
+    rows['handle'] = rows['handle'].astype(str)
+    rows['pair'] = pd.to_numeric(rows['pair'], errors='coerce').astype('Int64')
+
+    return rows[REGISTER_COLUMNS]
+
+class LineRegister:
+
+    ''' Indexed SQLite register of the line numbers of all drawings, one row per text entity keyed by (plant, drawing, dataset,
+    handle), and one row per registered drawing (also the drawing without any line number)
+
+    Each drawing is upserted in one transaction, so a re-extracted sheet is updated in place, and its entities, which are no
+    longer on the sheet, are removed. '''
+
+    def __init__(self, path=REGISTER_FILE):
+
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        # The lines of the first register (without the dataset in the key) are moved into the current schema
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        tables = {row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if (version < SCHEMA_VERSION) and ('lines' in tables):
+            with self.connection:
+                self.connection.execute('ALTER TABLE lines RENAME TO lines_old')
+                self.connection.execute('DROP INDEX IF EXISTS lines_line_name')
+                for name in ('number', 'spec', 'service', 'size', 'drawing'):
+                    self.connection.execute(f'DROP INDEX IF EXISTS lines_{name}')
+        self.connection.executescript(SCHEMA)
+        if (version < SCHEMA_VERSION) and ('lines' in tables):
+            columns = ', '.join(REGISTER_COLUMNS)
+            values = ', '.join("COALESCE(dataset, '')" if c == 'dataset' else c for c in REGISTER_COLUMNS)
+            with self.connection:
+                self.connection.execute(f'INSERT OR REPLACE INTO lines ({columns}) SELECT {values} FROM lines_old')
+                self.connection.execute('INSERT OR REPLACE INTO drawings (plant, drawing, dataset, run, texts) '
+                                        'SELECT plant, drawing, dataset, MAX(run), COUNT(*) FROM lines GROUP BY plant, drawing, dataset')
+                self.connection.execute('DROP TABLE lines_old')
+        self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def register(self, df, plant, drawing, dataset=None):
+
+        ''' Upsert the result of one drawing, and then remove the entities of the last extraction of the same dataset, which are
+        not in the result. The drawing is registered, even if it has no line number. '''
+
+        run = time.time_ns()
+        dataset = dataset or ''
+        rows = register_rows(df, plant, drawing, dataset, run)
+        rows = rows.astype(object).where(rows.notna(), None)
+        columns = ', '.join(REGISTER_COLUMNS)
+        updates = ', '.join(f'{c} = excluded.{c}' for c in REGISTER_COLUMNS if c not in ('plant', 'drawing', 'handle'))
+
+        with self.connection:
+            self.connection.executemany(f'INSERT INTO lines ({columns}) VALUES ({", ".join("?" * len(REGISTER_COLUMNS))}) '
+                                        f'ON CONFLICT (plant, drawing, dataset, handle) DO UPDATE SET {updates}',
+                                        rows.itertuples(index=False, name=None))
+            self.connection.execute('DELETE FROM lines WHERE plant = ? AND drawing = ? AND dataset = ? AND run != ?',
+                                    (plant, drawing, dataset, run))
+            self.connection.execute('INSERT INTO drawings (plant, drawing, dataset, run, texts) VALUES (?, ?, ?, ?, ?) '
+                                    'ON CONFLICT (plant, drawing, dataset) DO UPDATE SET run = excluded.run, texts = excluded.texts',
+                                    (plant, drawing, dataset, run, rows.shape[0]))
+
+        return rows.shape[0]
+
+    def remove(self, plant, drawing, dataset=None):
+
+        ''' Remove the drawing (of the dataset, or of all datasets) from the register '''
+
+        condition, params = ('plant = ? AND drawing = ?', (plant, drawing)) if dataset is None else \
+                            ('plant = ? AND drawing = ? AND dataset = ?', (plant, drawing, dataset))
+        with self.connection:
+            self.connection.execute(f'DELETE FROM drawings WHERE {condition}', params)
+            return self.connection.execute(f'DELETE FROM lines WHERE {condition}', params).rowcount
+
+    def has_drawing(self, plant, drawing, dataset=None):
+
+        ''' Check whether if the drawing (of the dataset, or of any dataset) is registered, also without any line number '''
+
+        condition, params = ('plant = ? AND drawing = ?', (plant, drawing)) if dataset is None else \
+                            ('plant = ? AND drawing = ? AND dataset = ?', (plant, drawing, dataset))
+
+        return self.connection.execute(f'SELECT 1 FROM drawings WHERE {condition} LIMIT 1', params).fetchone() is not None
+
+    def query(self, sql, params=()):
+
+        ''' Run the SQL query on the register, and then return the result as the dataframe '''
+
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def sheets(self, line_name):
+
+        ''' Drawings, which carry the line number, and the number of its texts on each drawing '''
+
+        return self.query('SELECT plant, drawing, COUNT(*) AS texts FROM lines WHERE line_name = ? '
+                          'GROUP BY plant, drawing ORDER BY plant, drawing', (line_name,))
+
+    def lines(self, plant=None, drawing=None, **components):
+
+        ''' Line numbers and their drawings, filtered by the plant, drawing and components (size, service, number, spec), e.g.
+        lines(spec='A11'). A value with % or _ is matched as the LIKE pattern. '''
+
+        filters = dict(components, plant=plant, drawing=drawing)
+        unknown = [key for key in filters if key not in REGISTER_COLUMNS]
+        if len(unknown) != 0:
+            raise ValueError(f'Unknown column(s) of the register: {unknown}')
+
+        conditions, params = [], []
+        for key, value in filters.items():
+            if value is None:
+                continue
+            conditions.append(f'{key} LIKE ?' if any(c in str(value) for c in '%_') else f'{key} = ?')
+            params.append(value)
+        where = ('WHERE ' + ' AND '.join(conditions)) if len(conditions) != 0 else ''
+
+        return self.query(f'SELECT DISTINCT line_name, size, service, number, spec, plant, drawing FROM lines {where} '
+                          'ORDER BY line_name, plant, drawing', params)
+
+    def count(self, by='spec'):
+
+        ''' Number of the distinct line numbers and their drawings of each component value (size, service, number or spec) '''
+
+        if by not in ('size', 'service', 'number', 'spec', 'plant', 'drawing', 'dataset'):
+            raise ValueError(f'The lines cannot be counted by {by!r}.')
+
+        return self.query(f"SELECT {by}, COUNT(DISTINCT line_name) AS lines, COUNT(DISTINCT plant || '/' || drawing) AS drawings "
+                          f'FROM lines WHERE line_name IS NOT NULL GROUP BY {by} ORDER BY lines DESC')
+
+    def import_csv(self, csv_folder, plant, dataset=None):
+
+        ''' Register the CSV files of the extraction (e.g. '.\\CSV' or '.\\CSV_Output'), the drawing is keyed as in the result store '''
+
+        from drawing_catalogue import scan_files
+
+        count = 0
+        for csv_file in scan_files(csv_folder, ('.csv',)):
+            count += self.register(pd.read_csv(csv_file, index_col=0), plant, drawing_key(csv_file, csv_folder), dataset)
+
+        return count
+
+def main(argv=None):
+
+    ''' Command line of the register: import the CSV files, and query the sheets, lines and counts '''
+
+    parser = argparse.ArgumentParser(description='Query the line number register of the plant.')
+    parser.add_argument('--register', default=REGISTER_FILE, help='register file (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    imports = commands.add_parser('import', help='register the CSV files of the extraction')
+    imports.add_argument('folder', help="CSV folder, e.g. CSV or CSV_Output")
+    imports.add_argument('--plant', default=os.path.basename(os.getcwd()))
+    imports.add_argument('--dataset', default=None)
+
+    sheets = commands.add_parser('sheets', help='drawings, which carry the line number')
+    sheets.add_argument('line_name')
+
+    lines = commands.add_parser('lines', help='line numbers filtered by the components (LIKE pattern with % or _)')
+    for column in ('plant', 'drawing', 'size', 'service', 'number', 'spec'):
+        lines.add_argument('--' + column)
+
+    count = commands.add_parser('count', help='number of the line numbers of each component value')
+    count.add_argument('--by', default='spec', choices=['size', 'service', 'number', 'spec', 'plant', 'drawing', 'dataset'])
+
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+
+    with LineRegister(args.register) as register:
+        if args.command == 'import':
+            print(register.import_csv(args.folder, args.plant, args.dataset), 'text(s) are registered.')
+        elif args.command == 'sheets':
+            print(register.sheets(args.line_name).to_string(index=False))
+        elif args.command == 'lines':
+            print(register.lines(**{c: getattr(args, c) for c in ('plant', 'drawing', 'size', 'service', 'number', 'spec')}).to_string(index=False))
+        else:
+            print(register.count(args.by).to_string(index=False))
+
+    print(f'({(time.perf_counter() - start) * 1000:.1f} ms)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import traceback
+from tqdm import tqdm
+
+class TaskFailure:
+
+    ''' Failure record of one task, the task arguments, the error message and the traceback from the worker '''
+
+    def __init__(self, index, task, error, trace=''):
+
+        self.index = index
+        self.task = task
+        self.error = error
+        self.trace = trace
+
+    def __repr__(self):
+        return f'TaskFailure({self.task!r}, {self.error})'
+
+def _call(func, task):
+
+    ''' Run the task in the worker, the error is returned instead of raised, so one failed task never stops the batch '''
+
+    try:
+        return True, func(*task)
+    except (Exception, SystemExit) as e:
+        return False, (f'{type(e).__name__}: {e}', traceback.format_exc())
+
+def resolve_workers(workers):
+
+    ''' Number of worker processes, None or 0 means all CPU cores '''
+
+    if not workers:
+        return os.cpu_count() or 1
+
+    return max(int(workers), 1)
+
+def run_ordered(func, tasks, workers=1, desc=None, initializer=None, initargs=()):
+
+    ''' Run func(*task) for each task on a process pool, and then yield (index, result, failure) in the order of the tasks
+
+    The results are yielded as soon as all earlier tasks are finished, so the caller can write the outputs deterministically.
+    The failure is None for the successful task, and the result is None for the failed task. With one worker, the tasks run
+    in the current process. The progress bar counts the finished tasks of all workers. '''
+
+    tasks = [tuple(task) for task in tasks]
+    workers = min(resolve_workers(workers), max(len(tasks), 1))
+    progress = tqdm(total=len(tasks), desc=desc)
+
+    def output(index, outcome):
+        ok, value = outcome
+        if ok:
+            return index, value, None
+        return index, None, TaskFailure(index, tasks[index], *value)
+
+    try:
+        if workers == 1:
+            if initializer is not None:
+                initializer(*initargs)
+            for index, task in enumerate(tasks):
+                outcome = _call(func, task)
+                progress.update(1)
+                yield output(index, outcome)
+
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+                futures = {pool.submit(_call, func, task): index for index, task in enumerate(tasks)}
+                finished = {}
+                next_index = 0
+
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        finished[index] = future.result()
+                    except Exception as e: # The worker process was lost (crash or out of memory)
+                        finished[index] = (False, (f'{type(e).__name__}: {e}', traceback.format_exc()))
+                    progress.update(1)
+
+                    # Release the results in the task order
+                    while next_index in finished:
+                        yield output(next_index, finished.pop(next_index))
+                        next_index += 1
+    finally:
+        progress.close()
+
+def subtract_counts(after, before):
+
+    ''' Difference of the (nested) count dictionaries, which is used to report the statistics of one task from the worker '''
+
+    delta = {}
+    for key, value in after.items():
+        if isinstance(value, dict):
+            delta[key] = subtract_counts(value, before.get(key, {}))
+        else:
+            delta[key] = value - before.get(key, 0)
+
+    return delta
+
+def add_counts(total, counts):
+
+    ''' Add the (nested) count dictionary into the total, which aggregates the statistics of all workers '''
+
+    for key, value in counts.items():
+        if isinstance(value, dict):
+            add_counts(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+    return total
@@ -0,0 +1,219 @@
+from ezdxf import path as ezpath
+from ezdxf.addons import text2path
+import numpy as np
+from PIL import Image, ImageChops, ImageDraw
+
+def fill_nonzero(polygons, shape):
+
+    ''' Fill the polygons (pixel coordinates) by the nonzero winding rule, which samples the pixel centres of all rows at once
+
+    Return the boolean mask of the given shape (rows, columns). '''
+
+    edges = np.vstack([np.hstack([points, np.roll(points, -1, axis=0)]) for points in polygons])
+    edges = edges[edges[:, 1] != edges[:, 3]]
+    x0, y0, x1, y1 = edges.T
+
+    # Rows of the pixel centres (row + 0.5), which each edge crosses
+    low = np.ceil(np.minimum(y0, y1) - 0.5).astype(int)
+    high = np.ceil(np.maximum(y0, y1) - 0.5).astype(int)
+    counts = np.maximum(high - low, 0)
+    edge = np.repeat(np.arange(len(edges)), counts)
+    rows = low[edge] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xs = x0[edge] + (rows + 0.5 - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+    direction = np.where(y1[edge] > y0[edge], 1, -1)
+
+    # The crossings of each row are sorted by x, the winding number of each row starts from zero, because the contours are closed
+    order = np.lexsort((xs, rows))
+    rows, xs, winding = rows[order], xs[order], np.cumsum(direction[order])
+
+    # The pixel is filled, if its centre is between the crossings with the nonzero winding number
+    span = (rows[:-1] == rows[1:]) & (winding[:-1] != 0)
+    start = np.clip(np.ceil(xs[:-1][span] - 0.5).astype(int), 0, shape[1])
+    stop = np.clip(np.floor(xs[1:][span] - 0.5).astype(int) + 1, 0, shape[1])
+    keep = (stop > start) & (rows[:-1][span] >= 0) & (rows[:-1][span] < shape[0])
+    fill = np.zeros((shape[0], shape[1] + 1), dtype=np.int32)
+    np.add.at(fill, (rows[:-1][span][keep], start[keep]), 1)
+    np.add.at(fill, (rows[:-1][span][keep], stop[keep]), -1)
+
+    return np.cumsum(fill, axis=1)[:, :-1] > 0
+
+# Entity types, which are drawn directly on the Pillow canvas, the other types are drawn by the ezdxf frontend
+SUPPORTED_TYPES = ('LINE', 'LWPOLYLINE', 'ARC', 'CIRCLE', 'TEXT', 'ATTRIB', 'INSERT')
+
+# Default line weight (1/100 mm) of the entities without the line weight
+DEFAULT_LINEWEIGHT = 25
+
+class PillowRaster:
+
+    ''' Lightweight raster backend for the line-art drawings, which draws LINE, LWPOLYLINE, ARC, CIRCLE, TEXT and simple INSERT
+    entities in black straight on the grayscale Pillow canvas
+
+    The canvas is drawn at supersample times the image size, and then it is reduced (box filter) for the anti-aliasing. The
+    entities, which cannot be drawn (e.g. hatches, dashed line types or the blocks with such entities), are collected into
+    the unsupported list for the fallback rendering. '''
+
+    def __init__(self, doc, xlim, ylim, size, dpi=720, supersample=1, lineweight_scaling=0.5):
+
+        self.doc = doc
+        self.size = tuple(size)
+        self.dpi = dpi
+        self.supersample = max(int(supersample), 1)
+        self.lineweight_scaling = lineweight_scaling
+        self.x0, self.y1 = xlim[0], ylim[1]
+        self.scale = self.supersample * self.size[0] / (xlim[1] - xlim[0])
+        self.img = Image.new('L', (self.size[0] * self.supersample, self.size[1] * self.supersample), 255)
+        self.canvas = ImageDraw.Draw(self.img)
+        self.unsupported = []
+        self._blocks = {}
+
+    def pixels(self, points):
+
+        ''' Transform the world coordinates into the canvas pixels '''
+
+        points = np.asarray([(p[0], p[1]) for p in points], dtype=float).reshape(-1, 2)
+        px = (points[:, 0] - self.x0) * self.scale
+        py = (self.y1 - points[:, 1]) * self.scale
+
+        return np.column_stack([px, py])
+
+    def line_points(self, points):
+
+        # Pillow draws the line through the pixel centres of the integer coordinates
+        return [tuple(point) for point in (self.pixels(points) - 0.5).tolist()]
+
+    def layer_attrib(self, e, key, default):
+
+        layer = self.doc.layers.get(e.dxf.get('layer', '0')) if self.doc is not None else None
+        return layer.dxf.get(key, default) if layer is not None else default
+
+    def is_visible(self, e):
+
+        ''' The entity is drawn, unless it is invisible or its layer is off or frozen '''
+
+        if e.dxf.get('invisible', 0) or ((e.dxftype() == 'ATTRIB') and e.is_invisible):
+            return False
+
+        layer = self.doc.layers.get(e.dxf.get('layer', '0')) if self.doc is not None else None
+
+        return (layer is None) or not (layer.is_off() or layer.is_frozen())
+
+    def line_width(self, e):
+
+        ''' Line width in canvas pixels, the same as the line width of the matplotlib backend: the line weight (mm) times the
+        scaling is taken as the points, which are at least one image pixel (72/dpi points) '''
+
+        lineweight = e.dxf.get('lineweight', -1)
+        if lineweight == -1: # BYLAYER
+            lineweight = self.layer_attrib(e, 'lineweight', DEFAULT_LINEWEIGHT)
+        if lineweight < 0: # BYBLOCK or DEFAULT
+            lineweight = DEFAULT_LINEWEIGHT
+
+        points = max(lineweight / 100 * self.lineweight_scaling, 72 / self.dpi)
+
+        return max(int(round(points * self.dpi / 72 * self.supersample)), self.supersample)
+
+    def is_continuous(self, e):
+
+        linetype = e.dxf.get('linetype', 'BYLAYER')
+        if linetype.upper() == 'BYLAYER':
+            linetype = self.layer_attrib(e, 'linetype', 'CONTINUOUS')
+
+        return linetype.upper() in ('CONTINUOUS', 'BYBLOCK')
+
+    def is_supported(self, e):
+
+        ''' Check whether if the entity (and all entities of its block) can be drawn on the canvas '''
+
+        dxftype = e.dxftype()
+        if dxftype not in SUPPORTED_TYPES:
+            return False
+        if dxftype in ('LINE', 'LWPOLYLINE', 'ARC', 'CIRCLE') and not self.is_continuous(e):
+            return False
+        if (dxftype == 'LWPOLYLINE') and (e.dxf.get('const_width', 0) or e.has_width):
+            return False
+        if dxftype == 'INSERT':
+            name = e.dxf.name
+            if name not in self._blocks:
+                self._blocks[name] = False # The recursive block reference is not supported
+                block = self.doc.blocks.get(name) if self.doc is not None else None
+                self._blocks[name] = (block is not None) and all(self.is_supported(b) for b in block if b.dxftype() != 'ATTDEF')
+            return self._blocks[name]
+
+        return True
+
+    def draw_path(self, path, width):
+
+        distance = 0.5 / self.scale
+        for sub_path in path.sub_paths():
+            points = self.line_points(sub_path.flattening(distance))
+            if len(points) > 1:
+                self.canvas.line(points, fill=0, width=width, joint='curve' if width > 2 else None)
+
+    def draw_text(self, e):
+
+        ''' Fill the outlines of the text, the same as the filled text of the ezdxf frontend '''
+
+        polygons = []
+        distance = 0.5 / self.scale
+        for path in text2path.make_paths_from_entity(e):
+            for sub_path in path.sub_paths():
+                points = self.pixels(sub_path.flattening(distance))
+                if len(points) > 2:
+                    polygons.append(points)
+        if len(polygons) == 0:
+            return
+
+        # The glyph holes are kept by the winding rule (the same as the path patch of matplotlib) in the text box
+        corners = np.vstack(polygons)
+        left, top = np.floor(corners.min(axis=0)).astype(int)
+        right, bottom = np.ceil(corners.max(axis=0)).astype(int)
+        mask = fill_nonzero([points - (left, top) for points in polygons], (bottom - top, right - left))
+        self.img.paste(0, (int(left), int(top)), Image.fromarray(mask))
+
+    def draw_entity(self, e):
+
+        if not self.is_visible(e):
+            return
+
+        dxftype = e.dxftype()
+        if dxftype == 'LINE':
+            self.canvas.line(self.line_points([e.dxf.start, e.dxf.end]), fill=0, width=self.line_width(e))
+        elif dxftype in ('LWPOLYLINE', 'ARC', 'CIRCLE'):
+            self.draw_path(ezpath.make_path(e), self.line_width(e))
+        elif dxftype in ('TEXT', 'ATTRIB'):
+            self.draw_text(e)
+        elif dxftype == 'INSERT':
+            for ve in e.virtual_entities():
+                self.draw_entity(ve)
+            for attrib in e.attribs:
+                self.draw_entity(attrib)
+        else:
+            # The scaled block references turn the supported entities into the other types (e.g. CIRCLE and ARC into ELLIPSE
+            # by the unequal x and y scales), so they are drawn by their paths
+            try:
+                path = ezpath.make_path(e)
+            except TypeError: # The entity without a path
+                return
+            self.draw_path(path, self.line_width(e))
+
+    def draw(self, entities, filter_func=None):
+
+        ''' Draw the supported entities, the unsupported entities are kept for the fallback rendering '''
+
+        for e in entities:
+            if (filter_func is not None) and not filter_func(e):
+                continue
+            if self.is_supported(e):
+                self.draw_entity(e)
+            else:
+                self.unsupported.append(e)
+
+    def image(self, fallback=None, mode='L'):
+
+        ''' Reduce the canvas into the image size (anti-aliasing), and then merge the fallback image of the unsupported entities '''
+
+        img = self.img.reduce(self.supersample) if self.supersample > 1 else self.img
+        if fallback is not None:
+            img = ImageChops.darker(img, fallback.convert('L'))
+
+        return img.convert('1', dither=0) if mode == '1' else img
@@ -0,0 +1,362 @@
+from concurrent.futures import ProcessPoolExecutor
+from crop_shards import ShardWriter, SHARD_SIZE
+from drawing_catalogue import reset_folders, scan_files
+from functools import partial
+import gc
+import importlib.util
+import os
+import pandas as pd
+from parallel_pool import TaskFailure
+import queue
+from raster_transform import sidecar_path
+import regex as re
+from run_manifest import RunManifest
+import sys
+import threading
+import time
+import traceback
+
+# Folder of the pipeline scripts
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Stages of the pipeline in the flow order, and the script of each stage
+STAGES = ('dxf', 'png', 'csv', 'icdar', 'crop', 'parts', 'resize')
+SCRIPTS = {'dxf': 'DWGtoDXF.py', 'png': 'RasterizeDXF.py', 'csv': 'P&IDinfo_for_UHV.py', 'icdar': 'ConvertICDAR.py',
+           'crop': 'CropTextPID.py', 'parts': 'Crop6PartsImg.py', 'resize': 'ResizeImagePID.py'}
+
+# Default workers of each stage, the rendering and the extraction run on the processes, the others on the threads
+STAGE_WORKERS = {'dxf': 1, 'png': 2, 'csv': 2, 'icdar': 1, 'crop': 2, 'parts': 1, 'resize': 1}
+PROCESS_STAGES = ('png', 'csv')
+
+# Shard folder and file prefix of the stages, which write into the tar shards with shard_size (the same as the scripts)
+SHARD_STAGES = {'crop': ('.\\CropShards\\CropImage', 'crop'), 'parts': ('.\\CropShards\\Crop6PartsImg', 'part')}
+
+_scripts_lock = threading.Lock()
+
+def load_script(filename):
+
+    ''' Import the pipeline script by its path, as some names are not valid module names (e.g. P&IDinfo_for_UHV.py)
+
+    The module is imported one time per process, and the scripts run their work only as __main__. '''
+
+    name = 'pipeline_' + re.sub(r'\W', '_', os.path.splitext(filename)[0])
+    with _scripts_lock:
+        if name in sys.modules:
+            return sys.modules[name]
+
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPT_FOLDER, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+
+    return module
+
+def stage_script(stage):
+    return load_script(SCRIPTS[stage])
+
+def drawing_paths(drawing_file, sizes, shards=False):
+
+    ''' Files of one drawing at every stage, which are given by the path functions of the stage scripts
+
+    drawing_file: the DWG or DXF file of the drawing, e.g. '.\\DXF\\Area1\\sheet0.dxf' '''
+
+    source = 'DWG' if drawing_file.lower().endswith('.dwg') else 'DXF'
+    dxf_file = stage_script('dxf').dxf_path(drawing_file) if source == 'DWG' else drawing_file
+    png_file = stage_script('png').raster_path(dxf_file)
+    csv_file = stage_script('csv').csv_path(dxf_file)
+
+    return {'Drawing': re.sub(r'[\\/]+', '/', os.path.splitext(os.path.relpath(drawing_file, source))[0]),
+            'DWG': drawing_file if source == 'DWG' else None,
+            'DXF': dxf_file,
+            'PNG': png_file,
+            'CSV': csv_file,
+            'ICDAR': stage_script('icdar').icdar_path(csv_file),
+            'CropImage': None if shards else stage_script('crop').crop_folder(png_file),
+            'Crop6PartsImg': None if shards else stage_script('parts').part_paths(png_file),
+            'Resized': stage_script('resize').resized_paths(png_file, sizes)}
+
+def list_drawings(source='DXF'):
+
+    ''' Drawing files of the source folder (DWG or DXF) of the plant in one directory walk '''
+
+    return scan_files('.\\' + source, ('.' + source.lower(),))
+
+# Stage functions, each one processes one drawing (the paths of drawing_paths) by the per-drawing function of its script, they
+# are module functions so the process workers can run them
+
+def init_render(memory_limit=None):
+    stage_script('png').render_worker_init(memory_limit)
+
+def convert_stage(item):
+
+    stage_script('dxf').convert_drawing(item['DWG'], os.path.dirname(item['DXF']) or '.')
+
+def render_stage(item, dpi=720, mode='L', backend='matplotlib', supersample=2):
+
+    stage_script('png').rasterize_drawing(item['DXF'], item['PNG'], dpi, mode, None, backend, supersample)
+
+def extract_stage(item, bbox_mode='path'):
+
+    # The content hash of the drawing is passed to the run manifest, so the DXF file is not hashed again
+    piping_df, _, digest = stage_script('csv').extract_drawing(item['DXF'], item['PNG'], bbox_mode)
+    piping_df.to_csv(item['CSV'])
+
+    return {item['DXF']: digest}
+
+def icdar_stage(item):
+
+    stage_script('icdar').icdar_drawing(item['CSV'], item['ICDAR'])
+
+def crop_stage(item, shards=None, lock=None):
+
+    # The shard writer is shared by the workers of the stage, so the crops of one drawing are written at a time
+    if shards is not None:
+        with lock:
+            stage_script('crop').crop_drawing(item['PNG'], item['ICDAR'], shards=shards)
+        return
+
+    stage_script('crop').crop_drawing(item['PNG'], item['ICDAR'], item['CropImage'])
+
+def parts_stage(item, shards=None, lock=None):
+
+    if shards is not None:
+        with lock:
+            stage_script('parts').crop6parts_drawing(item['PNG'], shards=shards)
+        return
+
+    stage_script('parts').crop6parts_drawing(item['PNG'], item['Crop6PartsImg'])
+
+def resize_stage(item, sizes, dpi=216, reducing_gap=None):
+
+    icdar_file = item['ICDAR'] if os.path.exists(item['ICDAR']) else None
+    stage_script('resize').resize_drawing(item['PNG'], icdar_file, item['Resized'], sizes, dpi, reducing_gap)
+
+def stage_files(stage, item):
+
+    ''' Inputs and outputs of the stage for one drawing, which are kept in the run manifest of the stage (the same files as
+    the manifest of the script) '''
+
+    raster_input = sidecar_path(item['PNG']) if os.path.exists(sidecar_path(item['PNG'])) else item['PNG']
+    icdar_inputs = [item['ICDAR']] if os.path.exists(item['ICDAR']) else []
+    resized = list(item['Resized'].values())
+    files = {'dxf': ([item['DWG']], [item['DXF']]),
+             'png': ([item['DXF']], [item['PNG'], sidecar_path(item['PNG'])]),
+             'csv': ([item['DXF'], raster_input], [item['CSV']]),
+             'icdar': ([item['CSV']], [item['ICDAR']]),
+             'crop': ([item['PNG'], item['ICDAR']], [item['CropImage']]),
+             'parts': ([item['PNG']], item['Crop6PartsImg']),
+             'resize': ([item['PNG']] + icdar_inputs, resized + [os.path.splitext(path)[0] + '.csv' for path in resized if icdar_inputs])}
+
+    return files[stage]
+
+class Stage:
+
+    ''' One stage of the pipeline: func(item) for each drawing on its own workers (threads, or processes with processes=True)
+
+    The drawing, which inputs and parameters are unchanged since the last run, is passed to the next stage without the work.
+    The stage, which writes into the tar shards (shards: ShardWriter), processes all drawings, since the shards are written
+    again as a whole. '''
+
+    def __init__(self, name, func, workers=1, processes=False, params=None, initializer=None, initargs=(), shards=None):
+
+        self.name = name
+        self.func = func
+        self.workers = max(int(workers), 1)
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.shards = shards
+        self.manifest = RunManifest('pipeline_' + name, params)
+        self.pool = None
+        self.done = 0
+        self.first_output = None
+
+    def run(self, item, force=False):
+
+        if self.shards is not None:
+            self.func(item)
+            return
+
+        # The manifest locks only its records and journal, so the inputs of the drawings are checked (stat and hash) in parallel
+        inputs, outputs = stage_files(self.name, item)
+        if (not force) and self.manifest.is_done(item['Drawing'], inputs, outputs):
+            return
+
+        # The stage function may return the content hashes of its inputs {filename: hash}, which are not hashed again
+        if self.pool is not None:
+            digests = self.pool.submit(self.func, item).result()
+        else:
+            digests = self.func(item)
+
+        self.manifest.record(item['Drawing'], inputs, outputs, digests=digests if isinstance(digests, dict) else None)
+
+class Pipeline:
+
+    ''' Run the drawings through the stages, which are connected by the bounded queues
+
+    Each stage starts on a drawing as soon as the previous stage has finished it, so the later stages work on the first sheets
+    while the earlier stages work on the next sheets. The queue size bounds the drawings waiting between two stages. A failed
+    drawing is reported, and it never reaches the later stages. '''
+
+    def __init__(self, stages, queue_size=4, force=False):
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self.force = force
+        self.failures = []
+        self._lock = threading.Lock()
+
+    def _worker(self, stage, inbox, outbox, remaining, start):
+
+        while True:
+            item = inbox.get()
+            if item is None:
+                # The last worker of the stage closes the next queue
+                inbox.put(None)
+                with self._lock:
+                    remaining[stage.name] -= 1
+                    if remaining[stage.name] == 0:
+                        outbox.put(None)
+                return
+
+            try:
+                stage.run(item, self.force)
+            except (Exception, SystemExit) as e:
+                with self._lock:
+                    self.failures.append(TaskFailure(item['Index'], (stage.name, item['Drawing']), f'{type(e).__name__}: {e}',
+                                                     traceback.format_exc()))
+                print(f'Failed drawing at {stage.name!r}:', item['Drawing'], f'{type(e).__name__}: {e}')
+                continue
+
+            with self._lock:
+                stage.done += 1
+                if stage.first_output is None:
+                    stage.first_output = time.perf_counter() - start
+            outbox.put(item)
+
+    def run(self, items):
+
+        ''' Run the items (the paths of the drawings) through all stages, and return the finished items in their order '''
+
+        start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        remaining = {stage.name: stage.workers for stage in self.stages}
+        threads = []
+
+        for stage, inbox, outbox in zip(self.stages, queues[:-1], queues[1:]):
+            if stage.processes:
+                stage.pool = ProcessPoolExecutor(max_workers=stage.workers, initializer=stage.initializer, initargs=stage.initargs)
+            elif stage.initializer is not None:
+                stage.initializer(*stage.initargs)
+            for _ in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(stage, inbox, outbox, remaining, start), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        # The feeder waits while the first queue is full, so the drawings enter the pipeline as the first stage takes them
+        def feed():
+            for index, item in enumerate(items):
+                queues[0].put(dict(item, Index=index))
+            queues[0].put(None)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        finished = []
+        while True:
+            item = queues[-1].get()
+            if item is None:
+                break
+            finished.append(item)
+
+        for thread in [feeder] + threads:
+            thread.join()
+        for stage in self.stages:
+            if stage.pool is not None:
+                stage.pool.shutdown()
+                stage.pool = None
+            if stage.shards is not None:
+                stage.shards.close()
+
+        self.makespan = time.perf_counter() - start
+
+        return sorted(finished, key=lambda item: item['Index'])
+
+    def report(self):
+
+        ''' Statistics of each stage: the finished drawings, the time to the first output and the run manifest '''
+
+        return pd.DataFrame([{'Stage': stage.name, 'Workers': stage.workers, 'Done': stage.done,
+                              'First Output (s)': stage.first_output, **stage.manifest.summary()} for stage in self.stages])
+
+def run_pipeline(name, stages=STAGES[1:], workers=None, queue_size=4, force=False, dpi=720, mode='L', backend='matplotlib',
+                 supersample=2, bbox_mode='path', resize_dpi=216, sizes=None, reducing_gap=None, shard_size=None, memory_limit=None):
+
+    ''' Run the drawings of the plant through the stages of the pipeline, each drawing flows to the next stage as soon as it is
+    finished, instead of waiting for the whole plant at each stage
+
+    stages: the stages in the flow order ('dxf', 'png', 'csv', 'icdar', 'crop', 'parts', 'resize'), the drawings are listed
+    from the DWG folder with the 'dxf' stage, otherwise from the DXF folder
+    workers: {stage: number of workers}, the defaults are STAGE_WORKERS
+    queue_size: maximum drawings waiting between two stages
+    sizes, reducing_gap: target sizes {label: (width, height)} of the resize stage, e.g. ResizeImagePID.RESIZE_SIZES_LM, and
+    the chained reduction (None is the plain resize, see ResizeImagePID.resize_pyramid)
+    shard_size: the crop and parts stages write into the tar shards of '.\\CropShards' (see CropTextPID.crop_text) '''
+
+    # Set working directory, which there is sub-folder name 'DWG' consists of *.dwg files
+    os.chdir(name)
+    reset_folders()
+
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if len(unknown) != 0:
+        sys.exit(f'Unknown stage(s): {unknown}, the stages are {STAGES}.')
+
+    workers = dict(STAGE_WORKERS, **(workers or {}))
+    sizes = {label: tuple(size) for label, size in (sizes or stage_script('resize').RESIZE_SIZES).items()}
+    funcs = {'dxf': (convert_stage, None),
+             'png': (partial(render_stage, dpi=dpi, mode=mode, backend=backend, supersample=supersample),
+                     {'dpi': dpi, 'mode': mode, 'backend': backend, 'supersample': supersample}),
+             'csv': (partial(extract_stage, bbox_mode=bbox_mode), {'bbox_mode': bbox_mode}),
+             'icdar': (icdar_stage, None),
+             'crop': (crop_stage, None),
+             'parts': (parts_stage, None),
+             'resize': (partial(resize_stage, sizes=sizes, dpi=resize_dpi, reducing_gap=reducing_gap),
+                        {'sizes': sizes, 'dpi': resize_dpi, 'resample': 1, 'reducing_gap': reducing_gap})}
+
+    # The rendering stage runs on the worker processes, which apply the memory limit where the system supports it
+    if 'png' in stages:
+        memory_limit = stage_script('png').check_memory_limit(memory_limit)
+
+    pipeline_stages = []
+    for stage in sorted(stages, key=STAGES.index):
+        func, params = funcs[stage]
+        initializer, initargs = (init_render, (memory_limit,)) if stage == 'png' else (None, ())
+
+        # The workers of the stage share one shard writer
+        shards = None
+        if shard_size and (stage in SHARD_STAGES):
+            shard_folder, prefix = SHARD_STAGES[stage]
+            shards = ShardWriter(shard_folder, prefix=prefix, shard_size=SHARD_SIZE if shard_size is True else int(shard_size))
+            func = partial(func, shards=shards, lock=threading.Lock())
+
+        pipeline_stages.append(Stage(stage, func, workers[stage], stage in PROCESS_STAGES, params, initializer, initargs, shards))
+
+    drawings = list_drawings('DWG' if 'dxf' in stages else 'DXF')
+    print(f'{len(drawings)} drawing(s) are flowing through the stages:', [stage.name for stage in pipeline_stages])
+
+    pipeline = Pipeline(pipeline_stages, queue_size, force)
+    finished = pipeline.run([drawing_paths(drawing, sizes, bool(shard_size)) for drawing in drawings])
+    for stage in pipeline_stages:
+        stage.manifest.compact()
+
+    print(pipeline.report().to_string(index=False))
+    if len(pipeline.failures) != 0:
+        print(f'{len(pipeline.failures)} drawing(s) failed:', [failure.task for failure in pipeline.failures])
+    print(f'Pipeline is now complete in {pipeline.makespan:.1f} s!!!')
+    gc.collect()
+
+    return finished, pipeline.failures
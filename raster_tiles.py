@@ -0,0 +1,131 @@
+import json
+import math
+import numpy as np
+import os
+from PIL import Image
+
+try:
+    import tifffile
+except ImportError: # The tiled TIFF is optional, the tile directory is always available
+    tifffile = None
+
+# Index file of the tile directory
+INDEX_FILE = 'index.json'
+
+def tile_grid(width, height, tile_size):
+
+    ''' Tiles of the sheet in the row-major order: (row, col, x, y, width, height) in pixels, the last row and column can be smaller '''
+
+    for row in range(math.ceil(height / tile_size)):
+        for col in range(math.ceil(width / tile_size)):
+            x, y = col * tile_size, row * tile_size
+            yield row, col, x, y, min(tile_size, width - x), min(tile_size, height - y)
+
+class TileDirectoryWriter:
+
+    ''' Write the tiles of one sheet into the tile directory as they are rendered, and then the index at the end
+
+    The index keeps the sheet size, the tile size, the image mode, the metadata of the rendering (e.g. the world-to-pixel affine)
+    and the file and pixel box of each tile. '''
+
+    def __init__(self, folder, size, tile_size, mode='L', metadata=None):
+
+        self.folder = folder
+        self.index = {'Size': list(size), 'Tile Size': tile_size, 'Mode': mode, 'Metadata': metadata or {}, 'Tiles': []}
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def write(self, row, col, x, y, img):
+
+        filename = f'r{row:03d}_c{col:03d}.png'
+        img.save(os.path.join(self.folder, filename))
+        self.index['Tiles'].append({'Row': row, 'Col': col, 'Box': [x, y, x + img.size[0], y + img.size[1]], 'File': filename})
+
+    def close(self):
+
+        # The index is written last, so the incomplete tile directory has no index
+        with open(os.path.join(self.folder, INDEX_FILE), 'w') as f:
+            json.dump(self.index, f)
+
+def write_tiled_tiff(path, size, tile_size, tiles, mode='L', metadata=None):
+
+    ''' Stream the tiles (row-major order, the images of tile_grid) into one tiled TIFF file, so the sheet is never held in memory '''
+
+    if tifffile is None:
+        raise ImportError('The tiled TIFF requires the tifffile package, use the tile directory instead.')
+
+    width, height = size
+
+    def segments():
+        # Each segment of the tiled TIFF has the full tile size, so the edge tiles are padded with white
+        for img in tiles:
+            tile = np.full((tile_size, tile_size), 255, dtype=np.uint8)
+            tile[:img.size[1], :img.size[0]] = np.asarray(img.convert('L'))
+            yield tile
+
+    description = json.dumps({'Size': [width, height], 'Tile Size': tile_size, 'Mode': mode, 'Metadata': metadata or {}})
+    with tifffile.TiffWriter(path) as tif:
+        tif.write(segments(), shape=(height, width), dtype=np.uint8, tile=(tile_size, tile_size),
+                  compression='zlib', description=description, metadata=None)
+
+def tile_info(path):
+
+    ''' Read the index of the tiled sheet (tile directory or tiled TIFF) without decoding any tile '''
+
+    if os.path.isdir(path):
+        with open(os.path.join(path, INDEX_FILE), 'r') as f:
+            return json.load(f)
+
+    if tifffile is None:
+        raise ImportError('The tiled TIFF requires the tifffile package.')
+
+    with tifffile.TiffFile(path) as tif:
+        return json.loads(tif.pages[0].description)
+
+def read_tile(path, row, col, info=None):
+
+    ''' Decode only one tile of the tiled sheet (tile directory or tiled TIFF) '''
+
+    info = info or tile_info(path)
+    tile_size = info['Tile Size']
+    width, height = info['Size']
+    x, y = col * tile_size, row * tile_size
+    if (x >= width) or (y >= height) or (row < 0) or (col < 0):
+        raise IndexError(f'There is no tile at row {row} and column {col}.')
+
+    if os.path.isdir(path):
+        with Image.open(os.path.join(path, f'r{row:03d}_c{col:03d}.png')) as img:
+            img.load()
+            return img
+
+    # Read the compressed segment of the tile, and then decode it
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages[0]
+        index = row * math.ceil(width / tile_size) + col
+        tif.filehandle.seek(page.dataoffsets[index])
+        data = tif.filehandle.read(page.databytecounts[index])
+        segment = page.decode(data, index)[0]
+
+    tile = np.asarray(segment).reshape(tile_size, tile_size)[:min(tile_size, height - y), :min(tile_size, width - x)]
+    img = Image.fromarray(np.ascontiguousarray(tile), 'L')
+
+    return img.convert('1', dither=0) if info['Mode'] == '1' else img
+
+def read_region(path, box, info=None):
+
+    ''' Read the pixel box (x0, y0, x1, y1) of the tiled sheet, only the tiles which overlap the box are decoded '''
+
+    info = info or tile_info(path)
+    tile_size = info['Tile Size']
+    width, height = info['Size']
+    x0, y0 = max(int(box[0]), 0), max(int(box[1]), 0)
+    x1, y1 = min(int(math.ceil(box[2])), width), min(int(math.ceil(box[3])), height)
+
+    region = Image.new('L', (max(x1 - x0, 0), max(y1 - y0, 0)), 255)
+    for row in range(y0 // tile_size, (y1 - 1) // tile_size + 1):
+        for col in range(x0 // tile_size, (x1 - 1) // tile_size + 1):
+            tile = read_tile(path, row, col, info).convert('L')
+            region.paste(tile, (col * tile_size - x0, row * tile_size - y0))
+
+    return region.convert('1', dither=0) if info['Mode'] == '1' else region
@@ -0,0 +1,172 @@
+import json
+import numpy as np
+import os
+from PIL import Image
+import regex as re
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Sidecar folder of the rasterized drawings, which mirrors the sub-folders of the raster folder (PNG, JPG, ..., TILES)
+SIDECAR_FOLDER = 'RasterMeta'
+RASTER_FOLDERS = ('PNG', 'JPG', 'JPEG', 'TIF', 'TIFF', 'TILES')
+
+# Rounding functions of the box coordinates at 3 decimals (the coordinate ratio of the drawing frame)
+ROUNDING = {'round': lambda v: np.round(v, 3),
+            'up': lambda v: np.ceil(v * 1000) / 1000,
+            'down': lambda v: np.floor(v * 1000) / 1000}
+
+def image_size(raster_file):
+
+    ''' Read the image size (width, height) from the file header, the pixels are never decoded '''
+
+    # The size of PNG file is kept in the IHDR chunk, which always comes first after the signature
+    with open(raster_file, 'rb') as f:
+        head = f.read(24)
+    if (head[:8] == PNG_SIGNATURE) and (head[12:16] == b'IHDR'):
+        return struct.unpack('>II', head[16:24])
+
+    # The other file types (*.jpg), PIL reads only the header until the pixels are accessed
+    with Image.open(raster_file) as img:
+        return img.size
+
+def translation_matrix(x: float, y: float) -> np.ndarray:
+    m = np.eye(3)
+    m[0, 2] = x
+    m[1, 2] = y
+    return m
+
+def scale_matrix(x: float, y: float) -> np.ndarray:
+    return np.diag((x, y, 1))
+
+def wcs_to_image_transform(image_size, xlim=(0.0, 1.0), ylim=(0.0, 1.0)) -> np.ndarray:
+
+    ''' Transform matrix from the data coordinate into the image pixel, the default limits are the same as a new matplotlib axes '''
+
+    x1, x2 = xlim
+    y1, y2 = ylim
+    data_width, data_height = x2 - x1, y2 - y1
+    image_width, image_height = image_size
+    # +1 to counteract the effect of the pixels being flipped in y
+    return (translation_matrix(0, image_height + 1) @
+            scale_matrix(image_width / data_width, -image_height / data_height) @
+            translation_matrix(-x1, -y1))
+
+def ratio_transform(frame_dim) -> np.ndarray:
+
+    ''' Transform matrix from the DXF coordinate into the coordinate ratio of the drawing frame '''
+
+    x0, y0 = frame_dim['Frame Originate'][:2]
+
+    return scale_matrix(1 / frame_dim['Frame Width'], 1 / frame_dim['Frame Height']) @ translation_matrix(-x0, -y0)
+
+def box_array(entities_df):
+
+    ''' Get the (N,4) array of the bounding boxes (LowLeft X, LowLeft Y, UpRight X, UpRight Y) from the dataframe '''
+
+    if entities_df.shape[0] == 0:
+        return np.zeros((0, 4))
+
+    lowleft = np.array([tuple(point)[:2] for point in entities_df['LowLeft']], dtype=float)
+    upright = np.array([tuple(point)[:2] for point in entities_df['UpRight']], dtype=float)
+
+    return np.hstack([lowleft, upright])
+
+def assign_boxes(entities_df, boxes):
+
+    ''' Put the (N,4) array of the bounding boxes back into the LowLeft and UpRight columns as (x, y) tuples '''
+
+    entities_df = entities_df.copy()
+    entities_df['LowLeft'] = list(zip(boxes[:, 0].tolist(), boxes[:, 1].tolist()))
+    entities_df['UpRight'] = list(zip(boxes[:, 2].tolist(), boxes[:, 3].tolist()))
+
+    return entities_df
+
+def transform_boxes(boxes, m):
+
+    ''' Apply the affine matrix to both corners of all bounding boxes as one (2N,3) matrix operation '''
+
+    points = boxes.reshape(-1, 2)
+    points = np.hstack([points, np.ones((points.shape[0], 1))]) @ m.T
+
+    return points[:, :2].reshape(-1, 4)
+
+def adjust_boxes(boxes, rotation, adjustments):
+
+    ''' Round and pad the bounding boxes of each text rotation
+
+    adjustments: {rotation: (rounding, padding)}, which rounding and padding have one item per box column (LowLeft X, LowLeft Y,
+    UpRight X, UpRight Y). The boxes of the other rotations are unchanged. '''
+
+    boxes = boxes.copy()
+    rotation = np.asarray(rotation, dtype=float)
+
+    for rot, (rounding, padding) in adjustments.items():
+        rows = rotation == rot
+        for col, (mode, pad) in enumerate(zip(rounding, padding)):
+            boxes[rows, col] = ROUNDING[mode](boxes[rows, col]) + pad
+
+    return boxes
+
+def sidecar_path(raster_file):
+
+    ''' Location of the sidecar file of the raster image (.\\PNG\\Area\\file.png -> .\\RasterMeta\\Area\\file.json) '''
+
+    raster_file = str(raster_file)
+    if raster_file.lower().endswith('.json'):
+        return raster_file
+
+    # Replace the last raster folder of the path, the separators are kept as they are
+    parts = re.split(r'([\\/])', os.path.splitext(raster_file)[0] + '.json')
+    folders = [i for i, part in enumerate(parts[:-1]) if part.upper() in RASTER_FOLDERS]
+    if len(folders) == 0:
+        return os.path.splitext(raster_file)[0] + '.json'
+    parts[folders[-1]] = SIDECAR_FOLDER
+
+    return ''.join(parts)
+
+def write_sidecar(raster_file, xlim, ylim, dpi, size=None):
+
+    ''' Write the sidecar file of the rendered image: the world-to-pixel affine, the image size, the dpi and the rendered frame '''
+
+    size = tuple(size) if size is not None else image_size(raster_file)
+    m = wcs_to_image_transform(size, xlim, ylim)
+    metadata = {'Image': os.path.basename(str(raster_file)), 'Size': list(size), 'DPI': dpi,
+                'Frame': [xlim[0], ylim[0], xlim[1], ylim[1]], 'Matrix': m.tolist()}
+
+    path = sidecar_path(raster_file)
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as f:
+        json.dump(metadata, f)
+
+    return path
+
+def read_sidecar(raster_file):
+
+    ''' Read the sidecar file of the raster image, None if the image was rendered without the sidecar '''
+
+    path = sidecar_path(raster_file)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        metadata = json.load(f)
+    metadata['Matrix'] = np.array(metadata['Matrix'], dtype=float)
+
+    return metadata
+
+def raster_transform(raster_file, frame_dim=None):
+
+    ''' Transform matrix from the coordinate ratio of the drawing frame into the image pixel
+
+    The affine of the sidecar file is used, so the pixels are never read. Without the sidecar, the image spans the drawing frame
+    exactly (the default axes of the rendering), and then only the image size is read from the file header. '''
+
+    metadata = read_sidecar(raster_file)
+    if (metadata is None) or (frame_dim is None):
+        return wcs_to_image_transform(image_size(raster_file))
+
+    # Coordinate ratio -> DXF coordinate -> image pixel
+    return metadata['Matrix'] @ np.linalg.inv(ratio_transform(frame_dim))
@@ -0,0 +1,200 @@
+import json
+import numpy as np
+import os
+import pandas as pd
+from urllib.parse import quote
+
+from drawing_catalogue import artefact_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError: # The result store is optional, the CSV files are always written
+    pa = None
+
+# Result store at the plant level (working directory), one dataset per extraction stage
+STORE_FOLDER = 'Results'
+
+# Schema metadata key of the point columns, which are split into the X and Y float columns
+POINT_COLUMNS_KEY = b'point_columns'
+
+# Point columns of the extraction results, which are always split (also for the drawing without any result)
+POINT_COLUMNS = ('LowLeft', 'UpRight', 'Line LowLeft', 'Line UpRight')
+
+# Numeric columns of the UHV and C3C5 results, the other columns of the drawing without any result are written as the texts
+NUMERIC_COLUMNS = {'Rotation': 'float64', 'Text Rotation': 'float64', 'Text X': 'float64', 'Text Y': 'float64',
+                   'Text Width': 'float64', 'Text Height': 'float64', 'LowerLeft X': 'float64', 'LowerLeft Y': 'float64',
+                   'UpperRight X': 'float64', 'UpperRight Y': 'float64', 'Line LowerLeft X': 'float64',
+                   'Line LowerLeft Y': 'float64', 'Line UpperRight X': 'float64', 'Line UpperRight Y': 'float64', 'Pair': 'int64'}
+
+def require_pyarrow():
+
+    if pa is None:
+        raise ImportError('The result store requires the pyarrow package, use the CSV files instead.')
+
+def split_points(df):
+
+    ''' Split the point columns ((x, y) tuples, e.g. LowLeft and UpRight) into the float columns '{column} X' and '{column} Y'
+
+    Return the dataframe and the names of the split columns. '''
+
+    df = df.copy()
+    point_columns = []
+
+    for column in list(df.columns):
+        values = df[column]
+        if (values.dtype != object) or ((len(values) == 0) and (column not in POINT_COLUMNS)):
+            continue
+        if not all(isinstance(value, (tuple, list, np.ndarray)) and len(value) >= 2 for value in values):
+            continue
+        points = np.array([tuple(value)[:2] for value in values], dtype=float).reshape(-1, 2)
+        position = df.columns.get_loc(column)
+        df = df.drop(columns=column)
+        df.insert(position, f'{column} X', points[:, 0])
+        df.insert(position + 1, f'{column} Y', points[:, 1])
+        point_columns.append(column)
+
+    return df, point_columns
+
+def join_points(df, point_columns):
+
+    ''' Join the float columns '{column} X' and '{column} Y' back into the (x, y) tuples of the point columns '''
+
+    for column in point_columns:
+        if (f'{column} X' not in df.columns) or (f'{column} Y' not in df.columns):
+            continue
+        position = df.columns.get_loc(f'{column} X')
+        points = list(zip(df[f'{column} X'].tolist(), df[f'{column} Y'].tolist()))
+        df = df.drop(columns=[f'{column} X', f'{column} Y'])
+        df.insert(position, column, points)
+
+    return df
+
+def to_table(df):
+
+    ''' Convert the result dataframe into the Arrow table: the points are float columns, and the texts are dictionary encoded '''
+
+    require_pyarrow()
+
+    df, point_columns = split_points(df.reset_index(drop=True))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    # The texts are repeated (e.g. the type, the pattern and the filename), so the dictionary encoding keeps one copy of each.
+    # The columns of the drawing without any result have no type, they are written with the types of the results (the numbers or
+    # the texts), so all drawings have the same schema
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            column_type = pa.type_for_alias(NUMERIC_COLUMNS.get(field.name, 'string'))
+            table = table.set_column(i, field.name, table.column(i).cast(column_type))
+            field = table.schema.field(i)
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            table = table.set_column(i, field.name, table.column(i).dictionary_encode())
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[POINT_COLUMNS_KEY] = json.dumps(point_columns).encode('utf-8')
+
+    return table.replace_schema_metadata(metadata)
+
+def partition_path(dataset, plant, drawing, folder=STORE_FOLDER):
+
+    ''' Folder of one drawing in the dataset: {folder}\\{dataset}\\Plant={plant}\\Drawing={drawing} (URI encoded values) '''
+
+    return os.path.join(folder, dataset, f'Plant={quote(str(plant), safe="")}', f'Drawing={quote(str(drawing), safe="")}')
+
+def result_file(dataset, plant, drawing, folder=STORE_FOLDER):
+
+    ''' Parquet file of one drawing in the dataset '''
+
+    return os.path.join(partition_path(dataset, plant, drawing, folder), 'part-0.parquet')
+
+def drawing_key(filename, root):
+
+    ''' Key of the drawing in the store: the sub-folders under the root folder (joined, as the CSV and PNG folders of the scripts)
+    and the drawing name, e.g. '.\\DXF\\Area\\Unit\\sheet0.dxf' and '.\\PNG\\AreaUnit\\sheet0.png' are both 'AreaUnit/sheet0' '''
+
+    _, folder, stem = artefact_key(filename, root)
+
+    return folder + '/' + stem if folder else stem
+
+def write_result(df, dataset, plant, drawing, folder=STORE_FOLDER):
+
+    ''' Write the result of one drawing into its partition, the last result of the drawing is replaced
+
+    The file is written into a temporary file, and then renamed, so the reader never sees an incomplete file. '''
+
+    table = to_table(df)
+    filename = result_file(dataset, plant, drawing, folder)
+    if not os.path.exists(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+
+    pq.write_table(table, filename + '.tmp', compression='zstd')
+    os.replace(filename + '.tmp', filename)
+
+    return filename
+
+def read_results(dataset, plant=None, drawing=None, columns=None, filter=None, points=True, folder=STORE_FOLDER):
+
+    ''' Read the results of the dataset into one dataframe, only the partitions of the plant and drawing (value or list) are read
+
+    columns selects the columns (the split point columns are '{column} X' and '{column} Y'), filter is the pyarrow expression of
+    the rows, e.g. ds.field('Type') == 'I'. points=True joins the point columns back into the (x, y) tuples. '''
+
+    require_pyarrow()
+
+    path = os.path.join(folder, dataset)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    fragments = list(dataset.get_fragments())
+    if len(fragments) == 0:
+        return pd.DataFrame()
+
+    # The schema of the dataset is unified from all drawings, not taken from the first one (e.g. an older file of an empty drawing)
+    schemas = [fragment.physical_schema for fragment in fragments]
+    schema = pa.unify_schemas(schemas + [dataset.partitioning.schema], promote_options='permissive')
+    dataset = ds.dataset(path, format='parquet', partitioning='hive', schema=schema)
+
+    # The partition filters prune the folders, so the other drawings are never opened
+    for key, value in (('Plant', plant), ('Drawing', drawing)):
+        if value is None:
+            continue
+        expression = ds.field(key).isin([str(v) for v in value]) if isinstance(value, (list, tuple, set)) else ds.field(key) == str(value)
+        filter = expression if filter is None else filter & expression
+
+    table = dataset.to_table(columns=columns, filter=filter)
+    df = table.to_pandas()
+
+    # The dictionary columns are read back as the categories
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) or (column in ('Plant', 'Drawing')):
+            df[column] = df[column].astype(object)
+
+    if points:
+        point_columns = []
+        for metadata in (schema.metadata for schema in schemas):
+            if metadata and (POINT_COLUMNS_KEY in metadata):
+                point_columns += [c for c in json.loads(metadata[POINT_COLUMNS_KEY].decode('utf-8')) if c not in point_columns]
+        df = join_points(df, point_columns)
+
+    return df
+
+def list_drawings(dataset, plant=None, folder=STORE_FOLDER):
+
+    ''' Drawings (plant, drawing) of the dataset, which are read from the partition folders only '''
+
+    require_pyarrow()
+
+    path = os.path.join(folder, dataset)
+    if not os.path.exists(path):
+        return []
+
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    drawings = []
+    for fragment in dataset.get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        if (plant is None) or (keys.get('Plant') == str(plant)):
+            drawings.append((keys.get('Plant'), keys.get('Drawing')))
+
+    return sorted(set(drawings))
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+
+# Journal folder of the run manifest at the plant level (working directory), one journal file per stage
+MANIFEST_FOLDER = os.path.join('Cache', 'manifest')
+
+def file_hash(filename, chunk_size=1 << 20):
+
+    ''' Calculate the content hash (SHA-1) of the file '''
+
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+def file_stat(filename):
+
+    ''' Size and modification time of the file, which are compared before the content is hashed again '''
+
+    stat = os.stat(filename)
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+class RunManifest:
+
+    ''' Incremental run manifest of one pipeline stage, which records the content hash of the inputs, the stage parameters and
+    the outputs of each item (drawing). The unchanged items are skipped on the next run, and an interrupted run resumes from
+    the last recorded item, because each record is appended to the journal as soon as the item is finished.
+
+    The manifest is shared by the worker threads of a stage: only the records, the counters and the journal are locked, the
+    input files are checked and hashed outside the lock. '''
+
+    def __init__(self, stage, params=None, folder=MANIFEST_FOLDER):
+
+        self.stage = stage
+        self.params = json.loads(json.dumps(params or {}, sort_keys=True, default=str))
+        self.path = os.path.join(folder, stage + '.jsonl')
+        self.records = {}
+        self.lock = threading.Lock()
+        self.hashed = {}
+        self.lines = 0
+        self.skipped = 0
+        self.processed = 0
+
+        # The last record of each item wins
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f:
+                    self.lines += 1
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError: # The last line of an interrupted run
+                        continue
+                    self.records[record['key']] = record
+
+    def input_hashes(self, inputs, previous=None, digests=None):
+
+        ''' Get the content hash and stat of each input file, the recorded hash is reused if the size and modification time are the same
+
+        digests: {filename: content hash} of the inputs, which were already hashed by the stage (e.g. frame_detection.drawing_hash).
+        The files hashed in this run are kept, so the input of is_done is not hashed again by record. '''
+
+        previous = previous or {}
+        digests = {str(filename): digest for filename, digest in (digests or {}).items()}
+        hashes = {}
+
+        for filename in inputs:
+            filename = str(filename)
+            stat = file_stat(filename)
+            known = previous.get(filename)
+            if (known is None) or (known['stat'] != stat):
+                known = self.hashed.get(filename)
+            if (known is not None) and (known['stat'] == stat):
+                hashes[filename] = known
+            elif filename in digests:
+                hashes[filename] = {'hash': digests[filename], 'stat': stat}
+            else:
+                hashes[filename] = {'hash': file_hash(filename), 'stat': stat}
+            self.hashed[filename] = hashes[filename]
+
+        return hashes
+
+    def is_done(self, key, inputs, outputs=()):
+
+        ''' Check whether if the item was already processed with the same input contents and parameters, and all outputs still exist '''
+
+        record = self.records.get(str(key))
+        if record is None:
+            return False
+
+        if (record['params'] != self.params) | (sorted(record['inputs']) != sorted(str(i) for i in inputs)):
+            return False
+
+        if not all(os.path.exists(str(output)) for output in list(outputs) + record['outputs']):
+            return False
+
+        hashes = self.input_hashes(inputs, record['inputs'])
+        if any(hashes[name]['hash'] != record['inputs'][name]['hash'] for name in hashes):
+            return False
+
+        # The content is unchanged (only touched), keep the new stat so the file is not hashed again
+        if hashes != record['inputs']:
+            self.append({'key': str(key), 'params': self.params, 'inputs': hashes, 'outputs': record['outputs']})
+
+        with self.lock:
+            self.skipped += 1
+
+        return True
+
+    def record(self, key, inputs, outputs=(), hashes=None, digests=None):
+
+        ''' Append the record of the finished item into the journal, digests are the known content hashes of the inputs (see input_hashes) '''
+
+        # The unchanged inputs of the last record (e.g. the forced run) are not hashed again
+        if hashes is None:
+            previous = self.records.get(str(key))
+            hashes = self.input_hashes(inputs, previous['inputs'] if previous is not None else None, digests)
+
+        record = {'key': str(key), 'params': self.params, 'inputs': hashes,
+                  'outputs': [str(output) for output in outputs]}
+        self.append(record)
+
+        with self.lock:
+            self.processed += 1
+
+    def append(self, record):
+
+        ''' Keep the record of the item, and append it into the journal '''
+
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        with self.lock:
+            self.records[record['key']] = record
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+            self.lines += 1
+
+    def compact(self):
+
+        ''' Rewrite the journal with only the last record of each item, which is called at the end of the run
+
+        The journal is kept as it is, if there is no older record of any item. '''
+
+        with self.lock:
+            if (not os.path.exists(self.path)) or (self.lines == len(self.records)):
+                return
+
+            with open(self.path + '.tmp', 'w') as f:
+                for record in self.records.values():
+                    f.write(json.dumps(record) + '\n')
+            os.replace(self.path + '.tmp', self.path)
+            self.lines = len(self.records)
+
+    def summary(self):
+        return {'Stage': self.stage, 'Processed': self.processed, 'Skipped': self.skipped}
@@ -0,0 +1,141 @@
+import numpy as np
+import os
+import pandas as pd
+from PIL import Image
+from raster_tiles import read_region, tile_info
+
+# Columns of the ICDAR file (the 4 corners of the box and the text)
+ICDAR_COLUMNS = ['tlx', 'tly', 'trx', 'try', 'brx', 'bry', 'blx', 'bly', 'text']
+
+# Policies of the boxes, which cross the window boundary
+BOX_POLICIES = ('drop', 'truncate')
+
+def window_starts(length, tile_size, stride):
+
+    ''' Start positions of the windows along one axis, the last window is snapped to the sheet edge so every window has the full size '''
+
+    if length <= tile_size:
+        return [0]
+
+    starts = list(range(0, length - tile_size + 1, stride))
+    if starts[-1] != length - tile_size:
+        starts.append(length - tile_size)
+
+    return starts
+
+def window_grid(width, height, tile_size, stride=None, overlap=0):
+
+    ''' Windows of the sheet in the row-major order: (row, col, x, y), the stride is the tile size minus the overlap by default '''
+
+    stride = int(stride or (tile_size - overlap))
+    if stride <= 0:
+        raise ValueError('The stride of the windows must be positive, the overlap must be smaller than the tile size.')
+
+    for row, y in enumerate(window_starts(height, tile_size, stride)):
+        for col, x in enumerate(window_starts(width, tile_size, stride)):
+            yield row, col, x, y
+
+def icdar_boxes(df):
+
+    ''' Get the (N,4) array of the pixel boxes (left, upper, right, lower) from the ICDAR dataframe '''
+
+    if df is None or df.shape[0] == 0:
+        return np.zeros((0, 4))
+
+    x = df[['tlx', 'trx', 'brx', 'blx']].to_numpy(dtype=float)
+    y = df[['tly', 'try', 'bry', 'bly']].to_numpy(dtype=float)
+
+    return np.column_stack([x.min(axis=1), y.min(axis=1), x.max(axis=1), y.max(axis=1)])
+
+def clip_boxes(boxes, window, policy='truncate', min_visibility=0.5):
+
+    ''' Clip and remap the boxes into the window (x0, y0, x1, y1) coordinates
+
+    policy='drop' keeps only the boxes inside the window, policy='truncate' cuts the boxes at the window boundary and keeps those
+    which at least min_visibility of the area is inside. Return the indices of the kept boxes and their boxes in the window. '''
+
+    if policy not in BOX_POLICIES:
+        raise ValueError(f'The box policy must be one of {BOX_POLICIES}.')
+
+    x0, y0, x1, y1 = window
+    clipped = np.column_stack([np.clip(boxes[:, 0], x0, x1), np.clip(boxes[:, 1], y0, y1),
+                               np.clip(boxes[:, 2], x0, x1), np.clip(boxes[:, 3], y0, y1)])
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    visible = np.maximum(clipped[:, 2] - clipped[:, 0], 0) * np.maximum(clipped[:, 3] - clipped[:, 1], 0)
+
+    if policy == 'drop':
+        keep = (area > 0) & np.all(clipped == boxes, axis=1)
+    else:
+        keep = (area > 0) & (visible > 0) & (visible >= min_visibility * area)
+
+    index = np.flatnonzero(keep)
+
+    return index, clipped[index] - (x0, y0, x0, y0)
+
+def icdar_frame(boxes, texts):
+
+    ''' ICDAR dataframe of the boxes (left, upper, right, lower) in the window '''
+
+    left, upper, right, lower = boxes.T if len(boxes) else np.zeros((4, 0))
+
+    return pd.DataFrame({'tlx': left, 'tly': upper, 'trx': right, 'try': upper, 'brx': right, 'bry': lower,
+                         'blx': left, 'bly': lower, 'text': list(texts)}, columns=ICDAR_COLUMNS)
+
+class SheetSource:
+
+    ''' Pixel source of one sheet: a raster image, which is decoded once, or a tiled sheet (tile directory or tiled TIFF) of
+    RasterizeDXF, which only the tiles under the window are decoded '''
+
+    def __init__(self, path):
+
+        self.path = path = str(path)
+        self.pixels = None
+        self.info = None
+
+        if os.path.isdir(path) or (path.lower().endswith(('.tif', '.tiff')) and self._is_tiled(path)):
+            self.info = tile_info(path)
+            self.size = tuple(self.info['Size'])
+        else:
+            with Image.open(path) as img:
+                self.pixels = np.asarray(img.convert('L') if img.mode not in ('1', 'L', 'RGB') else img)
+            self.size = (self.pixels.shape[1], self.pixels.shape[0])
+
+    @staticmethod
+    def _is_tiled(path):
+
+        try:
+            return 'Tile Size' in tile_info(path)
+        except Exception: # The plain TIFF image (or without tifffile)
+            return False
+
+    def window(self, x, y, tile_size, fill=255):
+
+        ''' Pixels of the window, the sheet smaller than the window is padded with the background '''
+
+        if self.info is not None:
+            pixels = np.asarray(read_region(self.path, (x, y, x + tile_size, y + tile_size), self.info).convert('L'))
+        else:
+            pixels = self.pixels[y:y + tile_size, x:x + tile_size]
+
+        if pixels.shape[:2] == (tile_size, tile_size):
+            return pixels
+
+        padded = np.full((tile_size, tile_size) + pixels.shape[2:], fill, dtype=pixels.dtype)
+        padded[:pixels.shape[0], :pixels.shape[1]] = pixels
+
+        return padded
+
+def tile_sheet(source, df=None, tile_size=1024, stride=None, overlap=0, policy='truncate', min_visibility=0.5):
+
+    ''' Stream the fixed size tiles of the sheet with their ICDAR boxes: (row, col, x, y, pixels, icdar dataframe)
+
+    source is the path or SheetSource of the sheet, df is the ICDAR dataframe of the sheet in pixels. Only one tile is made at
+    a time, so the memory is bounded by the sheet (or its tile under the window for the tiled sheet). '''
+
+    source = source if isinstance(source, SheetSource) else SheetSource(source)
+    boxes = icdar_boxes(df)
+    texts = df['text'].astype(str).to_numpy() if (df is not None) and (df.shape[0] != 0) else np.zeros(0, dtype=object)
+
+    for row, col, x, y in window_grid(source.size[0], source.size[1], tile_size, stride, overlap):
+        index, tile_boxes = clip_boxes(boxes, (x, y, x + tile_size, y + tile_size), policy, min_visibility)
+        yield row, col, x, y, source.window(x, y, tile_size), icdar_frame(tile_boxes, texts[index])
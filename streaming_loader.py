@@ -0,0 +1,208 @@
+import ezdxf
+import numpy as np
+from ezdxf.entities import factory
+from ezdxf.entities.subentity import entity_linker
+from ezdxf.filemanagement import dxf_file_info
+from ezdxf.lldxf.extendedtags import ExtendedTags
+from ezdxf.lldxf.tagger import ascii_tags_loader, tag_compiler
+from ezdxf.lldxf.validator import is_binary_dxf_file
+from ezdxf.query import EntityQuery
+
+# Entity types, which are needed by the extraction stages (texts, piping inserts and their attributes, and the frame geometry)
+EXTRACTION_TYPES = ('TEXT', 'INSERT', '3DFACE', 'LWPOLYLINE', 'LINE')
+
+# Entity types, which are reduced to the coordinate arrays while streaming (no entity is created), the LINE entities are needed
+# only by the fallback frame detection, which uses their horizontal segments
+SEGMENT_TYPES = ('LINE',)
+
+# Linked entities, which follow the main entity in the DXF file
+LINKED_TYPES = {'INSERT': ('ATTRIB', 'SEQEND'), 'POLYLINE': ('VERTEX', 'SEQEND')}
+
+def requested_types(types):
+
+    ''' Add the linked entity types (ATTRIB, VERTEX and SEQEND) of the requested entity types '''
+
+    requested = set(types)
+    for dxftype in types:
+        requested.update(LINKED_TYPES.get(dxftype, ()))
+
+    return requested
+
+def horizontal_segment(tags):
+
+    ''' Start and end point (x0, y0, x1, y1) of the LINE tags, None for the vertical or sloped line and the paper space line '''
+
+    start = end = (0.0, 0.0)
+    for tag in tags:
+        if tag.code == 10:
+            start = tag.value
+        elif tag.code == 11:
+            end = tag.value
+        elif (tag.code == 67) and (int(tag.value) == 1):
+            return None
+
+    if (end[1] - start[1]) != 0:
+        return None
+
+    return (start[0], start[1], end[0], end[1])
+
+class LazyBlocks:
+
+    ''' Blocks section of the streamed drawing, the block definition is created from the buffered raw tags only when it is referenced '''
+
+    def __init__(self, doc, raw_blocks):
+
+        self._doc = doc
+        self._blocks = doc.blocks
+        self._raw_blocks = raw_blocks
+
+    def _materialize(self, name):
+
+        raw = self._raw_blocks.pop(name, None)
+        if raw is None:
+            return
+
+        head = factory.load(ExtendedTags(raw[0]))
+        block = self._blocks.new(name, base_point=head.dxf.base_point, dxfattribs={'flags': head.dxf.get('flags', 0)})
+        linked = entity_linker()
+
+        for tags in raw[1:]:
+            entity = factory.load(ExtendedTags(tags))
+            if entity.dxftype() == 'ENDBLK':
+                continue
+            # The handles of the source file may collide with the handles of the streamed drawing
+            entity.dxf.handle = None
+            factory.bind(entity, self._doc)
+            if not linked(entity):
+                block.add_entity(entity)
+
+    def get(self, name, default=None):
+
+        if name in self._raw_blocks:
+            self._materialize(name)
+
+        return self._blocks.get(name, default)
+
+    def __getitem__(self, name):
+
+        if name in self._raw_blocks:
+            self._materialize(name)
+
+        return self._blocks[name]
+
+    def __contains__(self, name):
+        return (name in self._raw_blocks) or (name in self._blocks)
+
+    def __getattr__(self, name):
+        return getattr(self._blocks, name)
+
+class StreamedModelspace:
+
+    ''' Model space of the streamed drawing, which holds only the requested entity types
+
+    The LINE entities are kept only as the (N, 4) array of their horizontal segments (horizontal_lines), see frame_candidates. '''
+
+    def __init__(self, entities, horizontal_lines=None):
+        self.entities = entities
+        self.horizontal_lines = np.array(horizontal_lines if horizontal_lines is not None else [], dtype=float).reshape(-1, 4)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def query(self, query='*'):
+        return EntityQuery(self.entities, query)
+
+def stream_drawing(filename, types=EXTRACTION_TYPES, errors='surrogateescape'):
+
+    ''' Stream the DXF file in one pass, and keep only the model space entities of the requested types
+
+    The STYLE table is loaded into a new (empty) document, so the text fonts are resolved as the original drawing. The BLOCK
+    definitions are buffered as raw tags, and then each block is created only when it is referenced (the frame templates).
+    The LINE entities are read as the horizontal segments only (SEGMENT_TYPES), which saves one entity per line of the drawing.
+    Return the document and the streamed model space. '''
+
+    if is_binary_dxf_file(str(filename)):
+        raise IOError('The streaming loader supports only ASCII DXF files.')
+
+    info = dxf_file_info(str(filename))
+    doc = ezdxf.new(info.version if info.version >= 'AC1015' else 'R2000')
+    requested = requested_types(types)
+
+    section = None
+    prev = (-1, '')
+    tags = []
+    styles = []
+    raw_blocks = {}
+    block = None
+    entities = []
+    segments = []
+    linked = entity_linker()
+
+    def flush(tags):
+
+        ''' Process one finished entity (list of tags) of the current section '''
+
+        nonlocal block
+        dxftype = tags[0].value
+
+        if section == 'TABLES':
+            if dxftype == 'STYLE':
+                styles.append(factory.load(ExtendedTags(tags)))
+
+        elif section == 'BLOCKS':
+            if dxftype == 'BLOCK':
+                block = [tags]
+            elif block is not None:
+                block.append(tags)
+                if dxftype == 'ENDBLK':
+                    name = ExtendedTags(block[0]).get_subclass('AcDbBlockBegin').get_first_value(2)
+                    # The layout blocks are never referenced by an INSERT
+                    if name.upper() not in ('*MODEL_SPACE', '*PAPER_SPACE'):
+                        raw_blocks[name] = block
+                    block = None
+
+        elif section == 'ENTITIES':
+            if dxftype in SEGMENT_TYPES:
+                if dxftype in requested:
+                    segment = horizontal_segment(tags)
+                    if segment is not None:
+                        segments.append(segment)
+            elif dxftype in requested:
+                entity = factory.load(ExtendedTags(tags))
+                if (not linked(entity)) and (entity.dxf.get('paperspace', 0) == 0):
+                    entity.doc = doc
+                    entities.append(entity)
+                elif dxftype == 'ATTRIB':
+                    entity.doc = doc
+
+    with open(filename, mode='rt', encoding=info.encoding, errors=errors) as fp:
+        for tag in tag_compiler(ascii_tags_loader(fp)):
+            if tag.code == 0:
+                if (section is not None) and (len(tags) != 0) and (tags[0].value not in ('SECTION', 'TABLE', 'ENDTAB')):
+                    flush(tags)
+                tags = [tag]
+                if tag.value == 'ENDSEC':
+                    section = None
+                    tags = []
+            else:
+                tags.append(tag)
+                if (tag.code == 2) and (prev == (0, 'SECTION')):
+                    section = tag.value
+                    tags = []
+            prev = (tag.code, tag.value)
+
+    # Load the text styles, so the fonts of the texts are the same as the original drawing
+    for style in styles:
+        name = style.dxf.name
+        attribs = {key: style.dxf.get(key) for key in ('font', 'bigfont', 'width', 'height', 'oblique', 'flags') if style.dxf.hasattr(key)}
+        if doc.styles.has_entry(name):
+            doc.styles.get(name).update_dxf_attribs(attribs)
+        else:
+            doc.styles.new(name, dxfattribs=attribs)
+
+    doc.blocks = LazyBlocks(doc, raw_blocks)
+
+    return doc, StreamedModelspace(entities, segments)
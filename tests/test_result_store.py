@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('pyarrow')
+
+from result_store import drawing_key, read_results, result_file, write_result
+
+COLUMNS = ['ID', 'Name', 'Rotation', 'Type', 'Pattern', 'LowLeft', 'UpRight', 'Pair', 'Line Name']
+
+def drawing_result():
+
+    return pd.DataFrame({'ID': ['INSERT(#11D)', 'TEXT(#2A)'], 'Name': ['4"-HC-4000000-C1', '-C1'], 'Rotation': [0.0, 90.0],
+                         'Type': ['I', 'T'], 'Pattern': ['F', 'S1'], 'LowLeft': [(1.0, 2.0), (3.0, 4.0)],
+                         'UpRight': [(5.0, 6.0), (7.0, 8.0)], 'Pair': [-1, 0], 'Line Name': ['4"-HC-4000000-C1', '4"-HC-4000000-C1']})
+
+@pytest.mark.parametrize('drawing', [None, 'Area1/sheet1'])
+def test_empty_drawing_keeps_other_results(tmp_path, drawing):
+
+    folder = str(tmp_path / 'Results')
+    write_result(pd.DataFrame(columns=COLUMNS), 'uhv', 'Plant A', 'Area1/sheet0', folder=folder)
+    write_result(drawing_result(), 'uhv', 'Plant A', 'Area1/sheet1', folder=folder)
+
+    df = read_results('uhv', drawing=drawing, folder=folder)
+
+    assert df['ID'].tolist() == ['INSERT(#11D)', 'TEXT(#2A)']
+    assert df['Name'].tolist() == ['4"-HC-4000000-C1', '-C1']
+    assert df['LowLeft'].tolist() == [(1.0, 2.0), (3.0, 4.0)]
+    assert df['UpRight'].tolist() == [(5.0, 6.0), (7.0, 8.0)]
+    assert df['Drawing'].unique().tolist() == ['Area1/sheet1']
+
+def test_empty_drawing_reads_back_empty(tmp_path):
+
+    folder = str(tmp_path / 'Results')
+    write_result(pd.DataFrame(columns=COLUMNS), 'uhv', 'Plant A', 'Area1/sheet0', folder=folder)
+    write_result(drawing_result(), 'uhv', 'Plant A', 'Area1/sheet1', folder=folder)
+
+    df = read_results('uhv', drawing='Area1/sheet0', folder=folder)
+
+    assert df.shape[0] == 0
+    assert {'LowLeft', 'UpRight'} <= set(df.columns)
+
+def test_nested_drawing_shares_key_with_raster(tmp_path):
+
+    folder = str(tmp_path / 'Results')
+    dxf_file = os.path.join('DXF', 'Area1', 'Unit2', 'sheet1.dxf')
+    raster_file = os.path.join('PNG', 'Area1Unit2', 'sheet1.png')
+    write_result(drawing_result(), 'uhv', 'Plant A', drawing_key(dxf_file, 'DXF'), folder=folder)
+
+    assert drawing_key(dxf_file, 'DXF') == drawing_key(raster_file, 'PNG') == 'Area1Unit2/sheet1'
+    assert os.path.exists(result_file('uhv', 'Plant A', drawing_key(raster_file, 'PNG'), folder=folder))
+
+    df = read_results('uhv', 'Plant A', drawing_key(raster_file, 'PNG'), folder=folder)
+
+    assert df['Name'].tolist() == ['4"-HC-4000000-C1', '-C1']
+    assert df['Drawing'].unique().tolist() == ['Area1Unit2/sheet1']
@@ -0,0 +1,362 @@
+import ezdxf
+from ezdxf.addons import text2path
+from ezdxf.enums import TextEntityAlignment
+from ezdxf.math import BoundingBox, Matrix44
+from collections import OrderedDict
+import pandas as pd
+
+try:
+    from ezdxf.fonts import fonts
+except ImportError:
+    from ezdxf.tools import fonts
+
+# Bounding box modes: 'path' uses the outline paths of the glyphs (exact, the outlines and boxes are cached),
+# 'metric' calculates the box from the cached glyph metrics of the font (fast)
+BBOX_MODES = ('path', 'metric')
+
+# Alignment flags (halign, valign) of the text entity
+HALIGN = {'LEFT': 0, 'CENTER': 1, 'RIGHT': 2, 'MIDDLE': 4}
+VALIGN = {'BASELINE': 0, 'BOTTOM': 1, 'MIDDLE': 2, 'TOP': 3}
+
+class LRUCache:
+
+    ''' Least recently used cache with a size limit, and the hit, miss and eviction statistics '''
+
+    def __init__(self, maxsize=1024):
+
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+
+        if key in self.data:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+
+        self.data[key] = value
+        self.data.move_to_end(key)
+
+        # Evict the least recently used items
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+
+        self.maxsize = maxsize
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+
+        self.data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {'Size': len(self.data), 'Max Size': self.maxsize, 'Hits': self.hits, 'Misses': self.misses,
+                'Evictions': self.evictions}
+
+# Glyph outline paths at the cap height of 1 drawing unit, keyed by (glyph, font), the strings are composed from the glyphs
+outline_cache = LRUCache(maxsize=2048)
+
+# Unrotated text boxes, keyed by (string, font, height, width factor, alignment)
+bbox_cache = LRUCache(maxsize=65536)
+
+def configure_bbox_cache(outline_size=None, bbox_size=None):
+
+    ''' Set the size limits of the outline path cache and the text box cache '''
+
+    if outline_size is not None:
+        outline_cache.resize(outline_size)
+    if bbox_size is not None:
+        bbox_cache.resize(bbox_size)
+
+def bbox_cache_stats():
+
+    ''' Hit and miss statistics of the outline path cache and the text box cache '''
+
+    return {'Outline': outline_cache.stats(), 'BBox': bbox_cache.stats()}
+
+class FontMetrics:
+
+    ''' Glyph advance widths, glyph extents, ascent and descent of one font at the cap height of 1 drawing unit '''
+
+    def __init__(self, font_name):
+
+        self.font_name = font_name
+        self.font_face = fonts.get_font_face(font_name)
+        self.measurements = fonts.make_font(font_name, 1.0).measurements
+        self.font = text2path.get_font(self.font_face)
+        self.glyphs = {}
+        self.widths = {}
+        self.kerning = {}
+
+    def glyph(self, char):
+
+        ''' Advance width and ink extents (xmin, ymin, xmax, ymax) of the glyph, each glyph is rendered only one time per font '''
+
+        if char not in self.glyphs:
+            # The advance width is measured between two reference glyphs, so it is the same as the text path layout
+            advance = self._right_edge('I' + char + 'I') - self._right_edge('II')
+            extents = ezdxf.path.bbox(text2path.make_paths_from_str(char, self.font_face, size=1.0))
+            if extents.has_data:
+                self.glyphs[char] = (advance, extents.extmin.x, extents.extmin.y, extents.extmax.x, extents.extmax.y)
+            else: # White space
+                self.glyphs[char] = (advance, None, None, None, None)
+
+        return self.glyphs[char]
+
+    def _right_edge(self, text):
+        return ezdxf.path.bbox(text2path.make_paths_from_str(text, self.font_face, size=1.0)).extmax.x
+
+    def _text_length(self, text):
+
+        # The glyph cache of the TrueType font measures the white space too, the text width of the font strips it
+        glyph_cache = getattr(self.font, 'glyph_cache', None)
+        if glyph_cache is not None:
+            return glyph_cache.get_text_length(text, 1.0)
+
+        return self.font.text_width(text)
+
+    def pen_offsets(self, text):
+
+        ''' Horizontal offset of each glyph of the string, from the advance widths and the kerning pairs of the font (the same
+        layout as the text2path add-on), the widths and pairs are measured only one time per font '''
+
+        offsets = []
+        pen = 0.0
+        prev = ''
+
+        for char in text:
+            if char not in self.widths:
+                self.widths[char] = self._text_length(char)
+            if prev and ((prev, char) not in self.kerning):
+                self.kerning[(prev, char)] = self._text_length(prev + char) - self.widths[prev] - self.widths[char]
+            pen += self.kerning.get((prev, char), 0.0)
+            offsets.append(pen)
+            pen += self.widths[char]
+            prev = char
+
+        return offsets
+
+    def string_extents(self, text):
+
+        ''' Ink extents of the string at the baseline-left insertion point (0, 0) '''
+
+        pen = 0.0
+        xmin = ymin = float('inf')
+        xmax = ymax = float('-inf')
+
+        for char in text:
+            advance, gxmin, gymin, gxmax, gymax = self.glyph(char)
+            if gxmin is not None:
+                xmin = min(xmin, pen + gxmin)
+                ymin = min(ymin, gymin)
+                xmax = max(xmax, pen + gxmax)
+                ymax = max(ymax, gymax)
+            pen += advance
+
+        if xmin > xmax:
+            return None
+
+        return xmin, ymin, xmax, ymax
+
+# Font metrics are loaded one time per font
+_font_metrics = {}
+
+def get_font_metrics(font_name):
+
+    ''' Get the cached font metrics of the font '''
+
+    if font_name not in _font_metrics:
+        _font_metrics[font_name] = FontMetrics(font_name)
+
+    return _font_metrics[font_name]
+
+def alignment_shift(measurements, extents, align):
+
+    ''' Shift (x, y) of the baseline-left text box into the text alignment, same rules as the text2path add-on '''
+
+    halign = HALIGN.get(align.name.split('_')[-1], 0)
+    valign = VALIGN.get(align.name.split('_')[0], 0)
+    xmin, ymin, xmax, ymax = extents
+
+    if halign == 0:
+        shift_x = 0.0
+    elif halign == 2:
+        shift_x = -xmax
+    else:
+        shift_x = -(xmin + xmax) / 2
+
+    cap_height = measurements.cap_height
+    if halign == 4: # MIDDLE
+        shift_y = -cap_height + measurements.total_height / 2
+    elif valign == 3:
+        shift_y = -cap_height
+    elif valign == 2:
+        shift_y = -cap_height / 2
+    elif valign == 1:
+        shift_y = measurements.descender_height
+    else:
+        shift_y = 0.0
+
+    return shift_x, shift_y
+
+def local_extents(entity):
+
+    ''' Unrotated text box of the entity in the drawing unit, aligned about the insertion point, None if the alignment is not supported '''
+
+    align = entity.get_align_enum()
+    if align in (TextEntityAlignment.ALIGNED, TextEntityAlignment.FIT):
+        return None
+
+    metrics = get_font_metrics(entity.font_name())
+    extents = metrics.string_extents(entity.plain_text())
+    if extents is None:
+        return None
+
+    shift_x, shift_y = alignment_shift(metrics.measurements, extents, align)
+    size = entity.dxf.height
+    xmin, ymin, xmax, ymax = extents
+
+    return (xmin + shift_x) * size, (ymin + shift_y) * size, (xmax + shift_x) * size, (ymax + shift_y) * size
+
+def place_extents(entity, extents):
+
+    ''' Transform the unrotated text box with the width factor, rotation and insertion point of the entity '''
+
+    xmin, ymin, xmax, ymax = extents
+    m = entity.wcs_transformation_matrix()
+    corners = m.transform_vertices([(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)])
+
+    return BoundingBox(corners)
+
+def exact_path_bbox(entity):
+
+    ''' Exact bounding box of the text from the outline paths of all glyphs, without the cache '''
+
+    return ezdxf.path.bbox(text2path.make_paths_from_entity(entity))
+
+def glyph_paths(char, font_name):
+
+    ''' Outline paths of the glyph at the cap height of 1 drawing unit and the pen position 0 from the LRU cache '''
+
+    key = (char, font_name)
+    paths = outline_cache.get(key)
+    if paths is None:
+        paths = text2path.make_paths_from_str(char, get_font_metrics(font_name).font_face, size=1.0)
+        outline_cache.put(key, paths)
+
+    return paths
+
+def outline_paths(text, font_name):
+
+    ''' Outline paths of the string at the cap height of 1 drawing unit, the cached glyph paths are moved to their pen offsets '''
+
+    metrics = get_font_metrics(font_name)
+    paths = []
+
+    for char, offset in zip(text, metrics.pen_offsets(text)):
+        glyph = glyph_paths(char, font_name)
+        if offset == 0:
+            paths.extend(glyph)
+        else:
+            m = Matrix44.translate(offset, 0, 0)
+            paths.extend(p.transform(m) for p in glyph)
+
+    return paths
+
+def outline_transform(entity):
+
+    ''' Matrix from the unit outline paths into the unrotated and aligned text at the text height, same as the text2path add-on '''
+
+    font_name = entity.font_name()
+    paths = outline_paths(entity.plain_text(), font_name)
+    if len(paths) == 0:
+        return paths, None
+
+    # Alignment is calculated from the control point box (fast) as the text2path add-on
+    fast = ezdxf.path.bbox(paths, fast=True)
+    extents = (fast.extmin.x, fast.extmin.y, fast.extmax.x, fast.extmax.y)
+    shift_x, shift_y = alignment_shift(get_font_metrics(font_name).measurements, extents, entity.get_align_enum())
+    size = entity.dxf.height
+
+    return paths, Matrix44.translate(shift_x, shift_y, 0) * Matrix44.scale(size, size, 1)
+
+def path_bbox(entity):
+
+    ''' Exact bounding box of the text from the outline paths, the outlines and the unrotated boxes are cached '''
+
+    align = entity.get_align_enum()
+    rotation = entity.dxf.rotation % 90
+    is_orthogonal = (rotation == 0) & (entity.dxf.oblique == 0)
+    if align in (TextEntityAlignment.ALIGNED, TextEntityAlignment.FIT):
+        return exact_path_bbox(entity)
+
+    key = (entity.plain_text(), entity.font_name(), entity.dxf.height, entity.dxf.width, align)
+    extents = bbox_cache.get(key) if is_orthogonal else None
+
+    if extents is None:
+        paths, m = outline_transform(entity)
+        if m is None:
+            return BoundingBox()
+
+        # The text box of the other rotations is calculated from the transformed paths to keep the exact result
+        if not is_orthogonal:
+            m = m * entity.wcs_transformation_matrix()
+            return ezdxf.path.bbox([p.transform(m) for p in paths])
+
+        unrotated = ezdxf.path.bbox([p.transform(m) for p in paths])
+        extents = (unrotated.extmin.x, unrotated.extmin.y, unrotated.extmax.x, unrotated.extmax.y)
+        bbox_cache.put(key, extents)
+
+    return place_extents(entity, extents)
+
+def metric_bbox(entity):
+
+    ''' Bounding box of the text from the font metrics, the exact path is used for the ALIGNED and FIT alignments '''
+
+    extents = local_extents(entity)
+    if extents is None:
+        return path_bbox(entity)
+
+    return place_extents(entity, extents)
+
+def text_bbox(entity, mode='path'):
+
+    ''' Calculate the bounding box of the TEXT or ATTRIB entity with the given mode ('path' or 'metric') '''
+
+    if mode == 'path':
+        return path_bbox(entity)
+    elif mode == 'metric':
+        return metric_bbox(entity)
+    else:
+        raise ValueError(f'Unknown bounding box mode {mode!r}, the mode must be one of {BBOX_MODES}.')
+
+def validate_text_bbox(entities):
+
+    ''' Validation mode, report the deviation of the font-metric bounding box from text2path for each entity '''
+
+    rows = []
+    for e in entities:
+        exact = exact_path_bbox(e)
+        fast = metric_bbox(e)
+        if not (exact.has_data and fast.has_data):
+            continue
+        deviation = [fast.extmin.x - exact.extmin.x, fast.extmin.y - exact.extmin.y,
+                     fast.extmax.x - exact.extmax.x, fast.extmax.y - exact.extmax.y]
+        rows.append([e.dxf.handle, e.dxf.text, e.dxf.height] + deviation + [max(abs(d) for d in deviation) / e.dxf.height])
+
+    report = pd.DataFrame(rows, columns=['Handle','Text','Height','LowLeft X','LowLeft Y','UpRight X','UpRight Y','Relative Deviation'])
+
+    return report